@@ -0,0 +1,1085 @@
+#!/usr/bin/env python3
+"""
+Benchmarks del Helmet Detector
+Mide el rendimiento de las etapas críticas sin necesidad de cámara
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+import subprocess
+import http.client
+import multiprocessing
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from helmet_detector import (
+    HelmetDetector, HelmetColorEngine, MetricsRegistry, PreviewStreamer,
+    FrameRing, MotionGate, StatusHysteresis, UIUpdateScheduler, EventLog, EventStore,
+    ViolationRecorder, SharedMemoryDetectorService, box_iou,
+    DEFAULT_HELMET_PALETTE, MODEL_REGISTRY
+)
+from helmet_server import DetectionServer
+
+
+def print_step(message):
+    """Imprimir encabezado de benchmark"""
+    print(f"\n⏱️ {message}")
+    print("-" * 50)
+
+
+def time_call(func, repeat=50, warmup=5):
+    """Medir tiempo medio (ms) de una función"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    samples.sort()
+    return {
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def make_detector_stub():
+    """Crear HelmetDetector sin cargar modelo ni logs, con clases COCO sintéticas"""
+    detector = HelmetDetector(load_model=False)
+    detector.classes = [f"class_{i}" for i in range(80)]
+    detector.classes[0] = "person"
+    detector.target_class_ids = np.array([0], dtype=np.int64)
+    detector.metrics = MetricsRegistry()
+    detector.use_tracking = False
+    detector.use_motion_gate = False
+    detector.cache_per_roi = False
+    return detector
+
+
+def make_yolo_outputs(input_size=416, num_classes=80, positives=30, seed=0):
+    """Generar salidas sintéticas con la forma de las tres capas YOLOv3"""
+    rng = np.random.default_rng(seed)
+    outs = []
+    for stride in (32, 16, 8):
+        cells = (input_size // stride) ** 2 * 3
+        out = rng.random((cells, 5 + num_classes), dtype=np.float32) * 0.3
+        outs.append(out)
+    # Insertar algunas detecciones positivas de persona
+    for i in range(positives):
+        out = outs[i % len(outs)]
+        row = rng.integers(0, out.shape[0])
+        out[row, 0:2] = rng.random(2) * 0.8 + 0.1
+        out[row, 2:4] = rng.random(2) * 0.2 + 0.05
+        out[row, 5] = 0.6 + 0.4 * rng.random()
+    return outs
+
+
+def make_scene(width, height, persons, seed=0):
+    """Generar escena sintética con personas (con y sin casco)"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(40, 90, (height, width, 3), dtype=np.uint8)
+    boxes = []
+    for i in range(persons):
+        w = int(width * rng.uniform(0.05, 0.12))
+        h = int(w * 2.5)
+        x = int(rng.integers(0, max(1, width - w)))
+        y = int(rng.integers(0, max(1, height - h)))
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (90, 60, 40), -1)
+        # La mitad de las personas lleva casco amarillo
+        if i % 2 == 0:
+            cv2.rectangle(frame, (x, y), (x + w, y + h // 6), (0, 220, 255), -1)
+        boxes.append([x, y, w, h])
+    return frame, boxes
+
+
+def make_clip(width=640, height=480, frames=60, persons=3, seed=0):
+    """Generar clip corto sintético con personas en movimiento"""
+    base, boxes = make_scene(width, height, persons, seed)
+    clip = []
+    for t in range(frames):
+        frame = np.roll(base, shift=(t * 4) % width, axis=1)
+        clip.append(frame)
+    return clip
+
+
+def decode_yolo_outputs_loop(detector, outs, width, height):
+    """Decodificador original fila por fila (referencia)"""
+    class_ids = []
+    confidences = []
+    boxes = []
+    for out in outs:
+        for detection in out:
+            scores = detection[5:]
+            class_id = np.argmax(scores)
+            confidence = scores[class_id]
+            if confidence > detector.confidence_threshold:
+                center_x = int(detection[0] * width)
+                center_y = int(detection[1] * height)
+                w = int(detection[2] * width)
+                h = int(detection[3] * height)
+                x = int(center_x - w / 2)
+                y = int(center_y - h / 2)
+                boxes.append([x, y, w, h])
+                confidences.append(float(confidence))
+                class_ids.append(class_id)
+    return boxes, confidences, class_ids
+
+
+def bench_decode(repeat):
+    """Comparar decodificación en bucle contra vectorizada"""
+    print_step("Decodificación de salidas YOLO (640x480, entrada 416)")
+    detector = make_detector_stub()
+    outs = make_yolo_outputs()
+
+    loop = time_call(lambda: decode_yolo_outputs_loop(detector, outs, 640, 480), repeat)
+    vectorized = time_call(lambda: detector.decode_yolo_outputs(outs, 640, 480), repeat)
+
+    print(f"Bucle Python:  {loop['mean_ms']:8.3f} ms (p99 {loop['p99_ms']:.3f} ms)")
+    print(f"Vectorizado:   {vectorized['mean_ms']:8.3f} ms (p99 {vectorized['p99_ms']:.3f} ms)")
+    print(f"Aceleración:   {loop['mean_ms'] / vectorized['mean_ms']:8.1f}x")
+    return {"decode_loop": loop, "decode_vectorized": vectorized}
+
+
+def analyze_helmet_region_inrange(region, ratio=0.25):
+    """Análisis de color original con tres pasadas inRange (referencia)"""
+    hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+    total_pixels = region.shape[0] * region.shape[1]
+    for lower, upper in DEFAULT_HELMET_PALETTE.values():
+        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        if cv2.countNonZero(mask) > total_pixels * ratio:
+            return True
+    return False
+
+
+def bench_color(repeat):
+    """Comparar el análisis de color original contra HelmetColorEngine por tamaño de región"""
+    print_step("Análisis de color de casco por tamaño de región")
+    rng = np.random.default_rng(0)
+    engine = HelmetColorEngine()
+    results = {}
+
+    for height, width in [(40, 60), (120, 160), (300, 200)]:
+        region = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+        inrange = time_call(lambda: analyze_helmet_region_inrange(region), repeat)
+        engine_time = time_call(lambda: engine.has_helmet_color(region, 0.25), repeat)
+        print(f"{width}x{height}: inRange original {inrange['mean_ms']:7.3f} ms | "
+              f"motor de color {engine_time['mean_ms']:7.3f} ms")
+        results[f"color_inrange_{width}x{height}"] = inrange
+        results[f"color_engine_{width}x{height}"] = engine_time
+    return results
+
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+PERSON_COUNTS = [0, 5, 20]
+
+
+def bench_stages(repeat):
+    """Medir cada etapa del camino crítico por resolución y número de personas"""
+    detector = HelmetDetector()
+    has_model = detector.net is not None
+    stub = make_detector_stub()
+    results = {}
+
+    for width, height in RESOLUTIONS:
+        for persons in PERSON_COUNTS:
+            print_step(f"Etapas {width}x{height}, {persons} personas")
+            frame, boxes = make_scene(width, height, persons)
+            key = f"{width}x{height}_p{persons}"
+            stages = {}
+
+            stages["blob"] = time_call(lambda: cv2.dnn.blobFromImage(
+                frame, 0.00392, (416, 416), (0, 0, 0), True, crop=False), repeat)
+            if has_model:
+                blob = cv2.dnn.blobFromImage(frame, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
+
+                def forward():
+                    detector.net.setInput(blob)
+                    return detector.net.forward(detector.output_layers)
+                stages["forward"] = time_call(forward, max(3, repeat // 5), warmup=1)
+
+            outs = make_yolo_outputs(positives=max(persons, 1) * 3, seed=persons)
+            stages["decode"] = time_call(lambda: stub.decode_yolo_outputs(outs, width, height), repeat)
+            decoded_boxes, confidences, _ = stub.decode_yolo_outputs(outs, width, height)
+            stages["nms"] = time_call(lambda: cv2.dnn.NMSBoxes(
+                decoded_boxes.tolist(), confidences.tolist(), 0.5, 0.4), repeat)
+
+            def analyze_all():
+                for x, y, w, h in boxes:
+                    detector.analyze_helmet_region(frame[max(0, y - 20):y + h // 3, x:x + w])
+            stages["analyze_helmet_region"] = time_call(analyze_all, repeat)
+            stages["haar_fallback"] = time_call(lambda: detector.detect_helmet_basic(frame.copy()),
+                                                max(3, repeat // 5), warmup=1)
+
+            resized = cv2.resize(frame, (400, 300))
+            stages["resize"] = time_call(lambda: cv2.resize(frame, (400, 300)), repeat)
+
+            pil_image = Image.fromarray(cv2.cvtColor(resized, cv2.COLOR_BGR2RGB))
+
+            def jpeg_encode():
+                buffer = io.BytesIO()
+                pil_image.save(buffer, format='JPEG', quality=85)
+                return buffer.getvalue()
+            stages["pil_jpeg"] = time_call(jpeg_encode, repeat)
+            jpeg = jpeg_encode()
+            stages["base64"] = time_call(lambda: base64.b64encode(jpeg).decode(), repeat)
+
+            for name, timing in stages.items():
+                print(f"{name:24s} {timing['mean_ms']:9.3f} ms (p99 {timing['p99_ms']:.3f} ms)")
+            results.update({f"stages/{key}/{name}": timing for name, timing in stages.items()})
+    return results
+
+
+def bench_clip(repeat):
+    """Medir process_frame completo sobre un clip corto sintético"""
+    print_step("Clip sintético 640x480 (60 frames)")
+    detector = HelmetDetector()
+    detector.use_motion_gate = False
+    clip = make_clip()
+
+    def run_clip():
+        for frame in clip:
+            detector.process_frame(frame.copy())
+    timing = time_call(run_clip, max(3, repeat // 10), warmup=1)
+    fps = len(clip) / (timing["mean_ms"] / 1000.0)
+    print(f"Clip completo: {timing['mean_ms']:.1f} ms ({fps:.1f} FPS)")
+    return {"clip/process_frame": timing}
+
+
+def bench_tracking(repeat):
+    """Comparar análisis por caja contra análisis por track en multitudes"""
+    print_step("Seguimiento: análisis de casco por caja vs por track (1280x720)")
+    detector = make_detector_stub()
+    results = {}
+    for persons in (5, 20, 50):
+        frame, boxes = make_scene(1280, 720, persons, seed=persons)
+        boxes = np.array(boxes, dtype=np.int32)
+        class_ids = np.zeros(len(boxes), dtype=np.int64)
+        confidences = np.full(len(boxes), 0.9, dtype=np.float32)
+        rng = np.random.default_rng(persons)
+        # Secuencia de cajas con pequeño temblor, como en un video real
+        sequence = [boxes + rng.integers(-3, 4, boxes.shape) for _ in range(30)]
+
+        def per_box():
+            for frame_boxes in sequence:
+                detector.classify_boxes(frame, frame_boxes, class_ids, confidences)
+
+        def per_track():
+            detector.reset_state()
+            for frame_boxes in sequence:
+                detector.classify_tracks(frame, frame_boxes)
+
+        box_timing = time_call(per_box, max(3, repeat // 10), warmup=1)
+        track_timing = time_call(per_track, max(3, repeat // 10), warmup=1)
+        print(f"{persons:2d} personas | por caja: {box_timing['mean_ms'] / 30:7.3f} ms/frame | "
+              f"por track: {track_timing['mean_ms'] / 30:7.3f} ms/frame")
+        results[f"tracking/p{persons}/per_box_x30"] = box_timing
+        results[f"tracking/p{persons}/per_track_x30"] = track_timing
+    return results
+
+
+# Clasificador CNN de cabezas para el benchmark heads (opción --head-model)
+HEAD_MODEL = None
+
+
+def bench_heads(repeat):
+    """Latencia por persona de la decisión de casco: heurística de color contra CNN por lotes"""
+    print_step("Clasificación de casco por persona (1280x720)")
+    detector = make_detector_stub()
+    classifier = detector.load_head_classifier(HEAD_MODEL) if HEAD_MODEL else None
+    if classifier is None:
+        print("ℹ️ Sin --head-model solo se mide la heurística de color")
+    results = {}
+    for persons in (1, 10, 50):
+        frame, boxes = make_scene(1280, 720, persons, seed=persons)
+        regions = [detector.head_region(frame, box) for box in boxes]
+        detector.head_classifier = None
+        heuristic = time_call(lambda: detector.classify_helmet_regions(regions), repeat)
+        line = f"{persons:2d} personas | color: {heuristic['mean_ms'] / persons:7.3f} ms/persona"
+        results[f"heads/p{persons}/color"] = heuristic
+        if classifier is not None:
+            detector.head_classifier = classifier
+            cnn = time_call(lambda: detector.classify_helmet_regions(regions), repeat)
+            line += f" | CNN por lotes: {cnn['mean_ms'] / persons:7.3f} ms/persona ({cnn['mean_ms']:.2f} ms/frame)"
+            results[f"heads/p{persons}/cnn"] = cnn
+        print(line)
+    return results
+
+
+def bench_metrics(repeat):
+    """Medir el costo de la instrumentación por frame"""
+    print_step("Sobrecarga de métricas (por frame, 16 cámaras)")
+    registry = MetricsRegistry()
+    cameras = [f"cam{i}" for i in range(16)]
+    state = {"i": 0}
+
+    def instrument_frame():
+        # Operaciones que el pipeline registra para cada frame procesado
+        camera = cameras[state["i"] % len(cameras)]
+        state["i"] += 1
+        for name in ("capture", "inference", "postprocess", "ui_push"):
+            registry.observe(name, camera, 0.012)
+        for name in ("captured", "processed", "people", "violations"):
+            registry.inc(name, camera)
+
+    per_frame = time_call(lambda: [instrument_frame() for _ in range(1000)], max(5, repeat // 5))
+    per_frame_us = per_frame["mean_ms"]  # 1000 frames -> ms equivale a µs por frame
+    render = time_call(registry.render, max(5, repeat // 5))
+
+    print(f"Instrumentación por frame: {per_frame_us:8.2f} µs "
+          f"({per_frame_us / 33333.0:.3%} de un frame a 30 FPS)")
+    print(f"Render /metrics:           {render['mean_ms']:8.3f} ms")
+    return {"metrics/per_frame_x1000": per_frame, "metrics/render": render}
+
+
+def preview_pil_base64(frame):
+    """Vista previa original: PIL + JPEG + base64 en cada frame (referencia)"""
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    image = Image.fromarray(rgb).resize((400, 300))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def bench_preview(repeat):
+    """Comparar la vista previa PIL + base64 contra la codificación con cv2 y buffers reutilizados"""
+    print_step("Vista previa (frame 1280x720)")
+    frame, _ = make_scene(1280, 720, 3)
+    streamer = PreviewStreamer(max_fps=1e9, port=None)
+    streamer.add_viewer("bench")
+
+    old = time_call(lambda: preview_pil_base64(frame), repeat)
+    new = time_call(lambda: streamer.publish(frame), repeat)
+    streamer.remove_viewer("bench")
+    idle = time_call(lambda: streamer.publish(frame), repeat)
+    payload = len(preview_pil_base64(frame))
+
+    print(f"PIL + base64:          {old['mean_ms']:8.3f} ms ({payload} bytes por mensaje)")
+    print(f"cv2.imencode:          {new['mean_ms']:8.3f} ms ({len(streamer.jpeg)} bytes binarios)")
+    print(f"Sin espectadores:      {idle['mean_ms']:8.3f} ms")
+    return {"preview/pil_base64": old, "preview/imencode": new, "preview/no_viewers": idle}
+
+
+class CountingPage:
+    """Página Flet simulada que cuenta envíos y tarda lo indicado en cada uno"""
+
+    def __init__(self, push_ms=0.0):
+        self.push_ms = push_ms
+        self.updates = 0
+
+    def update(self, *controls):
+        self.updates += 1
+        time.sleep(self.push_ms / 1000.0)
+
+
+def bench_ui(repeat, frames=300, camera_fps=30.0, ui_fps=15.0):
+    """Contar envíos a la interfaz con clasificación parpadeante: directo contra agrupado"""
+    print_step(f"Actualizaciones de interfaz ({frames} frames a {camera_fps:.0f} FPS, 20% de parpadeo)")
+    rng = np.random.default_rng(0)
+    # Casco presente con un 20% de frames mal clasificados al azar
+    detections = rng.random(frames) > 0.2
+    view, status = object(), object()
+
+    def run(push_ms):
+        page = CountingPage(push_ms)
+        # Los ticks se simulan con flush(); el tick de 2 ms solo fija el umbral de atraso
+        ui = UIUpdateScheduler(page, 500.0)
+        hysteresis = StatusHysteresis(3)
+        last = None
+        ticks_per_frame = ui_fps / camera_fps
+        next_tick = 0.0
+        for i, detected in enumerate(detections):
+            stable = hysteresis.update(bool(detected))
+            if stable != last:
+                last = stable
+                ui.request(status)
+            ui.request(view, droppable=True)
+            next_tick += ticks_per_frame
+            if next_tick >= 1.0:
+                next_tick -= 1.0
+                ui.flush()
+        ui.flush()
+        return ui.stats()
+
+    flips = int(np.count_nonzero(detections[1:] != detections[:-1]))
+    direct = frames + flips  # Antes: un update de cámara por frame y un page.update por cambio
+    fast = run(0.0)
+    slow = run(4.0)  # Cliente que tarda dos ticks en cada envío
+    print(f"Directo:           {direct:6d} envíos ({flips} cambios de estado)")
+    print(f"Agrupado:          {fast['pushes']:6d} envíos ({fast['coalesced']} agrupadas)")
+    print(f"Cliente atrasado:  {slow['pushes']:6d} envíos ({slow['dropped']} descartadas)")
+    return {"ui/direct": {"pushes": direct}, "ui/coalesced": fast, "ui/lagging": slow}
+
+
+def bench_events(repeat, days=180, cameras=8, events_per_day=3000):
+    """Medir encolado de eventos, inserción por lotes y consultas sobre meses de historial"""
+    total = days * events_per_day
+    print_step(f"Registro de eventos ({total} eventos en {days} días, {cameras} cámaras)")
+    rng = np.random.default_rng(0)
+    now = time.time()
+    timestamps = np.sort(now - rng.random(total) * days * 86400)
+    camera_ids = rng.integers(0, cameras, total)
+    violations = rng.random(total) < 0.1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EventStore(os.path.join(tmp, "events"), retention_days=None)
+        start = time.perf_counter()
+        batch = []
+        for ts, camera, violation in zip(timestamps.tolist(), camera_ids.tolist(), violations.tolist()):
+            batch.append((ts, f"cam{camera}", "detection", "SIN_CASCO" if violation else "CASCO_DETECTADO", None))
+            if len(batch) == 500:
+                store.insert(batch)
+                batch = []
+        store.insert(batch)
+        insert_s = time.perf_counter() - start
+
+        # Costo visto por el hilo de detección: solo encolar
+        log = EventLog(EventStore(os.path.join(tmp, "queued")), max_queue=1000000, legacy_log_dir=None)
+        record = time_call(lambda: log.record("detection", "SIN_CASCO", "cam0"), repeat * 20)
+        log.close()
+
+        month_ago = now - 30 * 86400
+        violations_month = time_call(
+            lambda: store.count(start=month_ago, camera="cam3", status="SIN_CASCO"), repeat)
+        latest = time_call(lambda: store.query(camera="cam3", status="SIN_CASCO", limit=100), repeat)
+        all_violations = time_call(lambda: store.count(status="SIN_CASCO"), max(5, repeat // 5))
+        store.close()
+
+    print(f"Inserción por lotes:             {total / insert_s:10.0f} eventos/s")
+    print(f"record() en el hilo de detección: {record['mean_ms'] * 1000:9.1f} µs")
+    print(f"Infracciones cam3 último mes:    {violations_month['mean_ms']:10.3f} ms")
+    print(f"Últimas 100 infracciones cam3:   {latest['mean_ms']:10.3f} ms")
+    print(f"Infracciones en {days} días:        {all_violations['mean_ms']:10.3f} ms")
+    return {
+        "events/record": record,
+        "events/count_camera_month": violations_month,
+        "events/query_latest": latest,
+        "events/count_all": all_violations,
+    }
+
+
+def bench_recorder(repeat):
+    """Medir el costo en el hilo de render del anillo de clips y del disparo de una infracción"""
+    print_step("Grabador de infracciones (frames 1280x720, 5 s previos a 10 FPS)")
+    frame, _ = make_scene(1280, 720, 3)
+    with tempfile.TemporaryDirectory() as tmp:
+        recorder = ViolationRecorder(tmp, pre_seconds=5.0, post_seconds=0.0, fps=1e9)
+        push = time_call(lambda: recorder.push(frame), repeat)
+        for _ in range(len(recorder.slots)):
+            recorder.push(frame)
+
+        def trigger():
+            recorder.trigger(frame)
+            recorder.active = None  # Medir solo el disparo, sin escribir el clip
+
+        fire = time_call(trigger, max(5, repeat // 5))
+        recorder.trigger(frame)
+        start = time.perf_counter()
+        recorder.close()
+        write_ms = (time.perf_counter() - start) * 1000.0
+
+    ring_mb = sum(slot.nbytes for slot in recorder.slots) / 1e6
+    print(f"push() por frame:       {push['mean_ms']:8.3f} ms")
+    print(f"trigger():              {fire['mean_ms']:8.3f} ms (anillo de {ring_mb:.1f} MB)")
+    print(f"Escritura del clip:     {write_ms:8.1f} ms (en el hilo del grabador)")
+    return {"recorder/push": push, "recorder/trigger": fire}
+
+
+class ReplayCapture:
+    """Captura simulada que copia frames de un clip, como cap.read(image=...)"""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read(self, image=None):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if image is None or image.shape != frame.shape:
+            return True, frame.copy()
+        np.copyto(image, frame)
+        return True, image
+
+
+def bench_allocations(repeat, limit_kb=64):
+    """Verificar con tracemalloc que el camino por frame no reserva memoria en régimen estable"""
+    print_step("Reservas de memoria por frame (tracemalloc, 640x480)")
+    detector = make_detector_stub()
+    clip = make_clip(640, 480, frames=30, persons=5)
+    capture = ReplayCapture(clip)
+    ring = FrameRing(4)
+    gate = MotionGate()
+    boxes = [(60 + 100 * i, 80, 60, 160) for i in range(5)]
+
+    def frame_path():
+        # Captura, compuerta, blob y análisis de color: todo lo que toca píxeles en cada frame
+        _, frame = ring.read(capture)
+        gate.should_run(frame)
+        detector.build_blob([frame])
+        for x, y, w, h in boxes:
+            detector.analyze_helmet_region(frame[y:y + h // 3, x:x + w])
+        ring.release(frame)
+
+    for _ in range(10):
+        frame_path()  # Calentar buffers
+
+    tracemalloc.start()
+    worst = 0
+    frames = max(repeat, 50)
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        frame_path()
+        _, peak = tracemalloc.get_traced_memory()
+        worst = max(worst, peak - before)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    frame_kb = clip[0].nbytes / 1024
+    status = "✅" if worst <= limit_kb * 1024 else "❌"
+    print(f"{status} Pico por frame: {worst / 1024:8.1f} KB (límite {limit_kb} KB, un frame ocupa {frame_kb:.0f} KB)")
+    print(f"   Memoria retenida tras {frames} frames: {retained / 1024:8.1f} KB")
+    return {"allocations/frame_path": {"peak_bytes": worst, "limit_bytes": limit_kb * 1024}}
+
+
+# Clip de video para reproducir (opción --clip); si no hay, se usa uno sintético
+REPLAY_CLIP = None
+
+
+def load_replay_clip(max_frames=600):
+    """Cargar clip de reproducción o generar uno con tramos estáticos y con movimiento"""
+    if REPLAY_CLIP:
+        cap = cv2.VideoCapture(REPLAY_CLIP)
+        frames = []
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        return frames
+    static, _ = make_scene(640, 480, 3, seed=1)
+    moving = make_clip(frames=40, persons=3, seed=2)
+    return [static] * 40 + moving + [static] * 40
+
+
+def bench_motion(repeat):
+    """Medir CPU ahorrada y detecciones perdidas por la compuerta de movimiento"""
+    clip = load_replay_clip()
+    print_step(f"Compuerta de movimiento ({len(clip)} frames)")
+
+    def replay(gate_enabled, options=None):
+        detector = HelmetDetector()
+        detector.use_motion_gate = gate_enabled
+        detector.motion_gate_options = options or {}
+        start = time.process_time()
+        outcomes = [detector.process_frame(frame.copy())[1] for frame in clip]
+        return outcomes, time.process_time() - start
+
+    reference, reference_cpu = replay(False)
+    print(f"Sin compuerta:             CPU {reference_cpu:6.2f} s")
+    results = {"motion/no_gate": {"cpu_s": reference_cpu}}
+    for ratio in (0.001, 0.005, 0.02):
+        outcomes, cpu = replay(True, {"min_changed_ratio": ratio})
+        missed = sum(1 for expected, got in zip(reference, outcomes) if expected != got)
+        print(f"Compuerta ratio={ratio:<6}: CPU {cpu:6.2f} s "
+              f"({1 - cpu / reference_cpu:.0%} menos), resultados distintos: {missed}/{len(clip)}")
+        results[f"motion/gate_{ratio}"] = {"cpu_s": cpu, "missed": missed}
+    return results
+
+
+def count_people(detector, frame):
+    """Contar personas detectadas (tras NMS) en un frame"""
+    outs = detector.forward_yolo([frame])[0]
+    height, width = frame.shape[:2]
+    boxes, confidences, _ = detector.decode_yolo_outputs(outs, width, height)
+    indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(),
+                               detector.confidence_threshold, detector.nms_threshold)
+    return len(indexes)
+
+
+def bench_models(repeat):
+    """Comparar latencia y tasa de detección por modelo y tamaño de entrada"""
+    clip = load_replay_clip(max_frames=200)
+    print_step(f"Modelos: latencia vs tasa de detección ({len(clip)} frames de referencia)")
+    if not REPLAY_CLIP:
+        print("ℹ️ Sin --clip la tasa de detección usa escenas sintéticas y solo sirve como referencia")
+    frame = make_frames(1)[0]
+    results = {}
+    for model_name, spec in MODEL_REGISTRY.items():
+        for input_size in spec["input_sizes"]:
+            detector = HelmetDetector(model_name=model_name, input_size=input_size)
+            if detector.net is None:
+                print(f"{model_name:14s} {input_size:4d} | modelo no disponible, se omite")
+                break
+            detector.use_motion_gate = False
+            detector.use_tracking = False
+            latency = time_call(lambda: detector.process_frame(frame.copy()),
+                                max(3, repeat // 5), warmup=2)
+            detected = sum(1 for clip_frame in clip if count_people(detector, clip_frame) > 0)
+            rate = detected / len(clip) if clip else 0.0
+            print(f"{model_name:14s} {input_size:4d} | {latency['mean_ms']:8.1f} ms | "
+                  f"frames con personas: {rate:.0%}")
+            results[f"models/{model_name}/{input_size}"] = dict(latency, detection_rate=rate)
+    return results
+
+
+# Carril central de ejemplo (coordenadas relativas) con una zona excluida arriba a la izquierda
+BENCH_ROI = [(0.3, 0.0), (0.75, 0.0), (0.75, 1.0), (0.3, 1.0)]
+BENCH_EXCLUSIONS = [[(0.3, 0.0), (0.4, 0.0), (0.4, 0.15), (0.3, 0.15)]]
+
+
+def people_in_roi(detector, frame, camera_id):
+    """Contar personas detectadas con el frame completo cuyo centro cae dentro del ROI"""
+    outs = detector.forward_yolo([frame])[0]
+    height, width = frame.shape[:2]
+    boxes, confidences, _ = detector.decode_yolo_outputs(outs, width, height)
+    indexes = np.asarray(cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(), detector.confidence_threshold,
+                                          detector.nms_threshold), dtype=np.int64).flatten()
+    return int(np.count_nonzero(detector.regions[camera_id].contains(boxes[indexes], width, height)))
+
+
+def bench_roi(repeat):
+    """Comparar frame completo contra recorte al ROI: cómputo ahorrado y tasa de detección en el ROI"""
+    clip = load_replay_clip(max_frames=200)
+    print_step(f"Regiones de interés ({len(clip)} frames)")
+    detector = HelmetDetector()
+    if detector.net is None:
+        print("Modelo no disponible, se omite")
+        return {}
+    detector.use_motion_gate = False
+    detector.use_tracking = False
+    detector.set_regions("roi", BENCH_ROI, BENCH_EXCLUSIONS)
+    frame = clip[0]
+
+    full = time_call(lambda: detector.process_frame(frame.copy(), "full"), max(3, repeat // 5), warmup=2)
+    roi = time_call(lambda: detector.process_frame(frame.copy(), "roi"), max(3, repeat // 5), warmup=2)
+    _, _, input_size = detector.crop_to_roi(frame, "roi")
+    saved = 1.0 - (input_size / detector.input_size) ** 2
+
+    full_people, roi_people = 0, 0
+    for clip_frame in clip:
+        full_people += people_in_roi(detector, clip_frame, "roi")
+        before = detector.metrics.counters["people"].values.get("roi", 0)
+        detector.process_frame(clip_frame.copy(), "roi")
+        roi_people += detector.metrics.counters["people"].values.get("roi", 0) - before
+    rate = roi_people / full_people if full_people else 1.0
+
+    print(f"Frame completo:  {full['mean_ms']:8.1f} ms ({detector.input_size}x{detector.input_size})")
+    print(f"Recorte al ROI:  {roi['mean_ms']:8.1f} ms ({input_size}x{input_size}, {saved:.0%} de cómputo ahorrado)")
+    print(f"Personas en el ROI: {roi_people} con recorte vs {full_people} con frame completo ({rate:.0%})")
+    return {"roi/full_frame": full, "roi/cropped": dict(roi, compute_saved=saved, detection_rate=rate)}
+
+
+def nms_boxes(detector, boxes, confidences):
+    """Cajas que sobreviven a NMS"""
+    indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(),
+                               detector.confidence_threshold, detector.nms_threshold)
+    return boxes[np.asarray(indexes, dtype=np.int64).flatten()]
+
+
+def recall(truth, predicted, threshold=0.3):
+    """Fracción de cajas de referencia encontradas (IoU >= threshold)"""
+    if len(truth) == 0:
+        return 1.0
+    if len(predicted) == 0:
+        return 0.0
+    return float(np.mean(box_iou(truth, predicted).max(axis=1) >= threshold))
+
+
+def make_small_people_scene(detector, source, size=(3840, 2160), scale=0.3, copies=6):
+    """Pegar copias reducidas de un frame en un lienzo 4K; las personas detectadas en el original son la referencia"""
+    height, width = source.shape[:2]
+    outs = detector.forward_yolo([source])[0]
+    boxes, confidences, _ = detector.decode_yolo_outputs(outs, width, height)
+    people = nms_boxes(detector, boxes, confidences)
+    small = cv2.resize(source, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    canvas = np.full((size[1], size[0], 3), 90, dtype=np.uint8)
+    truth = []
+    columns = (copies + 1) // 2
+    for i in range(copies):
+        x = int((i % columns + 0.5) * size[0] / columns - small.shape[1] / 2)
+        y = int((i // columns + 0.5) * size[1] / 2 - small.shape[0] / 2)
+        canvas[y:y + small.shape[0], x:x + small.shape[1]] = small
+        truth.extend((bx * scale + x, by * scale + y, bw * scale, bh * scale) for bx, by, bw, bh in people)
+    return canvas, np.array(truth, dtype=np.float32).reshape(-1, 4)
+
+
+def bench_tiling(repeat):
+    """Comparar blob único contra mosaicos con letterbox: rendimiento y recall de personas pequeñas en 4K"""
+    clip = load_replay_clip(max_frames=120)
+    print_step("Modo alta resolución: blob único vs mosaicos (lienzo 3840x2160)")
+    if not REPLAY_CLIP:
+        print("ℹ️ Sin --clip el recall usa escenas sintéticas y solo sirve como referencia")
+    detector = HelmetDetector()
+    if detector.net is None:
+        print("Modelo no disponible, se omite")
+        return {}
+    detector.use_motion_gate = False
+    detector.use_tracking = False
+
+    single_recall, tiled_recall, scenes = [], [], []
+    for source in clip[::10]:
+        canvas, truth = make_small_people_scene(detector, source)
+        if len(truth) == 0:
+            continue
+        scenes.append(canvas)
+        outs = detector.forward_yolo([canvas])[0]
+        boxes, confidences, _ = detector.decode_yolo_outputs(outs, canvas.shape[1], canvas.shape[0])
+        single_recall.append(recall(truth, nms_boxes(detector, boxes, confidences)))
+        boxes, confidences, _, _ = detector.tiled_detections(canvas)
+        tiled_recall.append(recall(truth, nms_boxes(detector, boxes, confidences)))
+
+    canvas = scenes[0] if scenes else np.full((2160, 3840, 3), 90, dtype=np.uint8)
+    single = time_call(lambda: detector.process_frame(canvas.copy()), max(3, repeat // 10), warmup=1)
+    detector.use_tiling = True
+    tiled = time_call(lambda: detector.process_frame(canvas.copy()), max(3, repeat // 10), warmup=1)
+    tiles = len(detector.tile_grid(canvas.shape[1], canvas.shape[0]))
+
+    single_rate = float(np.mean(single_recall)) if single_recall else 0.0
+    tiled_rate = float(np.mean(tiled_recall)) if tiled_recall else 0.0
+    print(f"Blob único: {1000.0 / single['mean_ms']:6.2f} FPS | recall personas pequeñas {single_rate:.0%}")
+    print(f"Mosaicos:   {1000.0 / tiled['mean_ms']:6.2f} FPS | recall personas pequeñas {tiled_rate:.0%} "
+          f"({tiles} mosaicos en una pasada)")
+    return {"tiling/single": dict(single, recall=single_rate), "tiling/tiled": dict(tiled, recall=tiled_rate)}
+
+
+def bench_startup(repeat):
+    """Medir carga del modelo en frío (caché vacía) y en caliente, en procesos nuevos"""
+    print_step("Arranque del modelo: caché fría vs caliente")
+    code = ("import sys, json; from helmet_detector import HelmetDetector; "
+            "d = HelmetDetector(model_cache_dir=sys.argv[1]); "
+            "print(json.dumps({'seconds': d.model_load_seconds, 'hit': d.model_cache_hit}))")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        runs = []
+        for _ in range(2):
+            output = subprocess.run([sys.executable, "-c", code, cache_dir], capture_output=True,
+                                    text=True, check=True).stdout.strip().splitlines()[-1]
+            runs.append(json.loads(output))
+    if runs[0]["seconds"] is None:
+        print("ℹ️ Modelo YOLO no disponible, se omite el benchmark de arranque")
+        return {}
+    print(f"Frío:    {runs[0]['seconds']:6.2f} s")
+    print(f"Caliente: {runs[1]['seconds']:6.2f} s (caché {'usada' if runs[1]['hit'] else 'no usada'})")
+    return {"startup/cold": {"seconds": runs[0]["seconds"]},
+            "startup/warm": {"seconds": runs[1]["seconds"]}}
+
+
+def bench_app_startup(repeat):
+    """Medir tiempo hasta la ventana lista y hasta la primera detección en un proceso nuevo"""
+    print_step("Arranque de la aplicación")
+    # La ventana solo necesita importar el módulo (OpenCV/PIL/requests se difieren)
+    code = ("import time, json; t0 = time.perf_counter(); import helmet_detector as hd; "
+            "t_window = time.perf_counter() - t0; "
+            "d = hd.HelmetDetector(); t_model = time.perf_counter() - t0; "
+            "import numpy as np; d.process_frame(np.zeros((480, 640, 3), np.uint8)); "
+            "t_first = time.perf_counter() - t0; "
+            "print(json.dumps({'window': t_window, 'model_ready': t_model, 'first_detection': t_first}))")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                            text=True, check=True).stdout.strip().splitlines()[-1]
+    times = json.loads(output)
+    for milestone, seconds in times.items():
+        print(f"{milestone:16s} {seconds:6.2f} s")
+    return {f"app_startup/{milestone}": {"seconds": seconds} for milestone, seconds in times.items()}
+
+
+def make_frames(count, width=640, height=480, seed=0):
+    """Generar frames sintéticos BGR"""
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def _separate_process_worker(args):
+    """Trabajador con modelo propio que procesa frames de una sola cámara"""
+    iterations, seed = args
+    detector = HelmetDetector()
+    detector.use_motion_gate = False
+    frame = make_frames(1, seed=seed)[0]
+    detector.process_frame(frame.copy())  # Calentamiento
+    start = time.perf_counter()
+    for _ in range(iterations):
+        detector.process_frame(frame.copy())
+    return iterations, time.perf_counter() - start
+
+
+def bench_multicam(repeat):
+    """Comparar inferencia por lotes compartida contra procesos separados"""
+    print_step("Multicámara: lote compartido vs procesos separados")
+    detector = HelmetDetector()
+    detector.use_motion_gate = False
+    if detector.net is None:
+        print("ℹ️ Modelo YOLO no disponible, se omite el benchmark multicámara")
+        return {}
+
+    cores = os.cpu_count() or 1
+    iterations = max(3, repeat // 10)
+    results = {}
+    for streams in (4, 8, 16):
+        frames = make_frames(streams)
+        batched = time_call(lambda: detector.process_frames([f.copy() for f in frames]),
+                            iterations, warmup=1)
+        batched_fps = streams / (batched["mean_ms"] / 1000.0)
+
+        with multiprocessing.Pool(streams) as pool:
+            runs = pool.map(_separate_process_worker, [(iterations, i) for i in range(streams)])
+        separate_fps = sum(n / elapsed for n, elapsed in runs)
+
+        print(f"{streams:2d} cámaras | lote: {batched_fps / cores:6.2f} FPS/núcleo | "
+              f"procesos: {separate_fps / cores:6.2f} FPS/núcleo")
+        results[f"multicam_{streams}"] = {
+            "batched_fps_per_core": batched_fps / cores,
+            "separate_fps_per_core": separate_fps / cores,
+        }
+    return results
+
+
+def bench_shm(repeat, frames=240):
+    """Escalado de la inferencia en procesos con frames en memoria compartida"""
+    print_step("Procesos trabajadores con memoria compartida")
+    clip = make_clip(frames=min(frames, max(60, repeat * 4)))
+    results = {}
+    baseline_fps = None
+    for workers in (1, 2, 4):
+        service = SharedMemoryDetectorService(workers=workers, frame_shape=clip[0].shape, sticky=False)
+        try:
+            service.start()
+        except Exception as e:
+            print(f"ℹ️ No se pudieron iniciar los trabajadores: {e}")
+            return results
+        try:
+            for frame in clip[:workers * 2]:  # Calentamiento de cada trabajador
+                service.submit("bench", frame, block=True)
+            while service.in_flight:
+                time.sleep(0.01)
+            service.latencies.clear()
+            service.completed = 0
+            service.started_at = time.perf_counter()
+            for frame in clip:
+                service.submit("bench", frame, block=True)
+            while service.in_flight:
+                time.sleep(0.005)
+            stats = service.stats()
+        finally:
+            service.stop()
+        baseline_fps = baseline_fps or stats["throughput_fps"]
+        speedup = stats["throughput_fps"] / baseline_fps if baseline_fps else 0.0
+        print(f"{workers} trabajadores | {stats['throughput_fps']:6.1f} FPS (x{speedup:.2f}) | "
+              f"p50 {stats['latency_p50_ms']:6.1f} ms | p99 {stats['latency_p99_ms']:6.1f} ms")
+        results[f"shm_{workers}_workers"] = {
+            "throughput_fps": stats["throughput_fps"],
+            "speedup": round(speedup, 2),
+            "latency_p50_ms": stats["latency_p50_ms"],
+            "latency_p99_ms": stats["latency_p99_ms"],
+        }
+    return results
+
+
+def post_frames(port, body, count, codes):
+    """Cliente de carga: enviar count peticiones por una conexión keep-alive y contar códigos"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    for _ in range(count):
+        connection.request("POST", "/detect", body, {"Content-Type": "image/jpeg"})
+        response = connection.getresponse()
+        response.read()
+        codes.append(response.status)
+    connection.close()
+
+
+def bench_server(repeat, clients=16, max_queue=64):
+    """Carga local contra el servicio HTTP: peticiones por segundo y latencia con y sin micro-lotes"""
+    print_step(f"Servicio HTTP ({clients} clientes concurrentes en localhost)")
+    frame, _ = make_scene(640, 480, 3)
+    body = cv2.imencode(".jpg", frame)[1].tobytes()
+    per_client = max(5, repeat // 4)
+    detector = HelmetDetector()
+    results = {}
+    for max_batch in (1, 8):
+        server = DetectionServer(detector, port=0, max_batch=max_batch, max_wait_ms=10.0,
+                                 max_queue=max_queue).start()
+        post_frames(server.port, body, 2, [])  # Calentamiento
+        server.latencies.clear()
+        codes = []
+        start = time.perf_counter()
+        threads = [threading.Thread(target=post_frames, args=(server.port, body, per_client, codes))
+                   for _ in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = server.stats()
+        server.stop()
+
+        ok = codes.count(200)
+        print(f"max_batch={max_batch} | {ok / elapsed:7.1f} peticiones/s | lote medio {stats['mean_batch']:4.1f} | "
+              f"p50 {stats['latency_p50_ms']:7.1f} ms | p99 {stats['latency_p99_ms']:7.1f} ms | "
+              f"429: {codes.count(429)}")
+        results[f"server/batch{max_batch}"] = {
+            "requests_per_s": ok / elapsed,
+            "mean_batch": stats["mean_batch"],
+            "latency_p50_ms": stats["latency_p50_ms"],
+            "latency_p99_ms": stats["latency_p99_ms"],
+            "rejected": codes.count(429),
+        }
+    return results
+
+
+def bench_cache(repeat, frames=120):
+    """Caché por hash perceptual: aciertos y cómputo ahorrado con una cámara fija y ruido de sensor"""
+    print_step("Caché de resultados por hash perceptual (cámara fija)")
+    base, _ = make_scene(640, 480, 3)
+    rng = np.random.default_rng(0)
+    # Cámara fija: misma escena con ruido de sensor y un cambio real cada 30 frames
+    clip = []
+    for t in range(min(frames, max(30, repeat * 2))):
+        scene = base if (t // 30) % 2 == 0 else np.roll(base, 120, axis=1)
+        noise = rng.integers(-3, 4, scene.shape, dtype=np.int16)
+        clip.append(np.clip(scene.astype(np.int16) + noise, 0, 255).astype(np.uint8))
+
+    detector = HelmetDetector()
+    detector.use_motion_gate = False  # Medir solo la caché
+    detector.use_tracking = False
+    results = {}
+    for name, label, tolerance in (("off", "sin caché", None), ("exact", "exacta", 0),
+                                   ("tolerance4", "tolerancia 4", 4)):
+        detector.result_cache = None
+        if tolerance is not None:
+            detector.enable_result_cache(tolerance=tolerance, ttl_s=60.0)
+        start = time.perf_counter()
+        for frame in clip:
+            detector.process_frame(frame)
+        fps = len(clip) / (time.perf_counter() - start)
+        stats = detector.result_cache.stats() if detector.result_cache is not None else {"hit_rate": 0.0,
+                                                                                         "saved_s": 0.0}
+        print(f"{label:14s} {fps:7.1f} FPS | aciertos {stats['hit_rate'] * 100:5.1f}% | "
+              f"ahorro {stats['saved_s']:6.2f} s")
+        results[f"cache/{name}"] = {"fps": fps, "hit_rate": stats["hit_rate"], "saved_s": stats["saved_s"]}
+    detector.result_cache = None
+    return results
+
+
+BENCHMARKS = {
+    "allocations": bench_allocations,
+    "app_startup": bench_app_startup,
+    "cache": bench_cache,
+    "clip": bench_clip,
+    "color": bench_color,
+    "decode": bench_decode,
+    "events": bench_events,
+    "heads": bench_heads,
+    "metrics": bench_metrics,
+    "models": bench_models,
+    "motion": bench_motion,
+    "multicam": bench_multicam,
+    "preview": bench_preview,
+    "recorder": bench_recorder,
+    "roi": bench_roi,
+    "server": bench_server,
+    "shm": bench_shm,
+    "stages": bench_stages,
+    "startup": bench_startup,
+    "tiling": bench_tiling,
+    "tracking": bench_tracking,
+    "ui": bench_ui,
+}
+
+# Benchmarks que se ejecutan por defecto (multicam, shm y server son costosos y opcionales)
+DEFAULT_BENCHMARKS = ["allocations", "clip", "color", "decode", "metrics", "preview", "stages", "tracking"]
+
+
+def git_revision():
+    """Obtener commit actual para identificar los resultados"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "desconocido"
+
+
+def compare_results(results, baseline_path, tolerance):
+    """Comparar contra resultados previos y listar regresiones"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for key, timing in results.items():
+        previous = baseline.get(key)
+        if not previous or "mean_ms" not in timing or "mean_ms" not in previous:
+            continue
+        if timing["mean_ms"] > previous["mean_ms"] * (1.0 + tolerance):
+            regressions.append((key, previous["mean_ms"], timing["mean_ms"]))
+    return regressions
+
+
+def main():
+    """Función principal de benchmarks"""
+    parser = argparse.ArgumentParser(description="Benchmarks del Helmet Detector")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK",
+                        help=f"Benchmarks a ejecutar: {', '.join(sorted(BENCHMARKS))} "
+                             f"(por defecto {', '.join(DEFAULT_BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=50, help="Repeticiones por medición")
+    parser.add_argument("--output", help="Guardar resultados en JSON")
+    parser.add_argument("--baseline", help="JSON de referencia para detectar regresiones")
+    parser.add_argument("--clip", help="Video de reproducción para los benchmarks motion y models")
+    parser.add_argument("--head-model", help="Clasificador CNN de cabezas (ONNX) para el benchmark heads")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Regresión máxima permitida respecto a la referencia (0.2 = 20%%)")
+    args = parser.parse_args()
+    global REPLAY_CLIP, HEAD_MODEL
+    REPLAY_CLIP = args.clip
+    HEAD_MODEL = args.head_model
+
+    names = args.benchmarks or DEFAULT_BENCHMARKS
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Benchmark desconocido: {', '.join(unknown)}")
+
+    # Solo CPU y un hilo de OpenCV para resultados reproducibles
+    cv2.setNumThreads(1)
+    cv2.ocl.setUseOpenCL(False)
+
+    results = {}
+    for name in names:
+        results.update(BENCHMARKS[name](args.repeat))
+    over_limit = [key for key, value in results.items()
+                  if "limit_bytes" in value and value["peak_bytes"] > value["limit_bytes"]]
+
+    if args.output:
+        report = {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✅ Resultados guardados en {args.output}")
+
+    if args.baseline:
+        regressions = compare_results(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+            for key, before, after in regressions:
+                print(f"   {key}: {before:.3f} ms -> {after:.3f} ms")
+            return 1
+        print("\n✅ Sin regresiones respecto a la referencia")
+    if over_limit:
+        print(f"\n❌ Reservas por frame por encima del límite: {', '.join(over_limit)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Procesamiento por lotes sin interfaz para el Helmet Detector
+Analiza videos, carpetas de imágenes o patrones glob y guarda resultados por frame
+"""
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+
+import cv2
+
+from helmet_detector import HelmetDetector, FrameRing, MODEL_REGISTRY
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv", ".m4v", ".mpg", ".mpeg", ".wmv")
+RESULT_FIELDS = ["source", "frame", "timestamp_ms", "helmet_detected", "processing_ms"]
+
+# Detector propio de cada proceso trabajador (se carga una sola vez)
+_worker_detector = None
+
+
+def expand_inputs(inputs):
+    """Expandir rutas, carpetas y patrones glob a listas de videos e imágenes"""
+    videos, images = [], []
+    for pattern in inputs:
+        paths = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in sorted(paths):
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    full = os.path.join(path, name)
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        images.append(full)
+                    elif name.lower().endswith(VIDEO_EXTENSIONS):
+                        videos.append(full)
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(path)
+            elif path.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(path)
+            else:
+                print(f"⚠️ Se omite entrada no reconocida: {path}")
+    return videos, images
+
+
+def build_work_units(videos, images, chunk_size):
+    """Dividir el trabajo en unidades (tramos de video o grupos de imágenes)"""
+    units = []
+    for video in videos:
+        cap = cv2.VideoCapture(video)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if total <= 0:
+            # Número de frames desconocido: procesar el video completo en una unidad
+            units.append({"key": f"{video}#0-", "kind": "video", "path": video, "start": 0, "end": None})
+            continue
+        for start in range(0, total, chunk_size):
+            end = min(start + chunk_size, total)
+            units.append({"key": f"{video}#{start}-{end}", "kind": "video",
+                          "path": video, "start": start, "end": end})
+    for start in range(0, len(images), chunk_size):
+        group = images[start:start + chunk_size]
+        units.append({"key": f"images#{group[0]}#{len(group)}", "kind": "images", "paths": group})
+    return units
+
+
+def init_worker(model_name="yolov3", input_size=416, head_classifier=None, download_options=None):
+    """Cargar el modelo una vez por proceso trabajador"""
+    global _worker_detector
+    _worker_detector = HelmetDetector(model_name=model_name, input_size=input_size,
+                                      head_classifier_path=head_classifier, download_options=download_options)
+    # La compuerta de movimiento usa un latido de reloj: los resultados dependerían de la velocidad del equipo
+    _worker_detector.use_motion_gate = False
+
+
+def detect(frame):
+    """Ejecutar detección y medir tiempo"""
+    start = time.perf_counter()
+    _, helmet_detected = _worker_detector.process_frame(frame)
+    return bool(helmet_detected), (time.perf_counter() - start) * 1000.0
+
+
+def process_unit(unit):
+    """Procesar una unidad de trabajo y devolver sus filas de resultados"""
+    rows = []
+    start_time = time.perf_counter()
+
+    if unit["kind"] == "video":
+        # Seguimiento y compuerta de movimiento solo valen dentro del mismo tramo de video
+        _worker_detector.reset_state()
+        cap = cv2.VideoCapture(unit["path"])
+        if unit["start"]:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, unit["start"])
+        index = unit["start"]
+        frames = FrameRing(1)  # Cada frame se procesa antes de leer el siguiente
+        while unit["end"] is None or index < unit["end"]:
+            ret, frame = frames.read(cap)
+            if not ret:
+                break
+            timestamp_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            helmet_detected, elapsed_ms = detect(frame)
+            frames.release(frame)
+            rows.append({"source": unit["path"], "frame": index, "timestamp_ms": round(timestamp_ms, 1),
+                         "helmet_detected": helmet_detected, "processing_ms": round(elapsed_ms, 2)})
+            index += 1
+        cap.release()
+    else:
+        for path in unit["paths"]:
+            frame = cv2.imread(path)
+            if frame is None:
+                print(f"⚠️ No se pudo leer la imagen: {path}")
+                continue
+            _worker_detector.reset_state()
+            helmet_detected, elapsed_ms = detect(frame)
+            rows.append({"source": path, "frame": 0, "timestamp_ms": 0.0,
+                         "helmet_detected": helmet_detected, "processing_ms": round(elapsed_ms, 2)})
+
+    return {"key": unit["key"], "rows": rows, "pid": os.getpid(),
+            "elapsed": time.perf_counter() - start_time}
+
+
+def load_progress(progress_path):
+    """Leer unidades completadas y el tamaño de resultados confirmado tras la última"""
+    done, committed = set(), 0
+    if not os.path.exists(progress_path):
+        return done, committed
+    with open(progress_path, "r", encoding="utf-8") as f:
+        for line in f:
+            # Una línea sin salto final quedó a medias: su unidad no se completó
+            if not line.endswith("\n") or not line.strip():
+                continue
+            key, sep, size = line.rstrip("\n").rpartition("\t")
+            if sep and size.isdigit():
+                done.add(key)
+                committed = int(size)
+            else:
+                # Formato antiguo (solo la clave): no se sabe qué tamaño confirmar
+                done.add(line.rstrip("\n"))
+                committed = None
+    return done, committed
+
+
+class ResultWriter:
+    """Escritor de resultados en JSONL o CSV con soporte de reanudación"""
+
+    def __init__(self, path, output_format, committed=None):
+        self.format = output_format
+        if committed is not None and os.path.exists(path) and os.path.getsize(path) > committed:
+            # Filas escritas tras la última unidad confirmada: se repetirán al reanudar
+            print(f"⚠️ Descartando {os.path.getsize(path) - committed} bytes sin confirmar de {path}")
+            os.truncate(path, committed)
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "a", encoding="utf-8", newline="")
+        self.csv_writer = None
+        if output_format == "csv":
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            if not exists:
+                self.csv_writer.writeheader()
+
+    def write(self, rows):
+        """Añadir filas y forzar escritura a disco"""
+        for row in rows:
+            if self.csv_writer is not None:
+                self.csv_writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def size(self):
+        """Tamaño en disco de los resultados ya escritos"""
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        """Cerrar archivo de resultados"""
+        self.file.close()
+
+
+def print_worker_throughput(per_worker):
+    """Mostrar FPS por proceso trabajador"""
+    for pid, (frames, elapsed) in sorted(per_worker.items()):
+        fps = frames / elapsed if elapsed > 0 else 0.0
+        print(f"   Trabajador {pid}: {frames} frames, {fps:.1f} FPS")
+
+
+def run(args):
+    """Ejecutar el procesamiento por lotes"""
+    videos, images = expand_inputs(args.inputs)
+    if not videos and not images:
+        print("❌ No se encontraron videos ni imágenes para procesar")
+        return 1
+
+    output_format = args.format or ("csv" if args.output.lower().endswith(".csv") else "jsonl")
+    progress_path = args.output + ".progress"
+    if not args.resume:
+        for path in (args.output, progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    done, committed = load_progress(progress_path)
+    units = [unit for unit in build_work_units(videos, images, args.chunk_size) if unit["key"] not in done]
+    print(f"🔧 {len(videos)} videos, {len(images)} imágenes, "
+          f"{len(units)} unidades pendientes ({len(done)} ya completadas)")
+    if not units:
+        return 0
+
+    writer = ResultWriter(args.output, output_format, committed)
+    download_options = {"mirror_url": args.model_mirror, "shared_cache_dir": args.model_cache,
+                        "offline": args.offline}
+    download_options = {name: value for name, value in download_options.items() if value}
+    per_worker = {}
+    total_frames = 0
+    start_time = time.perf_counter()
+    try:
+        with multiprocessing.Pool(args.workers, initializer=init_worker,
+                                  initargs=(args.model, args.input_size, args.head_classifier,
+                                            download_options)) as pool, \
+                open(progress_path, "a", encoding="utf-8") as progress:
+            for result in pool.imap_unordered(process_unit, units):
+                # La unidad cuenta como hecha solo con sus filas en disco; el tamaño
+                # confirmado permite descartar al reanudar lo escrito después
+                writer.write(result["rows"])
+                progress.write(f"{result['key']}\t{writer.size()}\n")
+                progress.flush()
+                os.fsync(progress.fileno())
+
+                frames, elapsed = per_worker.get(result["pid"], (0, 0.0))
+                per_worker[result["pid"]] = (frames + len(result["rows"]), elapsed + result["elapsed"])
+                total_frames += len(result["rows"])
+                wall = time.perf_counter() - start_time
+                print(f"✅ {result['key']} ({len(result['rows'])} frames) | "
+                      f"total {total_frames / wall:.1f} FPS")
+    except KeyboardInterrupt:
+        print("\n⚠️ Interrumpido: usa --resume para continuar")
+        return 130
+    finally:
+        writer.close()
+
+    wall = time.perf_counter() - start_time
+    print(f"\n🎉 {total_frames} frames en {wall:.1f} s ({total_frames / wall:.1f} FPS)")
+    print_worker_throughput(per_worker)
+    return 0
+
+
+def main():
+    """Función principal del procesamiento por lotes"""
+    parser = argparse.ArgumentParser(description="Detección de casco por lotes sin interfaz")
+    parser.add_argument("inputs", nargs="+", help="Videos, carpetas de imágenes o patrones glob")
+    parser.add_argument("-o", "--output", default="resultados.jsonl",
+                        help="Archivo de resultados (.jsonl o .csv)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Formato de salida")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Número de procesos trabajadores")
+    parser.add_argument("--chunk-size", type=int, default=300,
+                        help="Frames de video o imágenes por unidad de trabajo")
+    parser.add_argument("--model", default="yolov3", choices=sorted(MODEL_REGISTRY),
+                        help="Modelo de detección")
+    parser.add_argument("--input-size", type=int, default=416, choices=[320, 416, 608, 640],
+                        help="Tamaño de entrada de la red")
+    parser.add_argument("--head-classifier", metavar="MODELO",
+                        help="Clasificador CNN de cabezas (ONNX) en lugar de la heurística de color")
+    parser.add_argument("--model-mirror", metavar="URL",
+                        help="Espejo local de los archivos de modelo (se prueba antes que el origen)")
+    parser.add_argument("--model-cache", metavar="CARPETA",
+                        help="Caché compartida de modelos (p. ej. una carpeta de red)")
+    parser.add_argument("--offline", action="store_true",
+                        help="No usar la red: solo yolo_model/ y la caché compartida")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continuar una ejecución interrumpida")
+    args = parser.parse_args()
+    if args.input_size not in MODEL_REGISTRY[args.model]["input_sizes"]:
+        parser.error(f"{args.model} admite tamaños de entrada {MODEL_REGISTRY[args.model]['input_sizes']}")
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,285 +1,3445 @@
+import time
+APP_START_TIME = time.perf_counter()  # Referencia para medir el arranque
+
 import flet as ft
-import cv2
-import numpy as np
 import threading
-import time
 import logging
 import os
 from datetime import datetime
 import base64
-import io
-from PIL import Image
-import requests
+import importlib
 import zipfile
+import shutil
+import bisect
+import json
+import hashlib
+import re
+import queue
+import atexit
+import sqlite3
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-class HelmetDetector:
+class LazyModule:
+    """Módulo que se importa en el primer acceso para no retrasar el arranque"""
+    
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
+        
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        # Sustituir el proxy para que los siguientes accesos vayan directo al módulo
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+# Dependencias pesadas: se cargan en segundo plano junto con el modelo
+cv2 = LazyModule("cv2", "cv2")
+np = LazyModule("numpy", "np")
+requests = LazyModule("requests", "requests")
+
+# PNG 1x1 del color de fondo: placeholder sin necesidad de PIL al arrancar
+PLACEHOLDER_IMAGE_BASE64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGPQ1dUFAAESAIg2llKcAAAAAElFTkSuQmCC"
+
+# Rangos HSV de colores típicos de cascos: nombre -> (inferior, superior)
+# Si el matiz inferior es mayor que el superior el rango da la vuelta (p. ej. rojo)
+DEFAULT_HELMET_PALETTE = {
+    "amarillo": ([20, 100, 100], [30, 255, 255]),
+    "blanco": ([0, 0, 200], [180, 30, 255]),
+    "naranja": ([10, 100, 100], [25, 255, 255]),
+}
+
+class DarknetYoloDecoder:
+    """Salidas darknet vía OpenCV: filas [cx, cy, w, h, obj, clases...] normalizadas"""
+    
+    def split(self, outs, input_size):
+        """Devolver cajas (cx, cy, w, h) normalizadas y puntuaciones por clase"""
+        detections = np.concatenate([out.reshape(-1, out.shape[-1]) for out in outs], axis=0)
+        # La capa region de OpenCV ya multiplica la puntuación de clase por la objetividad
+        return detections[:, :4], detections[:, 5:]
+
+class YoloV5OnnxDecoder:
+    """Exportación ONNX estilo YOLOv5: filas [cx, cy, w, h, obj, clases...] en píxeles de entrada"""
+    
+    def split(self, outs, input_size):
+        """Devolver cajas (cx, cy, w, h) normalizadas y puntuaciones por clase"""
+        detections = np.concatenate([out.reshape(-1, out.shape[-1]) for out in outs], axis=0)
+        return detections[:, :4] / float(input_size), detections[:, 5:] * detections[:, 4:5]
+
+class YoloV8OnnxDecoder:
+    """Exportación ONNX estilo YOLOv8: matriz (4 + clases, N) sin objetividad, en píxeles"""
+    
+    def split(self, outs, input_size):
+        """Devolver cajas (cx, cy, w, h) normalizadas y puntuaciones por clase"""
+        detections = np.concatenate([out.reshape(out.shape[-2], -1).T for out in outs], axis=0)
+        return detections[:, :4] / float(input_size), detections[:, 4:]
+
+YOLO_DECODERS = {
+    "darknet": DarknetYoloDecoder,
+    "yolov5_onnx": YoloV5OnnxDecoder,
+    "yolov8_onnx": YoloV8OnnxDecoder,
+}
+
+COCO_NAMES_URL = 'https://raw.githubusercontent.com/pjreddie/darknet/master/data/coco.names'
+COCO_NAMES_SHA256 = '634a1132eb33f8091d60f2c346ababe8b905ae08387037aed883953b7329af84'
+
+# Modelos disponibles: archivos, URLs, formato de carga, decodificador y tamaños de entrada
+# Opcional: "sha256" con nombre de archivo -> checksum esperado para verificar descargas
+MODEL_REGISTRY = {
+    "yolov3": {
+        "format": "darknet",
+        "decoder": "darknet",
+        "files": {
+            'yolov3.weights': 'https://pjreddie.com/media/files/yolov3.weights',
+            'yolov3.cfg': 'https://raw.githubusercontent.com/pjreddie/darknet/master/cfg/yolov3.cfg',
+        },
+        "weights": "yolov3.weights",
+        "config": "yolov3.cfg",
+        "input_sizes": (320, 416, 608),
+        # SHA-256 conocidos; los pesos darknet se comprueban además contra el tamaño que fija su .cfg
+        "sha256": {
+            'yolov3.cfg': '22489ea38575dfa36c67a90048e8759576416a79d32dc11e15d2217777b9a953',
+        },
+    },
+    "yolov3-tiny": {
+        "format": "darknet",
+        "decoder": "darknet",
+        "files": {
+            'yolov3-tiny.weights': 'https://pjreddie.com/media/files/yolov3-tiny.weights',
+            'yolov3-tiny.cfg': 'https://raw.githubusercontent.com/pjreddie/darknet/master/cfg/yolov3-tiny.cfg',
+        },
+        "weights": "yolov3-tiny.weights",
+        "config": "yolov3-tiny.cfg",
+        "input_sizes": (320, 416, 608),
+    },
+    "yolov4-tiny": {
+        "format": "darknet",
+        "decoder": "darknet",
+        "files": {
+            'yolov4-tiny.weights': 'https://github.com/AlexeyAB/darknet/releases/download/darknet_yolo_v4_pre/yolov4-tiny.weights',
+            'yolov4-tiny.cfg': 'https://raw.githubusercontent.com/AlexeyAB/darknet/master/cfg/yolov4-tiny.cfg',
+        },
+        "weights": "yolov4-tiny.weights",
+        "config": "yolov4-tiny.cfg",
+        "input_sizes": (320, 416, 608),
+    },
+    "yolov5n-onnx": {
+        "format": "onnx",
+        "decoder": "yolov5_onnx",
+        "files": {
+            'yolov5n.onnx': 'https://github.com/ultralytics/yolov5/releases/download/v7.0/yolov5n.onnx',
+        },
+        "weights": "yolov5n.onnx",
+        "config": None,
+        "input_sizes": (640,),  # La exportación oficial tiene entrada fija
+    },
+}
+
+def register_model(name, spec):
+    """Registrar un modelo adicional (p. ej. una exportación ONNX propia)"""
+    if spec.get("format") not in ("darknet", "onnx"):
+        raise ValueError(f"Formato de modelo no soportado: {spec.get('format')}")
+    if spec.get("decoder") not in YOLO_DECODERS:
+        raise ValueError(f"Decodificador desconocido: {spec.get('decoder')}")
+    MODEL_REGISTRY[name] = spec
+
+class ModelCache:
+    """Caché de artefactos de modelo indexada por checksum de pesos, cfg y clases y versión de OpenCV"""
+    
+    def __init__(self, cache_dir=os.path.join("yolo_model", "cache")):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        
+    def read_index(self):
+        """Leer índice ruta -> (huella, sha256)"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+        
+    def write_json(self, path, data):
+        """Escribir JSON de forma atómica"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+        
+    @staticmethod
+    def fingerprint(path):
+        """Huella barata del archivo (tamaño y fecha de modificación)"""
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    
+    def checksum(self, path):
+        """SHA-256 del archivo, reutilizado mientras su huella no cambie"""
+        key = os.path.abspath(path)
+        fingerprint = self.fingerprint(path)
+        with self.lock:
+            index = self.read_index()
+            entry = index.get(key)
+            if entry and entry["fingerprint"] == fingerprint:
+                return entry["sha256"]
+            
+        sha256 = self.hash_file(path)
+        self.remember(path, sha256, fingerprint)
+        return sha256
+    
+    @staticmethod
+    def hash_file(path):
+        """Calcular SHA-256 leyendo el archivo por bloques"""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def remember(self, path, sha256, fingerprint=None):
+        """Guardar en el índice un checksum ya conocido"""
+        with self.lock:
+            index = self.read_index()
+            index[os.path.abspath(path)] = {
+                "fingerprint": fingerprint or self.fingerprint(path),
+                "sha256": sha256,
+            }
+            self.write_json(self.index_path, index)
+    
+    def manifest_path(self, model_name, sha256):
+        """Ruta del manifiesto para un modelo, checksum y versión de OpenCV"""
+        key = f"{model_name}-{sha256[:16]}-cv{cv2.__version__}"
+        return os.path.join(self.cache_dir, key, "manifest.json")
+    
+    def artifacts_checksum(self, paths):
+        """Checksum conjunto de los archivos del modelo (pesos, cfg, nombres de clases)"""
+        # El cfg fija las capas de salida y el .names las clases: cambiar cualquiera invalida el manifiesto
+        checksums = [self.checksum(path) if os.path.exists(path) else "-" for path in paths]
+        return hashlib.sha256("\n".join(checksums).encode("ascii")).hexdigest()
+    
+    def lookup(self, model_name, paths):
+        """Devolver manifiesto cacheado o None si no existe o quedó obsoleto (paths[0] son los pesos)"""
+        if not os.path.exists(paths[0]):
+            return None
+        path = self.manifest_path(model_name, self.artifacts_checksum(paths))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+    def store(self, model_name, paths, manifest):
+        """Guardar manifiesto (capas de salida, clases, formato) tras la primera carga"""
+        key = self.artifacts_checksum(paths)
+        manifest = dict(manifest, sha256=self.checksum(paths[0]), artifacts=key, opencv=cv2.__version__)
+        self.write_json(self.manifest_path(model_name, key), manifest)
+        
+    def read_net(self, spec, weights_path, config_path):
+        """Construir la red desde las rutas (más rápido que pasar buffers, que cv2 copia a un vector)"""
+        if spec["format"] == "onnx":
+            return cv2.dnn.readNetFromONNX(weights_path)
+        return cv2.dnn.readNetFromDarknet(config_path, weights_path)
+
+class DownloadError(Exception):
+    """Error al descargar o verificar un archivo de modelo"""
+
+class FileLock:
+    """Bloqueo exclusivo entre procesos sobre un archivo .lock (fcntl en POSIX, msvcrt en Windows)"""
+    
+    def __init__(self, path, poll_interval=0.2):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.fd = None
+        
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        if os.name == "nt":
+            msvcrt = importlib.import_module("msvcrt")
+            while True:
+                try:
+                    msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(self.poll_interval)
+        else:
+            fcntl = importlib.import_module("fcntl")
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+    
+    def __exit__(self, *exc_info):
+        if os.name == "nt":
+            msvcrt = importlib.import_module("msvcrt")
+            os.lseek(self.fd, 0, os.SEEK_SET)
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl = importlib.import_module("fcntl")
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        self.fd = None
+
+def darknet_weight_count(config_path):
+    """Número de parámetros float32 que exige un .cfg darknet (None si tiene capas no contempladas)"""
+    sections = []
+    with open(config_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if line.startswith("["):
+                sections.append((line.strip("[]").lower(), {}))
+            elif "=" in line and sections:
+                key, _, value = line.partition("=")
+                sections[-1][1][key.strip()] = value.strip()
+    if not sections or sections[0][0] not in ("net", "network"):
+        return None
+    channels = int(sections[0][1].get("channels", 3))
+    outputs = []  # Canales de salida de cada capa
+    count = 0
+    for kind, options in sections[1:]:
+        if kind in ("convolutional", "conv"):
+            filters, size = int(options["filters"]), int(options.get("size", 1))
+            groups = int(options.get("groups", 1))
+            # Sesgos, y con batch norm escalas, medias y varianzas; después los pesos del filtro
+            count += filters * (4 if int(options.get("batch_normalize", 0)) else 1)
+            count += filters * (channels // groups) * size * size
+            channels = filters
+        elif kind == "route":
+            layers = [int(v) for v in options["layers"].split(",")]
+            layers = [len(outputs) + v if v < 0 else v for v in layers]
+            channels = sum(outputs[v] for v in layers) // int(options.get("groups", 1))
+        elif kind not in ("shortcut", "upsample", "maxpool", "yolo", "region", "dropout"):
+            return None
+        outputs.append(channels)
+    return count
+
+def darknet_weights_match(config_path, weights_path):
+    """Comprobar que el tamaño de unos pesos darknet corresponde a su .cfg"""
+    count = darknet_weight_count(config_path)
+    if count is None:
+        return None
+    with open(weights_path, "rb") as f:
+        header = f.read(8)
+    if len(header) < 8:
+        return False
+    major, minor = int.from_bytes(header[:4], "little"), int.from_bytes(header[4:], "little")
+    # Cabecera: versión (3 x int32) y "seen" (int64 desde la versión 0.2, int32 antes)
+    header_size = 20 if major * 10 + minor >= 2 and major < 1000 and minor < 1000 else 16
+    return os.path.getsize(weights_path) == header_size + 4 * count
+
+class ModelDownloader:
+    """Descarga reanudable, verificada y concurrente de archivos de modelo"""
+    
+    def __init__(self, model_dir="yolo_model", shared_cache_dir=None, mirror_url=None,
+                 timeout=(10, 60), retries=3, max_workers=3, checksums=None, model_cache=None,
+                 weight_configs=None, offline=False):
+        self.model_dir = model_dir
+        self.shared_cache_dir = shared_cache_dir  # Carpeta compartida para sitios sin internet
+        self.mirror_url = mirror_url.rstrip("/") if mirror_url else None
+        self.timeout = timeout  # (conexión, lectura) en segundos
+        self.retries = retries
+        self.max_workers = max_workers
+        self.checksums = checksums or {}  # nombre de archivo -> SHA-256 esperado
+        self.model_cache = model_cache or ModelCache()
+        self.weight_configs = weight_configs or {}  # pesos darknet -> .cfg que fija su tamaño
+        self.offline = offline  # Solo disco y caché compartida, sin intentar la red
+        
+    def sidecar_path(self, path):
+        """Archivo .sha256 con el checksum verificado de una descarga completa"""
+        return path + ".sha256"
+    
+    def expected_checksum(self, filename, path=None):
+        """Checksum esperado: el registrado o el de una descarga previa verificada"""
+        if filename in self.checksums:
+            return self.checksums[filename]
+        if path and os.path.exists(self.sidecar_path(path)):
+            with open(self.sidecar_path(path), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        return None
+    
+    def layout_matches(self, filename, path):
+        """Comparar el tamaño de unos pesos darknet con su .cfg (None si no se puede comprobar)"""
+        config = self.weight_configs.get(filename)
+        config_path = os.path.join(self.model_dir, config) if config else None
+        if config_path is None or not os.path.exists(config_path):
+            return None
+        try:
+            return darknet_weights_match(config_path, path)
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def is_valid(self, filename, path):
+        """Comprobar que un archivo existe y coincide con su checksum conocido o con su .cfg"""
+        if not os.path.exists(path):
+            return False
+        layout = self.layout_matches(filename, path)
+        if layout is False:
+            return False  # Truncado o de otro modelo (p. ej. una página HTML): ni se calcula el SHA-256
+        expected = self.expected_checksum(filename, path)
+        if expected is None:
+            # Sin checksum basta con que el tamaño cuadre con el .cfg (copias sin .sha256, sin red)
+            return layout is True
+        return self.model_cache.checksum(path) == expected
+    
+    def mark_verified(self, path, sha256):
+        """Guardar checksum junto al archivo verificado"""
+        with open(self.sidecar_path(path), "w", encoding="utf-8") as f:
+            f.write(sha256 + "\n")
+        self.model_cache.remember(path, sha256)
+            
+    def candidate_urls(self, filename, url):
+        """URLs a probar en orden: espejo local y luego origen"""
+        urls = []
+        if self.mirror_url:
+            urls.append(f"{self.mirror_url}/{filename}")
+        urls.append(url)
+        return urls
+    
+    def ensure(self, files):
+        """Asegurar que todos los archivos estén presentes y verificados (en paralelo)"""
+        os.makedirs(self.model_dir, exist_ok=True)
+        errors = {}
+        # Los .cfg van primero: fijan el tamaño con el que se comprueban sus pesos
+        configs = set(self.weight_configs.values())
+        phases = [{name: url for name, url in files.items() if name in configs},
+                  {name: url for name, url in files.items() if name not in configs}]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for phase in phases:
+                futures = {executor.submit(self.ensure_file, filename, url): filename
+                           for filename, url in phase.items()}
+                for future, filename in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        errors[filename] = e
+                        print(f"Error descargando {filename}: {e}")
+        return errors
+    
+    def ensure_file(self, filename, url):
+        """Obtener un archivo desde disco, caché compartida o red"""
+        target = os.path.join(self.model_dir, filename)
+        if self.is_valid(filename, target):
+            return target
+        # Cada proceso trabajador crea su propio detector: solo uno descarga y los demás reutilizan el archivo
+        with FileLock(target + ".lock"):
+            if self.is_valid(filename, target):
+                return target
+            return self.fetch_file(filename, url, target)
+        
+    def fetch_file(self, filename, url, target):
+        """Obtener el archivo con el bloqueo tomado: caché compartida, espejo u origen"""
+        if self.shared_cache_dir:
+            cached = os.path.join(self.shared_cache_dir, filename)
+            if self.is_valid(filename, cached):
+                self.install(cached, target, self.model_cache.checksum(cached))
+                print(f"{filename} copiado desde la caché compartida")
+                return target
+            
+        # Una copia local que no cuadra con su .cfg no sirve ni como último recurso
+        legacy = (os.path.exists(target) and self.expected_checksum(filename, target) is None
+                  and self.layout_matches(filename, target) is None)
+        if legacy and not self.offline and self.adopt_legacy_file(filename, url, target):
+            return target
+        
+        last_error = "modo sin conexión" if self.offline else None
+        for candidate in [] if self.offline else self.candidate_urls(filename, url):
+            try:
+                sha256 = self.download(filename, candidate, target)
+                self.publish_to_shared_cache(filename, target, sha256)
+                return target
+            except Exception as e:
+                last_error = e
+                print(f"Fallo descargando {filename} desde {candidate}: {e}")
+                
+        if legacy:
+            # Último recurso: ni caché, ni espejo, ni origen; la copia local puede estar truncada
+            print(f"⚠️ AVISO: {filename} no se pudo verificar ni descargar ({last_error}); "
+                  f"se usa la copia local SIN VERIFICAR ({os.path.getsize(target)} bytes)")
+            logging.warning(f"Archivo de modelo sin verificar en uso: {target}")
+            return target
+        raise DownloadError(f"No se pudo obtener {filename}: {last_error}")
+    
+    def adopt_legacy_file(self, filename, url, target):
+        """Verificar un archivo existente sin checksum comparando su tamaño con el espejo o el origen"""
+        for candidate in self.candidate_urls(filename, url):
+            try:
+                response = requests.head(candidate, allow_redirects=True, timeout=self.timeout)
+                response.raise_for_status()
+                remote_size = int(response.headers.get("Content-Length", -1))
+            except Exception:
+                continue
+            if remote_size == os.path.getsize(target):
+                self.mark_verified(target, self.model_cache.checksum(target))
+                return True
+            print(f"{filename} está incompleto ({os.path.getsize(target)} de {remote_size} bytes)")
+            return False
+        return False  # Sin red no se puede comprobar: se intentan las demás fuentes antes de aceptarlo
+    
+    def download(self, filename, url, target):
+        """Descargar a un archivo temporal con reanudación HTTP Range y reintentos"""
+        part_path = target + ".part"
+        for attempt in range(1, self.retries + 1):
+            response = None
+            try:
+                expected = self.checksums.get(filename)
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                headers = {"Range": f"bytes={offset}-"} if offset else {}
+                response = requests.get(url, stream=True, headers=headers, timeout=self.timeout)
+                if response.status_code == 416 and not expected:
+                    # Sin checksum conocido no se sabe si el temporal está completo, sobra o es de otra versión
+                    response.close()
+                    os.remove(part_path)
+                    offset = 0
+                    response = requests.get(url, stream=True, timeout=self.timeout)
+                with response:
+                    if response.status_code == 416:
+                        # Temporal que el servidor da por completo: lo decide el checksum conocido
+                        total = None
+                    else:
+                        response.raise_for_status()
+                        if offset and response.status_code != 206:
+                            offset = 0  # El servidor no admite Range: empezar de nuevo
+                        total = self.total_size(response, offset)
+                        print(f"Descargando {filename} ({'reanudando' if offset else 'nuevo'})...")
+                        with open(part_path, "ab" if offset else "wb") as f:
+                            for chunk in response.iter_content(chunk_size=1 << 16):
+                                f.write(chunk)
+                                
+                size = os.path.getsize(part_path)
+                if total is not None and size != total:
+                    raise DownloadError(f"descarga incompleta ({size} de {total} bytes)")
+                if self.layout_matches(filename, part_path) is False:
+                    os.remove(part_path)
+                    raise DownloadError("el tamaño no corresponde a su .cfg")
+                sha256 = self.model_cache.hash_file(part_path)
+                if expected and sha256 != expected:
+                    os.remove(part_path)
+                    raise DownloadError("checksum SHA-256 no coincide")
+                
+                os.replace(part_path, target)
+                self.mark_verified(target, sha256)
+                print(f"{filename} descargado y verificado")
+                return sha256
+            except Exception as e:
+                # Sin conexión (DNS, conexión rechazada) reintentar solo retrasa el arranque
+                unreachable = response is None and isinstance(e, requests.exceptions.ConnectionError)
+                if attempt == self.retries or unreachable:
+                    raise
+                wait = min(30, 2 ** attempt)
+                print(f"Reintentando {filename} en {wait} s ({attempt}/{self.retries}): {e}")
+                time.sleep(wait)
+                
+    @staticmethod
+    def total_size(response, offset):
+        """Tamaño final esperado según Content-Range o Content-Length"""
+        content_range = response.headers.get("Content-Range")
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            return int(total) if total.isdigit() else None
+        length = response.headers.get("Content-Length")
+        return int(length) + offset if length and length.isdigit() else None
+    
+    def install(self, source, target, sha256):
+        """Copiar un archivo verificado al destino mediante renombrado atómico"""
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+        self.mark_verified(target, sha256)
+        
+    def publish_to_shared_cache(self, filename, path, sha256):
+        """Dejar una copia verificada en la caché compartida para otros equipos"""
+        if not self.shared_cache_dir:
+            return
+        try:
+            os.makedirs(self.shared_cache_dir, exist_ok=True)
+            cached = os.path.join(self.shared_cache_dir, filename)
+            if not self.is_valid(filename, cached):
+                self.install(path, cached, sha256)
+        except OSError as e:
+            print(f"No se pudo copiar {filename} a la caché compartida: {e}")
+
+class BufferPool:
+    """Buffers reutilizables por hilo para evitar reservar memoria en cada frame"""
+    
+    def __init__(self):
+        self.local = threading.local()
+        
+    def buffers(self):
+        """Diccionario de buffers del hilo actual"""
+        if not hasattr(self.local, "buffers"):
+            self.local.buffers = {}
+        return self.local.buffers
+        
+    def get(self, name, shape, dtype=None):
+        """Buffer con forma exacta; solo se reserva de nuevo si cambia la forma"""
+        # dtype por defecto resuelto aquí: un valor por defecto np.uint8 importaría numpy al cargar el módulo
+        dtype = np.uint8 if dtype is None else dtype
+        buffers = self.buffers()
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            buffers[name] = buffer
+        return buffer
+    
+    def scratch(self, name, shape, dtype=None):
+        """Vista contigua sobre un buffer que solo crece (regiones de tamaño variable)"""
+        dtype = np.uint8 if dtype is None else dtype
+        size = 1
+        for dim in shape:
+            size *= dim
+        buffers = self.buffers()
+        flat = buffers.get(name)
+        if flat is None or flat.size < size or flat.dtype != dtype:
+            flat = np.empty(max(size, 1), dtype=dtype)
+            buffers[name] = flat
+        return flat[:size].reshape(shape)
+
+class FrameRing:
+    """Huecos de frames preasignados donde la captura escribe sin reservar memoria"""
+    
+    def __init__(self, slots=6):
+        # Un hueco solo se reutiliza cuando su consumidor lo devuelve con release()
+        self.slots = [None] * slots
+        self.free = deque(range(slots))
+        self.condition = threading.Condition()
+        self.exhausted = 0  # Lecturas descartadas por no haber hueco libre
+        
+    def read(self, cap, timeout=None):
+        """Leer sobre un hueco libre; sin hueco en timeout segundos el frame se descarta en la fuente"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.free, timeout):
+                self.exhausted += 1
+                index = None
+            else:
+                index = self.free.popleft()
+        if index is None:
+            cap.grab()  # Consumir el frame para que la fuente no acumule retraso
+            return False, None
+        
+        slot = self.slots[index]
+        try:
+            if slot is None:
+                ret, frame = cap.read()
+            else:
+                ret, frame = cap.read(image=slot)
+        except Exception:
+            self.release_index(index)
+            raise
+        if not ret or frame is None:
+            self.release_index(index)
+            return False, None
+        # Si la resolución cambia, OpenCV devuelve un array nuevo que sustituye al hueco
+        self.slots[index] = frame
+        return True, frame
+    
+    def release(self, frame):
+        """Devolver el hueco de un frame leído con read() (ignora frames ajenos al anillo)"""
+        for index, slot in enumerate(self.slots):
+            if slot is frame:
+                self.release_index(index)
+                return
+            
+    def release_index(self, index):
+        """Marcar un hueco como libre y despertar a la captura"""
+        with self.condition:
+            if index not in self.free:
+                self.free.append(index)
+                self.condition.notify()
+                
+    def in_use(self):
+        """Número de huecos retenidos por consumidores"""
+        with self.condition:
+            return len(self.slots) - len(self.free)
+
+class HelmetColorEngine:
+    """Clasificador de colores de casco con los rangos inRange de la paleta precalculados"""
+    
+    def __init__(self, palette=None):
+        self.palette = dict(palette or DEFAULT_HELMET_PALETTE)
+        self.color_names = list(self.palette)
+        self.ranges = {name: self.build_ranges(*self.palette[name]) for name in self.color_names}
+        
+    def build_ranges(self, lower, upper):
+        """Convertir un rango HSV en límites para inRange (un tono que da la vuelta se parte en dos)"""
+        lower, upper = [int(v) for v in lower], [int(v) for v in upper]
+        if lower[0] <= upper[0]:
+            return [(tuple(lower), tuple(upper))]
+        return [(tuple(lower), (179,) + tuple(upper[1:])), ((0,) + tuple(lower[1:]), tuple(upper))]
+    
+    def count_color(self, hsv, name):
+        """Contar píxeles dentro del rango de un color"""
+        count = 0
+        for lower, upper in self.ranges[name]:
+            count += cv2.countNonZero(cv2.inRange(hsv, lower, upper))
+        return count
+    
+    def count_colors(self, region):
+        """Contar píxeles por color de casco"""
+        if region.size == 0:
+            return {name: 0 for name in self.color_names}
+        hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+        return {name: self.count_color(hsv, name) for name in self.color_names}
+    
+    def has_helmet_color(self, region, ratio):
+        """Indicar si algún color de casco supera la fracción dada de la región"""
+        if region.size == 0:
+            return False
+        threshold = region.shape[0] * region.shape[1] * ratio
+        hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+        # Basta el primer color que supere el umbral
+        for name in self.color_names:
+            if self.count_color(hsv, name) > threshold:
+                return True
+        return False
+
+def box_iou(boxes_a, boxes_b):
+    """Matriz IoU entre dos conjuntos de cajas (x, y, w, h)"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None]) - np.maximum(a[:, 0, None], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None]) - np.maximum(a[:, 1, None], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None] - inter
+    return inter / np.maximum(union, 1e-6)
+
+class Track:
+    """Persona seguida entre frames con su historial de clasificación de casco"""
+    
+    def __init__(self, track_id, box, vote_window, min_votes=3):
+        self.track_id = track_id
+        self.box = box
+        self.missed = 0
+        self.votes = deque(maxlen=vote_window)
+        self.classified_box = None
+        self.frames_since_classified = 0
+        self.helmet = None
+        self.min_votes = min_votes  # Votos necesarios antes de contar una infracción
+        self.violation_counted = False
+        
+    def add_vote(self, helmet):
+        """Añadir clasificación y actualizar estado suavizado por votación"""
+        self.votes.append(bool(helmet))
+        self.classified_box = self.box
+        self.frames_since_classified = 0
+        self.helmet = sum(self.votes) * 2 >= len(self.votes)
+        if self.helmet:
+            # Si vuelve a quitarse el casco cuenta como una infracción nueva
+            self.violation_counted = False
+            
+    def is_violation(self):
+        """Sin casco por mayoría de al menos min_votes votos (un solo error no cuenta)"""
+        return self.helmet is False and len(self.votes) >= self.min_votes
+
+class HelmetTracker:
+    """Seguimiento por IoU/centroide para clasificar el casco por persona y no por caja"""
+    
+    def __init__(self, iou_threshold=0.3, max_missed=10, refresh_interval=10,
+                 refresh_iou=0.5, vote_window=7, min_votes=3):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.refresh_interval = refresh_interval
+        self.refresh_iou = refresh_iou
+        self.vote_window = vote_window
+        self.min_votes = min_votes
+        self.tracks = []
+        self.next_id = 1
+        
+    def update(self, boxes):
+        """Asociar detecciones a tracks; devuelve (tracks visibles, tracks nuevos)"""
+        boxes = [tuple(int(v) for v in box) for box in boxes]
+        unmatched_tracks = list(range(len(self.tracks)))
+        unmatched_boxes = list(range(len(boxes)))
+        matches = []
+        
+        # Emparejamiento voraz por IoU descendente
+        if self.tracks and boxes:
+            iou = box_iou([t.box for t in self.tracks], boxes)
+            for flat in np.argsort(-iou, axis=None):
+                ti, bi = np.unravel_index(flat, iou.shape)
+                if iou[ti, bi] < self.iou_threshold:
+                    break
+                if ti in unmatched_tracks and bi in unmatched_boxes:
+                    matches.append((ti, bi))
+                    unmatched_tracks.remove(ti)
+                    unmatched_boxes.remove(bi)
+        
+        # Respaldo por distancia de centroides para movimientos rápidos
+        for ti in list(unmatched_tracks):
+            tx, ty, tw, th = self.tracks[ti].box
+            best, best_dist = None, 0.5 * np.hypot(tw, th)
+            for bi in unmatched_boxes:
+                bx, by, bw, bh = boxes[bi]
+                dist = np.hypot((bx + bw / 2) - (tx + tw / 2), (by + bh / 2) - (ty + th / 2))
+                if dist < best_dist:
+                    best, best_dist = bi, dist
+            if best is not None:
+                matches.append((ti, best))
+                unmatched_tracks.remove(ti)
+                unmatched_boxes.remove(best)
+        
+        visible = []
+        for ti, bi in matches:
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.missed = 0
+            track.frames_since_classified += 1
+            visible.append(track)
+        for ti in unmatched_tracks:
+            self.tracks[ti].missed += 1
+            
+        new_tracks = []
+        for bi in unmatched_boxes:
+            track = Track(self.next_id, boxes[bi], self.vote_window, self.min_votes)
+            self.next_id += 1
+            new_tracks.append(track)
+            
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed] + new_tracks
+        return visible + new_tracks, new_tracks
+    
+    def needs_classification(self, track):
+        """Indicar si hay que volver a analizar el casco de un track"""
+        if track.classified_box is None or track.frames_since_classified >= self.refresh_interval:
+            return True
+        return box_iou([track.classified_box], [track.box])[0, 0] < self.refresh_iou
+    
+    def reset(self):
+        """Olvidar todos los tracks"""
+        self.tracks = []
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+class Histogram:
+    """Histograma acumulativo por cámara en formato Prometheus"""
+    
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}  # cámara -> [conteos por bucket, suma, total]
+        
+    def observe(self, camera, value):
+        """Registrar una observación en segundos"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(camera)
+            if series is None:
+                series = self.series[camera] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+            
+    def render(self):
+        """Exportar en formato de texto Prometheus"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = {camera: (list(s[0]), s[1], s[2]) for camera, s in self.series.items()}
+        for camera, (counts, total_sum, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{camera="{camera}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{camera="{camera}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{camera="{camera}"}} {total_sum}')
+            lines.append(f'{self.name}_count{{camera="{camera}"}} {count}')
+        return lines
+
+class Counter:
+    """Contador monótono por cámara en formato Prometheus"""
+    
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+        
+    def inc(self, camera, amount=1):
+        """Incrementar el contador de una cámara"""
+        with self.lock:
+            self.values[camera] = self.values.get(camera, 0) + amount
+            
+    def render(self):
+        """Exportar en formato de texto Prometheus"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            snapshot = dict(self.values)
+        for camera, value in sorted(snapshot.items()):
+            lines.append(f'{self.name}{{camera="{camera}"}} {value}')
+        return lines
+
+class MetricsRegistry:
+    """Registro de métricas de latencia y contadores del detector"""
+    
     def __init__(self):
+        self.histograms = {
+            "capture": Histogram("helmet_capture_seconds", "Tiempo de lectura de frame"),
+            "inference": Histogram("helmet_inference_seconds", "Tiempo de inferencia de la red"),
+            "postprocess": Histogram("helmet_postprocess_seconds", "Tiempo de decodificación y análisis"),
+            "ui_push": Histogram("helmet_ui_push_seconds", "Tiempo de envío a la interfaz"),
+        }
+        self.counters = {
+            "captured": Counter("helmet_frames_captured_total", "Frames capturados"),
+            "processed": Counter("helmet_frames_processed_total", "Frames procesados"),
+            "dropped": Counter("helmet_frames_dropped_total", "Frames descartados"),
+            "people": Counter("helmet_people_seen_total", "Personas detectadas"),
+            "violations": Counter("helmet_violations_total", "Personas sin casco detectadas"),
+            "gated": Counter("helmet_frames_gated_total", "Frames sin movimiento que omiten la inferencia"),
+            "cache_hits": Counter("helmet_cache_hits_total", "Frames casi idénticos servidos desde la caché"),
+            "cache_saved_seconds": Counter("helmet_cache_saved_seconds_total",
+                                           "Segundos de cómputo ahorrados por la caché de resultados"),
+            "input_pixels": Counter("helmet_input_pixels_total", "Píxeles de entrada procesados por la red"),
+            "input_pixels_saved": Counter("helmet_input_pixels_saved_total",
+                                          "Píxeles de entrada ahorrados por las regiones de interés"),
+            "roi_excluded": Counter("helmet_roi_excluded_total", "Detecciones fuera de la región de interés"),
+        }
+        
+    def observe(self, name, camera, seconds):
+        """Registrar latencia de una etapa"""
+        self.histograms[name].observe(camera, seconds)
+        
+    def inc(self, name, camera, amount=1):
+        """Incrementar un contador"""
+        if amount:
+            self.counters[name].inc(camera, amount)
+        
+    def render(self):
+        """Exportar todas las métricas en formato de texto Prometheus"""
+        lines = []
+        for metric in list(self.histograms.values()) + list(self.counters.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Registro global compartido por detector, pipeline y servicio multicámara
+METRICS = MetricsRegistry()
+
+class MetricsServer:
+    """Servidor HTTP local que expone /metrics en formato Prometheus"""
+    
+    def __init__(self, registry=None, host="127.0.0.1", port=9108):
+        self.registry = registry or METRICS
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+        
+    def start(self):
+        """Iniciar servidor en un hilo en segundo plano"""
+        registry = self.registry
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                
+            def log_message(self, format, *args):
+                pass  # Evitar escribir cada petición en stdout
+                
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metricas")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Métricas disponibles en http://{self.host}:{self.port}/metrics")
+        return self
+    
+    def stop(self):
+        """Detener servidor"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+# Línea de los logs de texto anteriores (logs/helmet_detection_AAAAMMDD.log)
+LEGACY_LOG_PATTERN = re.compile(
+    r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) - \w+ - (?:\[(.+?)\] )?(Detección|Captura guardada): (.+)$"
+)
+
+def decode_legacy_line(raw):
+    """Decodificar una línea de log antiguo: UTF-8 o, si no lo es, la codificación local de Windows"""
+    # El FileHandler original escribía con la codificación del sistema (cp1252 en Windows)
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("cp1252", errors="replace")
+
+class EventStore:
+    """Almacén SQLite de eventos particionado por mes (rotación y retención por archivo)"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            ts INTEGER NOT NULL,
+            camera TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT,
+            detail TEXT
+        );
+        CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+        CREATE INDEX IF NOT EXISTS events_camera_status_ts ON events (camera, status, ts);
+        CREATE INDEX IF NOT EXISTS events_status_ts ON events (status, ts);
+    """
+    
+    def __init__(self, directory="logs/events", retention_days=365):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.connections = {}  # Conexiones de escritura (solo las usa el hilo escritor)
+        
+    def partition_path(self, timestamp):
+        """Archivo del mes al que pertenece el instante dado"""
+        month = datetime.fromtimestamp(timestamp).strftime("%Y%m")
+        return os.path.join(self.directory, f"events_{month}.db")
+    
+    def partitions(self, start=None, end=None):
+        """Archivos mensuales existentes que se solapan con el intervalo, del más reciente al más antiguo"""
+        if not os.path.isdir(self.directory):
+            return []
+        first = datetime.fromtimestamp(start).strftime("%Y%m") if start is not None else "000000"
+        last = datetime.fromtimestamp(end).strftime("%Y%m") if end is not None else "999999"
+        paths = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.startswith("events_") and name.endswith(".db") and first <= name[7:13] <= last:
+                paths.append(os.path.join(self.directory, name))
+        return paths
+    
+    def writer(self, path):
+        """Conexión de escritura de una partición (se crea el esquema si hace falta)"""
+        conn = self.connections.get(path)
+        if conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self.connections[path] = conn
+        return conn
+    
+    def insert(self, events):
+        """Insertar un lote de eventos (ts, cámara, tipo, estado, detalle) en una transacción por mes"""
+        by_path = {}
+        for event in events:
+            by_path.setdefault(self.partition_path(event[0]), []).append(
+                (int(event[0] * 1000), event[1], event[2], event[3], event[4])
+            )
+        for path, rows in by_path.items():
+            conn = self.writer(path)
+            with conn:
+                conn.executemany("INSERT INTO events (ts, camera, kind, status, detail) VALUES (?, ?, ?, ?, ?)",
+                                 rows)
+                
+    def where(self, start, end, camera, status, kind):
+        """Cláusula WHERE y parámetros de una consulta"""
+        clauses, params = [], []
+        for column, op, value in (("ts", ">=", start), ("ts", "<", end)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(int(value * 1000))
+        for column, value in (("camera", camera), ("status", status), ("kind", kind)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+    
+    def read(self, path):
+        """Conexión de solo lectura a una partición"""
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        
+    def query(self, start=None, end=None, camera=None, status=None, kind=None, limit=1000):
+        """Eventos del intervalo [start, end) en segundos epoch, del más reciente al más antiguo"""
+        where, params = self.where(start, end, camera, status, kind)
+        events = []
+        for path in self.partitions(start, end):
+            if limit is not None and len(events) >= limit:
+                break
+            sql = f"SELECT ts, camera, kind, status, detail FROM events{where} ORDER BY ts DESC"
+            if limit is not None:
+                sql += f" LIMIT {int(limit - len(events))}"
+            conn = self.read(path)
+            try:
+                for ts, camera_id, event_kind, event_status, detail in conn.execute(sql, params):
+                    events.append({
+                        "timestamp": ts / 1000.0,
+                        "camera": camera_id,
+                        "kind": event_kind,
+                        "status": event_status,
+                        "detail": json.loads(detail) if detail else {},
+                    })
+            finally:
+                conn.close()
+        return events
+    
+    def count(self, start=None, end=None, camera=None, status=None, kind=None):
+        """Número de eventos que cumplen los filtros"""
+        where, params = self.where(start, end, camera, status, kind)
+        total = 0
+        for path in self.partitions(start, end):
+            conn = self.read(path)
+            try:
+                total += conn.execute(f"SELECT COUNT(*) FROM events{where}", params).fetchone()[0]
+            finally:
+                conn.close()
+        return total
+    
+    def apply_retention(self, now=None):
+        """Borrar particiones antiguas completas y los eventos vencidos de la más antigua restante"""
+        if not self.retention_days:
+            return
+        cutoff = (now or time.time()) - self.retention_days * 86400
+        cutoff_month = datetime.fromtimestamp(cutoff).strftime("%Y%m")
+        for path in self.partitions(end=cutoff):
+            conn = self.connections.pop(path, None)
+            if conn is not None:
+                conn.close()
+            if os.path.basename(path)[7:13] < cutoff_month:
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            else:
+                conn = self.writer(path)
+                with conn:
+                    conn.execute("DELETE FROM events WHERE ts < ?", (int(cutoff * 1000),))
+                    
+    def import_legacy_logs(self, log_dir="logs"):
+        """Importar los logs de texto anteriores, continuando donde se quedó la última importación"""
+        index_path = os.path.join(self.directory, "imported.json")
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {"version": 2, "offsets": {}}
+        # Los índices sin versión se guardaron leyendo mal los logs en cp1252 (se perdían las detecciones):
+        # se vuelve a leer desde el principio sin duplicar lo que ya se importó
+        recheck = "version" not in index
+        offsets = {} if recheck else index["offsets"]
+        
+        imported = 0
+        for name in sorted(os.listdir(log_dir)) if os.path.isdir(log_dir) else []:
+            if not (name.startswith("helmet_detection_") and name.endswith(".log")):
+                continue
+            path = os.path.join(log_dir, name)
+            if os.path.getsize(path) <= offsets.get(name, 0):
+                continue
+            events = []
+            # Lectura binaria: los desplazamientos son en bytes y cada línea se decodifica por separado
+            with open(path, "rb") as f:
+                f.seek(offsets.get(name, 0))
+                for raw in f:
+                    match = LEGACY_LOG_PATTERN.match(decode_legacy_line(raw).rstrip("\r\n"))
+                    if not match:
+                        continue
+                    moment, camera_id, action, value = match.groups()
+                    timestamp = datetime.strptime(moment, "%Y-%m-%d %H:%M:%S").timestamp()
+                    if action == "Detección":
+                        events.append((timestamp, camera_id or "default", "detection", value.strip(), None))
+                    else:
+                        detail = json.dumps({"path": value.strip()}, ensure_ascii=False)
+                        events.append((timestamp, camera_id or "default", "capture", None, detail))
+                offsets[name] = f.tell()
+            if recheck:
+                events = self.without_imported(events)
+            self.insert(events)
+            imported += len(events)
+            
+        if imported or recheck:
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = index_path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": 2, "offsets": offsets}, f)
+            os.replace(temp_path, index_path)
+        if imported:
+            print(f"Importados {imported} eventos de logs de texto anteriores")
+        return imported
+    
+    def without_imported(self, events):
+        """Descartar eventos legados que ya están en el almacén (mismo instante, cámara, tipo y estado)"""
+        pending = []
+        existing = {}
+        for event in events:
+            key = event[:4]
+            if key not in existing:
+                timestamp, camera_id, kind, status = key
+                existing[key] = self.count(start=timestamp, end=timestamp + 1, camera=camera_id, status=status,
+                                           kind=kind)
+            # Varias líneas idénticas en el mismo segundo: solo se añaden las que faltan
+            if existing[key]:
+                existing[key] -= 1
+            else:
+                pending.append(event)
+        return pending
+    
+    def close(self):
+        """Cerrar conexiones de escritura"""
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+class EventLog:
+    """Registro de eventos no bloqueante: cola en memoria y escritor por lotes en segundo plano"""
+    
+    def __init__(self, store=None, batch_size=500, flush_interval=1.0, max_queue=10000,
+                 legacy_log_dir="logs", retention_check_s=3600.0):
+        self.store = store or EventStore()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_queue)
+        self.legacy_log_dir = legacy_log_dir
+        self.retention_check_s = retention_check_s
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        
+    def record(self, kind, status=None, camera_id="default", timestamp=None, **detail):
+        """Encolar un evento sin bloquear; si la cola está llena se descarta y se cuenta"""
+        if self.thread is None:
+            self.start()
+        event = (timestamp or time.time(), camera_id, kind, status,
+                 json.dumps(detail, ensure_ascii=False) if detail else None)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            
+    def start(self):
+        """Iniciar el hilo escritor (una sola vez)"""
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="eventos")
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(self.close)
+        return self
+    
+    def run(self):
+        """Agrupar eventos y escribirlos por lotes"""
+        try:
+            if self.legacy_log_dir:
+                self.store.import_legacy_logs(self.legacy_log_dir)
+            self.store.apply_retention()
+        except Exception as e:
+            print(f"Error preparando el registro de eventos: {e}")
+        last_retention = time.monotonic()
+        
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    event = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is None:
+                    running = False
+                    break
+                batch.append(event)
+            try:
+                if batch:
+                    self.store.insert(batch)
+                    self.written += len(batch)
+                if time.monotonic() - last_retention >= self.retention_check_s:
+                    self.store.apply_retention()
+                    last_retention = time.monotonic()
+            except Exception as e:
+                print(f"Error escribiendo eventos: {e}")
+        self.store.close()
+        
+    def close(self, timeout=5.0):
+        """Escribir lo pendiente y detener el hilo"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+        
+    def stats(self):
+        """Eventos escritos, en cola y descartados"""
+        return {"written": self.written, "queued": self.queue.qsize(), "dropped": self.dropped}
+
+# Registro de eventos global (el escritor arranca con el primer evento)
+EVENT_LOG = EventLog()
+
+class ResultCache:
+    """Caché LRU de resultados por hash perceptual: frames casi idénticos reutilizan la detección"""
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=512, ttl_s=5.0, tolerance=4, hash_size=8,
+                 metrics=None):
+        self.max_bytes = max_bytes  # Memoria máxima de los resultados guardados
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s  # Un resultado no se reutiliza pasado este tiempo
+        self.tolerance = tolerance  # Distancia de Hamming máxima entre hashes (de hash_size² bits)
+        self.hash_size = hash_size
+        self.metrics = metrics or METRICS
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # (clave, hash) -> [valor, creado, coste, bytes]; el final es el más reciente
+        self.hashes = {}  # clave (cámara) -> hashes guardados, para la búsqueda por tolerancia
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_s = 0.0
+        
+    def frame_hash(self, frame):
+        """dHash: reducir a (n+1)xn grises y comparar cada píxel con su vecino derecho"""
+        small = cv2.resize(frame, (self.hash_size + 1, self.hash_size), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        bits = np.packbits(small[:, 1:] > small[:, :-1])
+        return int.from_bytes(bits.tobytes(), "big")
+    
+    def get(self, key, frame_hash):
+        """Resultado guardado más parecido dentro de la tolerancia, o None"""
+        now = time.monotonic()
+        with self.lock:
+            entry_key = (key, frame_hash)
+            if entry_key not in self.entries and self.tolerance > 0:
+                best = self.tolerance + 1
+                for candidate in self.hashes.get(key, ()):
+                    distance = bin(candidate ^ frame_hash).count("1")
+                    if distance < best:
+                        best, entry_key = distance, (key, candidate)
+            entry = self.entries.get(entry_key)
+            if entry is not None and now - entry[1] > self.ttl_s:
+                self.remove(entry_key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(entry_key)
+            self.hits += 1
+            self.saved_s += entry[2]
+        self.metrics.inc("cache_hits", key)
+        self.metrics.inc("cache_saved_seconds", key, entry[2])
+        return entry[0]
+    
+    def put(self, key, frame_hash, value, cost_s=0.0, nbytes=0):
+        """Guardar un resultado con su coste de cómputo y expulsar los menos usados si no cabe"""
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            entry_key = (key, frame_hash)
+            if entry_key in self.entries:
+                self.remove(entry_key)
+            self.entries[entry_key] = [value, time.monotonic(), cost_s, nbytes]
+            self.hashes.setdefault(key, set()).add(frame_hash)
+            self.bytes += nbytes
+            while self.entries and (self.bytes > self.max_bytes or len(self.entries) > self.max_entries):
+                self.remove(next(iter(self.entries)))
+                
+    def remove(self, entry_key):
+        """Quitar una entrada (llamar con el candado tomado)"""
+        entry = self.entries.pop(entry_key)
+        self.bytes -= entry[3]
+        hashes = self.hashes[entry_key[0]]
+        hashes.discard(entry_key[1])
+        if not hashes:
+            del self.hashes[entry_key[0]]
+            
+    def clear(self, key=None):
+        """Vaciar la caché completa o solo la de una cámara"""
+        with self.lock:
+            for entry_key in [k for k in self.entries if key is None or k[0] == key]:
+                self.remove(entry_key)
+                
+    def stats(self):
+        """Tasa de aciertos, cómputo ahorrado y ocupación"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "saved_s": round(self.saved_s, 3),
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+            }
+
+class MotionGate:
+    """Compuerta de movimiento: evita la inferencia cuando la escena no cambia"""
+    
+    def __init__(self, pixel_threshold=25, min_changed_ratio=0.005, heartbeat_s=2.0, width=160):
+        self.pixel_threshold = pixel_threshold  # Diferencia mínima de gris por píxel
+        self.min_changed_ratio = min_changed_ratio  # Fracción de píxeles que deben cambiar
+        self.heartbeat_s = heartbeat_s  # Detección completa forzada cada N segundos
+        self.width = width
+        self.reference = None
+        self.last_full_time = 0.0
+        self.last_result = None
+        self.checked = 0
+        self.skipped = 0
+        self.buffers = BufferPool()
+        self.slot = 0  # Alterna el buffer de salida para no pisar la referencia
+        self.result_slot = 0
+        
+    def prepare(self, frame):
+        """Reducir y pasar a gris suavizado para comparar barato"""
+        height = max(1, int(frame.shape[0] * self.width / frame.shape[1]))
+        small = self.buffers.get("small", (height, self.width, 3))
+        gray = self.buffers.get("gray", (height, self.width))
+        blurred = self.buffers.get(f"blur{self.slot}", (height, self.width))
+        small = cv2.resize(frame, (self.width, height), dst=small, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=gray)
+        return cv2.GaussianBlur(gray, (5, 5), 0, dst=blurred)
+    
+    def should_run(self, frame):
+        """Indicar si el frame requiere inferencia completa"""
+        self.checked += 1
+        gray = self.prepare(frame)
+        now = time.monotonic()
+        
+        run = (self.reference is None or self.last_result is None
+               or self.reference.shape != gray.shape
+               or now - self.last_full_time >= self.heartbeat_s)
+        if not run:
+            # Comparar contra el último frame inferido para acumular cambios lentos
+            diff = self.buffers.get("diff", gray.shape)
+            diff = cv2.absdiff(gray, self.reference, dst=diff)
+            cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY, dst=diff)
+            changed = cv2.countNonZero(diff)
+            run = changed >= self.min_changed_ratio * gray.size
+            
+        if run:
+            self.reference = gray
+            self.slot ^= 1
+            self.last_full_time = now
+        else:
+            self.skipped += 1
+        return run
+    
+    def stats(self):
+        """Frames evaluados y omitidos por falta de movimiento"""
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.checked if self.checked else 0.0,
+        }
+
+class HeadClassifier:
+    """Clasificador CNN casco / sin casco de recortes de cabeza, ejecutado por lotes con cv2.dnn"""
+    
+    def __init__(self, model_path, input_size=64, batch_size=32, helmet_index=1, threshold=0.5,
+                 scale=1.0 / 255.0, mean=(0.0, 0.0, 0.0), swap_rb=True, activation="softmax"):
+        self.net = cv2.dnn.readNet(model_path)
+        self.input_size = input_size
+        self.batch_size = batch_size
+        self.helmet_index = helmet_index  # Columna de la salida que corresponde a "casco"
+        self.threshold = threshold
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.activation = activation  # "softmax", "sigmoid" o None si la red ya da probabilidades
+        # Buffers fijos: recortes y blob de un lote completo
+        self.crops = np.zeros((batch_size, input_size, input_size, 3), dtype=np.uint8)
+        self.blob = np.empty((batch_size, 3, input_size, input_size), dtype=np.float32)
+        self.lock = threading.Lock()
+        self.batches = 0
+        
+    def classify(self, regions):
+        """Casco sí/no por región; las regiones vacías cuentan como sin casco"""
+        verdicts = [False] * len(regions)
+        valid = [i for i, region in enumerate(regions) if region.size > 0]
+        with self.lock:
+            for start in range(0, len(valid), self.batch_size):
+                chunk = valid[start:start + self.batch_size]
+                probabilities = self.forward([regions[i] for i in chunk])
+                for i, probability in zip(chunk, probabilities):
+                    verdicts[i] = bool(probability >= self.threshold)
+        return verdicts
+    
+    def forward(self, regions):
+        """Probabilidad de casco de hasta batch_size regiones en una sola pasada"""
+        count = len(regions)
+        size = (self.input_size, self.input_size)
+        for i, region in enumerate(regions):
+            cv2.resize(region, size, dst=self.crops[i], interpolation=cv2.INTER_AREA)
+        for channel in range(3):
+            source = 2 - channel if self.swap_rb else channel
+            plane = self.blob[:count, channel]
+            np.subtract(self.crops[:count, :, :, source], self.mean[channel], out=plane, dtype=np.float32)
+            plane *= self.scale
+        self.net.setInput(self.blob[:count])
+        out = self.net.forward().reshape(count, -1).astype(np.float32)
+        self.batches += 1
+        
+        if out.shape[1] == 1:
+            scores = out[:, 0]
+            return 1.0 / (1.0 + np.exp(-scores)) if self.activation == "sigmoid" else scores
+        if self.activation == "softmax":
+            out = np.exp(out - out.max(axis=1, keepdims=True))
+            out /= out.sum(axis=1, keepdims=True)
+        elif self.activation == "sigmoid":
+            out = 1.0 / (1.0 + np.exp(-out))
+        return out[:, self.helmet_index]
+
+class CameraRegions:
+    """Región de interés y zonas excluidas de una cámara (polígonos en coordenadas relativas 0-1)"""
+    
+    def __init__(self, roi=None, exclusions=None, margin=0.05):
+        # El ROI debe abarcar a las personas completas (no solo el suelo del carril)
+        self.roi = np.asarray(roi, dtype=np.float32).reshape(-1, 2) if roi is not None else None
+        self.exclusions = [np.asarray(polygon, dtype=np.float32).reshape(-1, 2) for polygon in exclusions or []]
+        self.margin = margin  # Margen relativo del recorte para no cortar personas en el borde
+        self.layouts = {}  # (ancho, alto) -> (recorte, máscara, polígonos en píxeles)
+        
+    def layout(self, width, height):
+        """Recorte (x0, y0, x1, y1), máscara de píxeles válidos y polígonos para un tamaño de frame"""
+        key = (width, height)
+        if key not in self.layouts:
+            scale = np.array([width, height], dtype=np.float32)
+            mask = np.zeros((height, width), dtype=np.uint8)
+            polygons = []
+            if self.roi is not None:
+                roi = np.round(self.roi * scale).astype(np.int32)
+                cv2.fillPoly(mask, [roi], 255)
+                polygons.append(roi)
+                x, y, w, h = cv2.boundingRect(roi)
+                margin_x, margin_y = int(width * self.margin), int(height * self.margin)
+                crop = (max(0, x - margin_x), max(0, y - margin_y),
+                        min(width, x + w + margin_x), min(height, y + h + margin_y))
+            else:
+                mask[:] = 255
+                crop = (0, 0, width, height)
+            for polygon in self.exclusions:
+                excluded = np.round(polygon * scale).astype(np.int32)
+                cv2.fillPoly(mask, [excluded], 0)
+                polygons.append(excluded)
+            self.layouts[key] = (crop, mask, polygons)
+        return self.layouts[key]
+    
+    def contains(self, boxes, width, height):
+        """Indicar qué cajas (x, y, w, h) tienen su centro dentro del ROI y fuera de las exclusiones"""
+        _, mask, _ = self.layout(width, height)
+        boxes = np.asarray(boxes).reshape(-1, 4)
+        cx = np.clip(boxes[:, 0] + boxes[:, 2] // 2, 0, width - 1)
+        cy = np.clip(boxes[:, 1] + boxes[:, 3] // 2, 0, height - 1)
+        return mask[cy, cx] > 0
+    
+    def draw(self, frame):
+        """Dibujar el ROI (azul) y las exclusiones (gris) sobre el frame"""
+        _, _, polygons = self.layout(frame.shape[1], frame.shape[0])
+        for i, polygon in enumerate(polygons):
+            is_roi = i == 0 and self.roi is not None
+            cv2.polylines(frame, [polygon], True, (255, 128, 0) if is_roi else (128, 128, 128), 1)
+
+class HelmetDetector:
+    def __init__(self, helmet_palette=None, model_name="yolov3", input_size=416, model_cache_dir=None,
+                 download_options=None, head_classifier_path=None, load_model=True):
+        if model_name not in MODEL_REGISTRY:
+            raise ValueError(f"Modelo desconocido: {model_name}")
+        if input_size not in MODEL_REGISTRY[model_name]["input_sizes"]:
+            raise ValueError(f"Tamaño de entrada {input_size} no válido para {model_name}")
+        self.model_name = model_name
+        self.model_spec = MODEL_REGISTRY[model_name]
+        self.input_size = input_size
+        self.decoder = YOLO_DECODERS[self.model_spec["decoder"]]()
+        self.model_cache = ModelCache(model_cache_dir) if model_cache_dir else ModelCache()
+        download_options = dict(download_options or {})
+        # Variables de entorno para sitios sin internet (valen también en la app y en los procesos trabajadores)
+        if os.environ.get("HELMET_MODEL_MIRROR"):
+            download_options.setdefault("mirror_url", os.environ["HELMET_MODEL_MIRROR"])
+        if os.environ.get("HELMET_MODEL_CACHE"):
+            download_options.setdefault("shared_cache_dir", os.environ["HELMET_MODEL_CACHE"])
+        if os.environ.get("HELMET_MODEL_OFFLINE", "0") not in ("", "0"):
+            download_options.setdefault("offline", True)
+        # Los checksums del llamador se suman a los del registro (y pueden sustituirlos)
+        checksums = dict(self.model_spec.get("sha256", {}), **{"coco.names": COCO_NAMES_SHA256})
+        checksums.update(download_options.get("checksums") or {})
+        download_options["checksums"] = checksums
+        if self.model_spec["format"] == "darknet":
+            download_options.setdefault("weight_configs", {self.model_spec["weights"]: self.model_spec["config"]})
+        self.downloader = ModelDownloader(model_cache=self.model_cache, **download_options)
+        self.model_load_seconds = None
+        self.model_cache_hit = False
         self.is_detecting = False
         self.cap = None
         self.net = None
         self.output_layers = None
         self.classes = None
         self.colors = None
+        self.target_class_ids = None
         self.confidence_threshold = 0.5
         self.nms_threshold = 0.4
-        self.setup_logging()
-        self.load_yolo_model()
+        self.color_engine = HelmetColorEngine(helmet_palette)
+        self.face_cascade = None
+        self.basic_scale = 0.5  # Escala de la imagen para Haar Cascade
+        self.inference_lock = threading.Lock()  # La red se comparte entre hilos/cámaras
+        self.buffers = BufferPool()  # Blob y buffers intermedios reutilizados entre frames
+        self.metrics = METRICS
+        self.use_tracking = True  # Clasificar casco por persona seguida
+        self.trackers = {}  # cámara -> HelmetTracker
+        self.new_violations = {}  # cámara -> infracciones nuevas aún no consumidas
+        self.use_motion_gate = True  # Omitir YOLO en escenas estáticas
+        self.motion_gate_options = {}
+        self.motion_gates = {}  # cámara -> MotionGate
+        self.regions = {}  # cámara -> CameraRegions
+        self.use_tiling = False  # Modo alta resolución: mosaicos solapados con letterbox
+        self.tile_size = 2 * self.input_size  # Lado del mosaico en píxeles del frame
+        self.tile_overlap = 0.2
+        self.tile_grids = {}  # (ancho, alto) -> mosaicos
+        self.head_classifier = None  # Segunda etapa opcional; sin ella se usa la heurística de color
+        self.result_cache = None  # Caché opcional de resultados para frames casi idénticos
+        self.cache_per_roi = True  # Hash sobre el recorte del ROI: cambios fuera de él no invalidan
+        if load_model:
+            # Sin modelo ni logs (pruebas y benchmarks): detección básica hasta llamar a load_yolo_model()
+            self.setup_logging()
+            self.load_yolo_model()
+        if head_classifier_path:
+            self.load_head_classifier(head_classifier_path)
+        
+    def setup_logging(self):
+        """Configurar sistema de logs"""
+        if not os.path.exists('logs'):
+            os.makedirs('logs')
+            
+        log_filename = f"logs/helmet_detection_{datetime.now().strftime('%Y%m%d')}.log"
+        logging.basicConfig(
+            filename=log_filename,
+            level=logging.INFO,
+            format='%(asctime)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+        
+    def download_yolo_model(self):
+        """Descargar modelo YOLO si no existe o está incompleto"""
+        files = dict(self.model_spec["files"])
+        files['coco.names'] = COCO_NAMES_URL
+        return self.downloader.ensure(files)
+                    
+    def load_yolo_model(self):
+        """Cargar modelo YOLO para detección"""
+        try:
+            start = time.perf_counter()
+            weights_path = os.path.join("yolo_model", self.model_spec["weights"])
+            config_path = (os.path.join("yolo_model", self.model_spec["config"])
+                           if self.model_spec["config"] else None)
+            names_path = "yolo_model/coco.names"
+            
+            # Comprobar siempre los archivos: con el índice de checksums es local y no vuelve a calcular SHA-256
+            errors = self.download_yolo_model()
+            model_paths = [weights_path] + ([config_path] if config_path else []) + [names_path]
+            manifest = self.model_cache.lookup(self.model_name, model_paths)
+            
+            # Unos pesos que no se pudieron verificar no se pasan a OpenCV
+            usable = self.model_spec["weights"] not in errors and self.model_spec["config"] not in errors
+            if usable and os.path.exists(weights_path) and (config_path is None or os.path.exists(config_path)):
+                # Cargar red neuronal
+                self.net = self.model_cache.read_net(self.model_spec, weights_path, config_path)
+                
+                if manifest is not None:
+                    self.output_layers = manifest["output_layers"]
+                    self.classes = manifest["classes"]
+                else:
+                    self.output_layers = list(self.net.getUnconnectedOutLayersNames())
+                    
+                    # Cargar clases
+                    if os.path.exists(names_path):
+                        with open(names_path, "r") as f:
+                            self.classes = [line.strip() for line in f.readlines()]
+                    else:
+                        # Clases básicas si no se puede cargar el archivo
+                        self.classes = ["person", "helmet"]
+                    
+                    self.model_cache.store(self.model_name, model_paths, {
+                        "format": self.model_spec["format"],
+                        "output_layers": self.output_layers,
+                        "classes": self.classes,
+                    })
+                    
+                self.colors = np.random.uniform(0, 255, size=(len(self.classes), 3))
+                
+                # Clases que interesan al detector (persona y casco)
+                self.target_class_ids = np.array([
+                    i for i, name in enumerate(self.classes)
+                    if name == "person" or "helmet" in name.lower()
+                ], dtype=np.int64)
+                
+                self.model_load_seconds = time.perf_counter() - start
+                self.model_cache_hit = manifest is not None
+                print(f"Modelo {self.model_name} ({self.input_size}x{self.input_size}) cargado en "
+                      f"{self.model_load_seconds:.2f} s "
+                      f"({'caché caliente' if self.model_cache_hit else 'arranque en frío'})")
+            else:
+                print("No se pudo cargar el modelo YOLO, usando detección básica")
+                self.net = None
+                
+        except Exception as e:
+            print(f"Error cargando modelo YOLO: {e}")
+            self.net = None
+    
+    def load_head_classifier(self, model_path, **options):
+        """Cargar el clasificador CNN de cabezas (si falla se mantiene la heurística de color)"""
+        try:
+            self.head_classifier = HeadClassifier(model_path, **options)
+            print(f"Clasificador de cabezas cargado: {model_path}")
+        except Exception as e:
+            self.head_classifier = None
+            print(f"No se pudo cargar el clasificador de cabezas, se usa la heurística de color: {e}")
+        return self.head_classifier
+    
+    def load_face_cascade(self):
+        """Cargar Haar Cascade de rostros una sola vez"""
+        if self.face_cascade is None:
+            self.face_cascade = cv2.CascadeClassifier(
+                cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+            )
+        return self.face_cascade
+    
+    def detect_helmet_basic(self, frame, camera_id="default"):
+        """Detección básica usando características simples"""
+        start = time.perf_counter()
+        
+        # Convertir a escala de grises reducida para acelerar Haar Cascade
+        gray = self.buffers.get("basic_gray", frame.shape[:2])
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        if self.basic_scale != 1.0:
+            size = (max(1, int(frame.shape[1] * self.basic_scale)), max(1, int(frame.shape[0] * self.basic_scale)))
+            small = self.buffers.get("basic_small", (size[1], size[0]))
+            gray = cv2.resize(gray, size, dst=small, interpolation=cv2.INTER_AREA)
+        
+        # Detectar rostros usando Haar Cascade
+        faces = self.load_face_cascade().detectMultiScale(gray, 1.1, 4)
+        self.metrics.observe("inference", camera_id, time.perf_counter() - start)
+        start = time.perf_counter()
+        
+        helmet_detected = False
+        violations = 0
+        
+        for face in faces:
+            x, y, w, h = (int(v / self.basic_scale) for v in face)
+            
+            # Área arriba de la cara donde estaría el casco
+            helmet_region = frame[max(0, y-50):y+20, x:x+w]
+            
+            if helmet_region.size > 0:
+                # Análisis de color con los rangos precalculados de la paleta
+                face_helmet = self.color_engine.has_helmet_color(helmet_region, 0.3)
+                helmet_detected = helmet_detected or face_helmet
+                violations += 0 if face_helmet else 1
+                        
+                # Dibujar rectángulo alrededor de la cara
+                color = (0, 255, 0) if face_helmet else (0, 0, 255)
+                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+        
+        self.metrics.observe("postprocess", camera_id, time.perf_counter() - start)
+        self.metrics.inc("people", camera_id, len(faces))
+        self.count_violations(camera_id, violations)
+        return frame, helmet_detected
+    
+    def detect_helmet_yolo(self, frame, camera_id="default"):
+        """Detección usando YOLO"""
+        if self.needs_tiling(frame, camera_id):
+            return self.detect_helmet_tiled(frame, camera_id)
+        start = time.perf_counter()
+        crop, _, input_size = self.crop_to_roi(frame, camera_id)
+        outs = self.forward_yolo([crop], input_size)[0]
+        self.metrics.observe("inference", camera_id, time.perf_counter() - start)
+        return self.postprocess_yolo(frame, outs, camera_id)
+    
+    def needs_tiling(self, frame, camera_id="default"):
+        """Indicar si el frame (o su recorte de ROI) es grande para el modo alta resolución"""
+        if not self.use_tiling:
+            return False
+        crop, _, _ = self.crop_to_roi(frame, camera_id)
+        return max(crop.shape[:2]) > self.tile_size
+    
+    def tile_grid(self, width, height):
+        """Mosaicos (x, y, w, h): el frame completo más una rejilla solapada de tile_size"""
+        key = (width, height)
+        if key not in self.tile_grids:
+            size = self.tile_size
+            stride = max(1, int(size * (1.0 - self.tile_overlap)))
+            
+            def starts(length):
+                if length <= size:
+                    return [0]
+                positions = list(range(0, length - size + 1, stride))
+                if positions[-1] + size < length:
+                    positions.append(length - size)  # Último mosaico alineado al borde
+                return positions
+            
+            # El mosaico global conserva a las personas grandes que no caben en uno solo
+            tiles = [(0, 0, width, height)]
+            tiles += [(x, y, min(size, width), min(size, height)) for y in starts(height) for x in starts(width)]
+            self.tile_grids[key] = tiles
+        return self.tile_grids[key]
+    
+    def letterbox_tiles(self, frame, tiles):
+        """Escalar cada mosaico sin deformar, alineado arriba a la izquierda y con relleno negro"""
+        size = self.input_size
+        batch = self.buffers.get(f"tiles{len(tiles)}x{size}", (len(tiles), size, size, 3))
+        for i, (x, y, w, h) in enumerate(tiles):
+            scale = size / max(w, h)
+            scaled_w, scaled_h = max(1, min(size, round(w * scale))), max(1, min(size, round(h * scale)))
+            cv2.resize(frame[y:y + h, x:x + w], (scaled_w, scaled_h), dst=batch[i, :scaled_h, :scaled_w],
+                       interpolation=cv2.INTER_AREA)
+            batch[i, scaled_h:] = 0
+            batch[i, :scaled_h, scaled_w:] = 0
+        return batch
+    
+    def tiled_detections(self, frame):
+        """Detectar en todos los mosaicos con una sola pasada y devolver cajas en coordenadas del frame"""
+        tiles = self.tile_grid(frame.shape[1], frame.shape[0])
+        batch = self.letterbox_tiles(frame, tiles)
+        tile_outs = self.forward_yolo(list(batch))
+        
+        parts = []
+        for (x, y, w, h), outs in zip(tiles, tile_outs):
+            # Con letterbox arriba a la izquierda la entrada equivale a un cuadrado de lado max(w, h)
+            side = max(w, h)
+            boxes, confidences, class_ids = self.decode_yolo_outputs(outs, side, side)
+            boxes[:, 0] += x
+            boxes[:, 1] += y
+            parts.append((boxes, confidences, class_ids))
+        boxes = np.concatenate([part[0] for part in parts])
+        confidences = np.concatenate([part[1] for part in parts])
+        class_ids = np.concatenate([part[2] for part in parts])
+        return boxes, confidences, class_ids, len(tiles)
+    
+    def detect_helmet_tiled(self, frame, camera_id="default"):
+        """Detección en alta resolución por mosaicos con NMS entre mosaicos"""
+        start = time.perf_counter()
+        crop, offset, _ = self.crop_to_roi(frame, camera_id)
+        boxes, confidences, class_ids, tiles = self.tiled_detections(crop)
+        self.metrics.observe("inference", camera_id, time.perf_counter() - start)
+        self.metrics.inc("input_pixels", camera_id, tiles * self.input_size * self.input_size)
+        job = self.prepare_detections(frame, boxes, confidences, class_ids, offset, camera_id, start)
+        self.classify_jobs([job])
+        return self.complete_job(job)
+    
+    def set_regions(self, camera_id="default", roi=None, exclusions=None):
+        """Configurar ROI y zonas excluidas de una cámara (sin ninguno se procesa el frame completo)"""
+        if roi is None and not exclusions:
+            self.regions.pop(camera_id, None)
+        else:
+            self.regions[camera_id] = CameraRegions(roi, exclusions)
+        self.reset_state(camera_id)
+        
+    def crop_to_roi(self, frame, camera_id="default"):
+        """Recortar a la caja del ROI y elegir el menor tamaño de entrada que conserva la resolución"""
+        regions = self.regions.get(camera_id)
+        if regions is None:
+            return frame, (0, 0), self.input_size
+        height, width = frame.shape[:2]
+        (x0, y0, x1, y1), _, _ = regions.layout(width, height)
+        
+        # Con un recorte menor basta una entrada menor para la misma densidad de píxeles
+        needed = self.input_size * max((x1 - x0) / width, (y1 - y0) / height)
+        fits = [size for size in self.model_spec["input_sizes"] if needed <= size <= self.input_size]
+        return frame[y0:y1, x0:x1], (x0, y0), min(fits) if fits else self.input_size
+    
+    def build_blob(self, frames, size=None):
+        """Preparar el blob NCHW en un buffer reutilizado (equivale a blobFromImages con swapRB)"""
+        size = size or self.input_size
+        blob = self.buffers.get(f"blob{len(frames)}x{size}", (len(frames), 3, size, size), np.float32)
+        buffer = self.buffers.get(f"blob_resized{size}", (size, size, 3))
+        for i, frame in enumerate(frames):
+            if frame.shape[:2] == (size, size):
+                resized = frame  # Mosaicos ya escalados con letterbox
+            else:
+                resized = cv2.resize(frame, (size, size), dst=buffer)
+            for channel in range(3):
+                # BGR -> RGB y escala a [0, 1] directamente sobre el blob
+                np.multiply(resized[:, :, 2 - channel], 0.00392, out=blob[i, channel], dtype=np.float32)
+        return blob
+    
+    def forward_yolo(self, frames, size=None):
+        """Ejecutar YOLO sobre un lote de frames en una sola pasada"""
+        # Preparar lote de imágenes para YOLO (buffers propios de cada hilo)
+        blob = self.build_blob(frames, size)
+        with self.inference_lock:
+            self.net.setInput(blob)
+            outs = self.net.forward(self.output_layers)
+        
+        # Separar las salidas de cada imagen del lote
+        batch = len(frames)
+        per_frame = [[] for _ in range(batch)]
+        for out in outs:
+            if out.ndim == 2:
+                out = out.reshape(batch, -1, out.shape[-1])
+            for i in range(batch):
+                per_frame[i].append(out[i])
+        return per_frame
+    
+    def postprocess_yolo(self, frame, outs, camera_id="default"):
+        """Decodificar, filtrar y dibujar las detecciones YOLO de un frame"""
+        job = self.prepare_yolo(frame, outs, camera_id)
+        self.classify_jobs([job])
+        return self.complete_job(job)
+    
+    def prepare_yolo(self, frame, outs, camera_id="default"):
+        """Decodificar las salidas de un frame y preparar su clasificación de casco"""
+        start = time.perf_counter()
+        crop, (x0, y0), input_size = self.crop_to_roi(frame, camera_id)
+        height, width = crop.shape[:2]
+        self.metrics.inc("input_pixels", camera_id, input_size * input_size)
+        self.metrics.inc("input_pixels_saved", camera_id, self.input_size ** 2 - input_size ** 2)
+        
+        # Decodificar salidas de la red (vectorizado)
+        boxes, confidences, class_ids = self.decode_yolo_outputs(outs, width, height, input_size)
+        return self.prepare_detections(frame, boxes, confidences, class_ids, (x0, y0), camera_id, start)
+    
+    def prepare_detections(self, frame, boxes, confidences, class_ids, offset, camera_id, start):
+        """Filtrar por ROI, aplicar NMS y reunir las regiones de cabeza a clasificar"""
+        # Volver a coordenadas del frame y descartar lo que cae fuera del ROI antes de analizar
+        regions = self.regions.get(camera_id)
+        if regions is not None:
+            boxes[:, 0] += offset[0]
+            boxes[:, 1] += offset[1]
+            inside = regions.contains(boxes, frame.shape[1], frame.shape[0])
+            self.metrics.inc("roi_excluded", camera_id, int(np.count_nonzero(~inside)))
+            boxes, confidences, class_ids = boxes[inside], confidences[inside], class_ids[inside]
+        
+        # Aplicar Non-Maximum Suppression (también une las cajas repetidas entre mosaicos)
+        indexes = cv2.dnn.NMSBoxes(boxes.tolist(), confidences.tolist(),
+                                   self.confidence_threshold, self.nms_threshold)
+        indexes = np.asarray(indexes, dtype=np.int64).flatten()
+        return self.prepare_classification(frame, boxes[indexes], class_ids[indexes], confidences[indexes],
+                                           camera_id, self.use_tracking, start)
+    
+    def prepare_classification(self, frame, boxes, class_ids=None, confidences=None, camera_id="default",
+                               tracking=False, start=None):
+        """Trabajo de clasificación de un frame: cajas o tracks y las regiones de cabeza pendientes"""
+        job = {"frame": frame, "camera_id": camera_id, "start": start, "boxes": boxes,
+               "class_ids": class_ids, "confidences": confidences, "tracks": None}
+        if tracking:
+            tracker = self.get_tracker(camera_id)
+            tracks, new_tracks = tracker.update(boxes)
+            # Solo se vuelve a analizar cada K frames o si la caja cambió mucho
+            targets = [track for track in tracks if tracker.needs_classification(track)]
+            job.update(tracks=tracks, new_tracks=new_tracks, targets=targets)
+            job["regions"] = [self.head_region(frame, track.box) for track in targets]
+        else:
+            job["regions"] = [self.head_region(frame, box) for box in boxes]
+        return job
+    
+    def head_region(self, frame, box):
+        """Región superior de la persona donde estaría el casco"""
+        x, y, w, h = (int(v) for v in box)
+        return frame[max(0, y-20):y+h//3, max(0, x):x+w]
+    
+    def classify_jobs(self, jobs):
+        """Clasificar en un solo lote las regiones de cabeza de varios frames (y cámaras)"""
+        regions = [region for job in jobs for region in job["regions"]]
+        verdicts = self.classify_helmet_regions(regions)
+        position = 0
+        for job in jobs:
+            count = len(job["regions"])
+            job["verdicts"] = verdicts[position:position + count]
+            position += count
+            if job["tracks"] is not None:
+                for track, verdict in zip(job["targets"], job["verdicts"]):
+                    track.add_vote(verdict)
+                    
+    def classify_helmet_regions(self, regions):
+        """Casco sí/no por región: clasificador CNN por lotes si está cargado, si no heurística de color"""
+        if self.head_classifier is not None and regions:
+            try:
+                return self.head_classifier.classify(regions)
+            except Exception as e:
+                print(f"Error en el clasificador de cabezas, se usa la heurística de color: {e}")
+        return [self.analyze_helmet_region(region) for region in regions]
+    
+    def complete_job(self, job):
+        """Dibujar resultados y registrar métricas de un frame ya clasificado"""
+        camera_id = job["camera_id"]
+        helmet_detected, people, violations = self.draw_job(job)
+        regions = self.regions.get(camera_id)
+        if regions is not None:
+            regions.draw(job["frame"])
+        
+        self.metrics.observe("postprocess", camera_id, time.perf_counter() - job["start"])
+        self.metrics.inc("people", camera_id, people)
+        self.count_violations(camera_id, violations)
+        return job["frame"], helmet_detected
+    
+    def count_violations(self, camera_id, violations):
+        """Registrar infracciones nuevas en métricas y en el contador pendiente de la cámara"""
+        self.metrics.inc("violations", camera_id, violations)
+        if violations:
+            self.new_violations[camera_id] = self.new_violations.get(camera_id, 0) + violations
+            
+    def take_violations(self, camera_id="default"):
+        """Consumir las infracciones nuevas contadas desde la última llamada"""
+        return self.new_violations.pop(camera_id, 0)
+    
+    def draw_job(self, job):
+        """Dibujar cajas o tracks clasificados; devuelve (casco, personas nuevas, infracciones)"""
+        frame = job["frame"]
+        helmet_detected = False
+        violations = 0
+        
+        if job["tracks"] is not None:
+            for track in job["tracks"]:
+                x, y, w, h = track.box
+                if track.helmet:
+                    helmet_detected = True
+                    color = (0, 255, 0)  # Verde
+                else:
+                    # Cada persona cuenta como una sola infracción, y solo con votos suficientes
+                    if not track.violation_counted and track.is_violation():
+                        track.violation_counted = True
+                        violations += 1
+                    color = (0, 0, 255)  # Rojo
+                    
+                cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+                cv2.putText(frame, f"ID {track.track_id}", (x, y - 10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            return helmet_detected, len(job["new_tracks"]), violations
+        
+        # Dibujar detecciones (solo quedan clases de interés: persona/casco)
+        for box, class_id, confidence, has_helmet in zip(job["boxes"], job["class_ids"], job["confidences"],
+                                                         job["verdicts"]):
+            x, y, w, h = (int(v) for v in box)
+            class_id = int(class_id)
+            label = str(self.classes[class_id]) if class_id < len(self.classes) else "unknown"
+            
+            if has_helmet:
+                helmet_detected = True
+                color = (0, 255, 0)  # Verde
+            else:
+                violations += 1
+                color = (0, 0, 255)  # Rojo
+                
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+            cv2.putText(frame, f"{label}: {float(confidence):.2f}", (x, y - 10), 
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        
+        return helmet_detected, len(job["boxes"]), violations
+    
+    def job_detections(self, job):
+        """Detecciones de un trabajo ya clasificado como diccionarios serializables a JSON"""
+        if job["tracks"] is not None:
+            return [{"box": [int(v) for v in track.box], "track_id": track.track_id,
+                     "helmet": bool(track.helmet)} for track in job["tracks"]]
+        detections = []
+        for box, class_id, confidence, has_helmet in zip(job["boxes"], job["class_ids"], job["confidences"],
+                                                         job["verdicts"]):
+            class_id = int(class_id)
+            detections.append({
+                "box": [int(v) for v in box],
+                "label": str(self.classes[class_id]) if class_id < len(self.classes) else "unknown",
+                "confidence": round(float(confidence), 3),
+                "helmet": bool(has_helmet),
+            })
+        return detections
+    
+    def classify_boxes(self, frame, boxes, class_ids, confidences):
+        """Analizar y dibujar cada caja del frame (sin seguimiento)"""
+        job = self.prepare_classification(frame, boxes, class_ids, confidences)
+        self.classify_jobs([job])
+        return self.draw_job(job)
+    
+    def get_tracker(self, camera_id="default"):
+        """Obtener (o crear) el tracker de una cámara"""
+        tracker = self.trackers.get(camera_id)
+        if tracker is None:
+            tracker = self.trackers[camera_id] = HelmetTracker()
+        return tracker
+    
+    def reset_state(self, camera_id="default"):
+        """Reiniciar seguimiento, compuerta de movimiento y caché (p. ej. al cambiar de video o imagen)"""
+        self.trackers.pop(camera_id, None)
+        self.motion_gates.pop(camera_id, None)
+        self.new_violations.pop(camera_id, None)
+        if self.result_cache is not None:
+            self.result_cache.clear(camera_id)
+    
+    def classify_tracks(self, frame, boxes, camera_id="default"):
+        """Clasificar casco por persona seguida, reutilizando resultados entre frames"""
+        job = self.prepare_classification(frame, boxes, camera_id=camera_id, tracking=True)
+        self.classify_jobs([job])
+        return self.draw_job(job)
+    
+    def decode_yolo_outputs(self, outs, width, height, input_size=None):
+        """Decodificar salidas YOLO en arrays (cajas, confianzas, clases)"""
+        # Normalizar la salida del modelo a cajas (cx, cy, w, h) relativas y puntuaciones
+        detections, scores = self.decoder.split(outs, input_size or self.input_size)
+        
+        best = scores.argmax(axis=1)
+        confidences = scores[np.arange(scores.shape[0]), best]
+        keep = confidences > self.confidence_threshold
+        
+        # Conservar solo las clases de interés antes de NMS
+        if self.target_class_ids is not None:
+            keep &= np.isin(best, self.target_class_ids)
+        
+        detections = detections[keep]
+        confidences = confidences[keep].astype(np.float32)
+        class_ids = best[keep]
+        
+        # Convertir centro/tamaño relativos a rectángulos en píxeles
+        w = (detections[:, 2] * width).astype(np.int32)
+        h = (detections[:, 3] * height).astype(np.int32)
+        x = ((detections[:, 0] * width).astype(np.int32) - w / 2).astype(np.int32)
+        y = ((detections[:, 1] * height).astype(np.int32) - h / 2).astype(np.int32)
+        boxes = np.stack([x, y, w, h], axis=1)
+        
+        return boxes, confidences, class_ids
+    
+    def analyze_helmet_region(self, region):
+        """Analizar región específica para detectar casco"""
+        # Verificar si algún color de casco cubre el 25% de la región
+        return self.color_engine.has_helmet_color(region, 0.25)
+    
+    def get_motion_gate(self, camera_id="default"):
+        """Obtener (o crear) la compuerta de movimiento de una cámara"""
+        gate = self.motion_gates.get(camera_id)
+        if gate is None:
+            gate = self.motion_gates[camera_id] = MotionGate(**self.motion_gate_options)
+        return gate
+    
+    def gate_frame(self, frame, camera_id="default"):
+        """Devolver el último resultado si la escena no cambió, o None si hay que detectar"""
+        if not self.use_motion_gate:
+            return None
+        gate = self.get_motion_gate(camera_id)
+        # Solo cuenta el movimiento dentro del recorte del ROI
+        if gate.should_run(self.crop_to_roi(frame, camera_id)[0]):
+            return None
+        self.metrics.inc("gated", camera_id)
+        return gate.last_result
+    
+    def remember_result(self, camera_id, result):
+        """Guardar resultado para reutilizarlo mientras la escena siga estática"""
+        if self.use_motion_gate:
+            # El frame pertenece al anillo de captura: conservar una copia en un buffer propio
+            gate = self.get_motion_gate(camera_id)
+            frame, helmet_detected = result
+            # Alternar dos buffers para no pisar el resultado que aún se esté mostrando
+            gate.result_slot ^= 1
+            kept = gate.buffers.get(f"result{gate.result_slot}", frame.shape, frame.dtype)
+            np.copyto(kept, frame)
+            gate.last_result = (kept, helmet_detected)
+        return result
+    
+    def enable_result_cache(self, per_roi=True, **options):
+        """Activar la caché de resultados por hash perceptual (opciones de ResultCache)"""
+        self.result_cache = ResultCache(metrics=self.metrics, **options)
+        self.cache_per_roi = per_roi
+        return self.result_cache
+    
+    def cached_result(self, frame, camera_id="default"):
+        """Buscar el frame en la caché: devuelve (resultado o None, hash para guardarlo después)"""
+        if self.result_cache is None:
+            return None, None
+        source = self.crop_to_roi(frame, camera_id)[0] if self.cache_per_roi else frame
+        frame_hash = self.result_cache.frame_hash(source)
+        return self.result_cache.get(camera_id, frame_hash), frame_hash
+    
+    def cache_result(self, camera_id, frame_hash, result, cost_s):
+        """Guardar una copia del resultado (el frame de entrada pertenece al anillo de captura)"""
+        if self.result_cache is not None and frame_hash is not None:
+            frame, helmet_detected = result
+            self.result_cache.put(camera_id, frame_hash, (frame.copy(), helmet_detected), cost_s, frame.nbytes)
+        return result
+    
+    def process_frame(self, frame, camera_id="default"):
+        """Procesar frame para detección de casco"""
+        try:
+            cached = self.gate_frame(frame, camera_id)
+            if cached is not None:
+                return cached
+            cached, frame_hash = self.cached_result(frame, camera_id)
+            if cached is not None:
+                return cached
+            start = time.perf_counter()
+            if self.net is not None:
+                result = self.detect_helmet_yolo(frame, camera_id)
+            else:
+                result = self.detect_helmet_basic(frame, camera_id)
+            self.metrics.inc("processed", camera_id)
+            self.cache_result(camera_id, frame_hash, result, time.perf_counter() - start)
+            return self.remember_result(camera_id, result)
+        except Exception as e:
+            print(f"Error procesando frame: {e}")
+            return frame, False
+    
+    def process_frames(self, frames, camera_ids=None):
+        """Procesar un lote de frames (p. ej. de varias cámaras) con una sola inferencia"""
+        camera_ids = camera_ids or ["default"] * len(frames)
+        if self.net is None or len(frames) == 1:
+            return [self.process_frame(frame, camera_id) for frame, camera_id in zip(frames, camera_ids)]
+        
+        # Solo entran al lote los frames con movimiento o con latido pendiente
+        results = [self.gate_frame(frame, camera_id) for frame, camera_id in zip(frames, camera_ids)]
+        # Los frames casi idénticos a uno ya procesado toman su resultado de la caché
+        hashes = {}
+        for i in [i for i, result in enumerate(results) if result is None]:
+            results[i], hashes[i] = self.cached_result(frames[i], camera_ids[i])
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        # Las cámaras en modo alta resolución ya agrupan sus mosaicos en su propio lote
+        for i in [i for i in pending if self.needs_tiling(frames[i], camera_ids[i])]:
+            pending.remove(i)
+            try:
+                start = time.perf_counter()
+                result = self.detect_helmet_tiled(frames[i], camera_ids[i])
+                self.cache_result(camera_ids[i], hashes[i], result, time.perf_counter() - start)
+                results[i] = self.remember_result(camera_ids[i], result)
+                self.metrics.inc("processed", camera_ids[i])
+            except Exception as e:
+                print(f"Error procesando frame: {e}")
+                results[i] = (frames[i], False)
+        if not pending:
+            return results
+        try:
+            start = time.perf_counter()
+            # Un lote por tamaño de entrada (las cámaras con ROI pueden usar uno menor)
+            groups = {}
+            for i in pending:
+                crop, _, input_size = self.crop_to_roi(frames[i], camera_ids[i])
+                groups.setdefault(input_size, []).append((i, crop))
+            batch_outs = {}
+            for input_size, members in groups.items():
+                outs = self.forward_yolo([crop for _, crop in members], input_size)
+                batch_outs.update(zip([i for i, _ in members], outs))
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            print(f"Error procesando lote: {e}")
+            for i in pending:
+                results[i] = (frames[i], False)
+            return results
         
-    def setup_logging(self):
-        """Configurar sistema de logs"""
-        if not os.path.exists('logs'):
-            os.makedirs('logs')
+        # Decodificar cada frame y clasificar las cabezas de todas las cámaras en un solo lote
+        jobs = {}
+        for i in pending:
+            frame, camera_id = frames[i], camera_ids[i]
+            self.metrics.observe("inference", camera_id, elapsed)
+            try:
+                jobs[i] = self.prepare_yolo(frame, batch_outs[i], camera_id)
+            except Exception as e:
+                print(f"Error procesando frame: {e}")
+                results[i] = (frame, False)
+        self.classify_jobs(list(jobs.values()))
+        
+        for i, job in jobs.items():
+            try:
+                result = self.complete_job(job)
+                # Coste por frame: su parte de la inferencia del lote más su posprocesado
+                cost = elapsed / len(pending) + time.perf_counter() - job["start"]
+                self.cache_result(job["camera_id"], hashes[i], result, cost)
+                results[i] = self.remember_result(job["camera_id"], result)
+                self.metrics.inc("processed", job["camera_id"])
+            except Exception as e:
+                print(f"Error procesando frame: {e}")
+                results[i] = (job["frame"], False)
+        return results
+
+class DropOldestQueue:
+    """Cola acotada que descarta el elemento más antiguo cuando está llena"""
+    
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.put_count = 0
+        self.drop_count = 0
+        self.closed = False
+        
+    def put(self, item):
+        """Insertar elemento descartando el más antiguo si no hay espacio"""
+        with self.condition:
+            dropped = None
+            if len(self.items) >= self.maxsize:
+                dropped = self.items.popleft()
+                self.drop_count += 1
+            self.items.append(item)
+            self.put_count += 1
+            self.condition.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
             
-        log_filename = f"logs/helmet_detection_{datetime.now().strftime('%Y%m%d')}.log"
-        logging.basicConfig(
-            filename=log_filename,
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+    def get(self, timeout=None):
+        """Obtener el siguiente elemento o None si se agota el tiempo o se cierra"""
+        with self.condition:
+            if not self.items and not self.closed:
+                self.condition.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
         
-    def download_yolo_model(self):
-        """Descargar modelo YOLO si no existe"""
-        model_dir = "yolo_model"
-        if not os.path.exists(model_dir):
-            os.makedirs(model_dir)
+    def close(self):
+        """Despertar a los consumidores bloqueados"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
             
-        files = {
-            'yolov3.weights': 'https://pjreddie.com/media/files/yolov3.weights',
-            'yolov3.cfg': 'https://raw.githubusercontent.com/pjreddie/darknet/master/cfg/yolov3.cfg',
-            'coco.names': 'https://raw.githubusercontent.com/pjreddie/darknet/master/data/coco.names'
-        }
+    def depth(self):
+        """Número de elementos en espera"""
+        with self.condition:
+            return len(self.items)
+    
+    def stats(self):
+        """Profundidad y contadores de la cola"""
+        with self.condition:
+            return {
+                "depth": len(self.items),
+                "maxsize": self.maxsize,
+                "put": self.put_count,
+                "dropped": self.drop_count,
+            }
+
+class PipelineStage:
+    """Etapa del pipeline ejecutada en su propio hilo"""
+    
+    def __init__(self, name, handler, input_queue=None, output_queue=None):
+        self.name = name
+        self.handler = handler
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.thread = None
+        self.processed = 0
+        self.errors = 0
+        self.avg_ms = 0.0
         
-        for filename, url in files.items():
-            filepath = os.path.join(model_dir, filename)
-            if not os.path.exists(filepath):
-                print(f"Descargando {filename}...")
-                try:
-                    response = requests.get(url, stream=True)
-                    with open(filepath, 'wb') as f:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            f.write(chunk)
-                except Exception as e:
-                    print(f"Error descargando {filename}: {e}")
+    def start(self, is_running):
+        """Iniciar hilo de la etapa"""
+        self.thread = threading.Thread(target=self.run, args=(is_running,), name=self.name)
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def run(self, is_running):
+        """Bucle de la etapa: consumir, procesar y publicar"""
+        while is_running():
+            try:
+                if self.input_queue is not None:
+                    item = self.input_queue.get(timeout=0.1)
+                    if item is None:
+                        continue
+                    start = time.perf_counter()
+                    result = self.handler(item)
+                else:
+                    start = time.perf_counter()
+                    result = self.handler()
                     
-    def load_yolo_model(self):
-        """Cargar modelo YOLO para detección"""
-        try:
-            # Intentar descargar modelo si no existe
-            self.download_yolo_model()
-            
-            # Cargar red neuronal
-            weights_path = "yolo_model/yolov3.weights"
-            config_path = "yolo_model/yolov3.cfg"
-            names_path = "yolo_model/coco.names"
-            
-            if os.path.exists(weights_path) and os.path.exists(config_path):
-                self.net = cv2.dnn.readNet(weights_path, config_path)
-                layer_names = self.net.getLayerNames()
-                self.output_layers = [layer_names[i - 1] for i in self.net.getUnconnectedOutLayers().flatten()]
+                if result is None:
+                    continue
+                    
+                # Media móvil exponencial del tiempo de la etapa
+                elapsed_ms = (time.perf_counter() - start) * 1000.0
+                self.avg_ms = elapsed_ms if self.processed == 0 else 0.9 * self.avg_ms + 0.1 * elapsed_ms
+                self.processed += 1
                 
-                # Cargar clases
-                if os.path.exists(names_path):
-                    with open(names_path, "r") as f:
-                        self.classes = [line.strip() for line in f.readlines()]
-                else:
-                    # Clases básicas si no se puede cargar el archivo
-                    self.classes = ["person", "helmet"]
+                if self.output_queue is not None:
+                    self.output_queue.put(result)
                     
-                self.colors = np.random.uniform(0, 255, size=(len(self.classes), 3))
-                print("Modelo YOLO cargado exitosamente")
-            else:
-                print("No se pudo cargar el modelo YOLO, usando detección básica")
-                self.net = None
+            except Exception as e:
+                self.errors += 1
+                print(f"Error en etapa {self.name}: {e}")
+                time.sleep(0.1)
                 
-        except Exception as e:
-            print(f"Error cargando modelo YOLO: {e}")
-            self.net = None
+    def stats(self):
+        """Estadísticas de la etapa"""
+        stats = {
+            "processed": self.processed,
+            "errors": self.errors,
+            "avg_ms": round(self.avg_ms, 2),
+        }
+        if self.input_queue is not None:
+            stats["queue"] = self.input_queue.stats()
+        return stats
+
+class FrameScheduler:
+    """Planificador de frames según presupuesto de latencia o FPS objetivo"""
     
-    def detect_helmet_basic(self, frame):
-        """Detección básica usando características simples"""
-        # Convertir a escala de grises
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    MODES = ("max_throughput", "fixed_fps", "lowest_latency")
+    
+    def __init__(self, mode="lowest_latency", target_fps=15.0, target_latency_ms=150.0):
+        self.lock = threading.Lock()
+        self.mode = None
+        self.set_mode(mode)
+        self.target_fps = target_fps
+        self.target_latency_ms = target_latency_ms
         
-        # Detectar rostros usando Haar Cascade
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        self.capture_interval_ms = 1000.0 / 30.0  # Estimación inicial (30 FPS)
+        self.inference_ms = 0.0
+        self.skip_interval = 0
+        self.frames_since_processed = 0
+        self.last_capture_time = None
         
-        helmet_detected = False
+        # Contadores de la ventana actual
+        self.window_start = time.perf_counter()
+        self.captured = 0
+        self.scheduled = 0
+        self.processed = 0
+        self.stale = 0
         
-        for (x, y, w, h) in faces:
-            # Área arriba de la cara donde estaría el casco
-            helmet_region = frame[max(0, y-50):y+20, x:x+w]
+    def set_mode(self, mode):
+        """Cambiar modo de planificación"""
+        if mode not in self.MODES:
+            raise ValueError(f"Modo de planificación desconocido: {mode}")
+        with self.lock:
+            self.mode = mode
+            self.frames_since_processed = 0
             
-            if helmet_region.size > 0:
-                # Análisis de color - buscar colores típicos de cascos
-                hsv = cv2.cvtColor(helmet_region, cv2.COLOR_BGR2HSV)
-                
-                # Rangos de colores para cascos (amarillo, blanco, naranja, etc.)
-                helmet_colors = [
-                    ([20, 100, 100], [30, 255, 255]),  # Amarillo
-                    ([0, 0, 200], [180, 30, 255]),     # Blanco
-                    ([10, 100, 100], [25, 255, 255])   # Naranja
-                ]
+    def update_skip_interval(self):
+        """Recalcular cuántos frames saltar entre frames procesados"""
+        if self.mode == "max_throughput":
+            self.skip_interval = 0
+        elif self.mode == "fixed_fps":
+            period_ms = 1000.0 / max(self.target_fps, 0.1)
+            self.skip_interval = max(0, int(round(period_ms / self.capture_interval_ms)) - 1)
+        else:
+            # Entregar frames al ritmo que la inferencia puede absorber sin cola
+            self.skip_interval = max(0, int(np.ceil(self.inference_ms / self.capture_interval_ms)) - 1)
+            
+    def should_process(self, captured_at):
+        """Registrar frame capturado e indicar si debe enviarse a inferencia"""
+        with self.lock:
+            self.captured += 1
+            if self.last_capture_time is not None:
+                interval_ms = (captured_at - self.last_capture_time) * 1000.0
+                self.capture_interval_ms = 0.9 * self.capture_interval_ms + 0.1 * interval_ms
+            self.last_capture_time = captured_at
+            
+            self.update_skip_interval()
+            if self.frames_since_processed < self.skip_interval:
+                self.frames_since_processed += 1
+                return False
+            self.frames_since_processed = 0
+            self.scheduled += 1
+            return True
+        
+    def is_stale(self, captured_at):
+        """Indicar si un frame ya excede el presupuesto de latencia"""
+        if self.mode != "lowest_latency":
+            return False
+        age_ms = (time.perf_counter() - captured_at) * 1000.0
+        # Un frame viejo solo se descarta si la inferencia cabe en el presupuesto
+        if age_ms + self.inference_ms > self.target_latency_ms and self.inference_ms < self.target_latency_ms:
+            with self.lock:
+                self.stale += 1
+            return True
+        return False
+        
+    def record_inference(self, elapsed_ms):
+        """Registrar tiempo real de inferencia de un frame"""
+        with self.lock:
+            self.processed += 1
+            self.inference_ms = elapsed_ms if self.inference_ms == 0.0 else 0.8 * self.inference_ms + 0.2 * elapsed_ms
+            
+    def snapshot(self):
+        """Devolver FPS capturados/procesados y ratio de salto, y reiniciar ventana"""
+        with self.lock:
+            now = time.perf_counter()
+            elapsed = max(now - self.window_start, 1e-6)
+            stats = {
+                "mode": self.mode,
+                "captured_fps": self.captured / elapsed,
+                "processed_fps": self.processed / elapsed,
+                "skip_ratio": 1.0 - self.scheduled / self.captured if self.captured else 0.0,
+                "skip_interval": self.skip_interval,
+                "inference_ms": self.inference_ms,
+                "stale": self.stale,
+            }
+            self.window_start = now
+            self.captured = 0
+            self.scheduled = 0
+            self.processed = 0
+            self.stale = 0
+            return stats
+
+class DetectionPipeline:
+    """Pipeline captura -> inferencia -> render conectado por colas acotadas"""
+    
+    def __init__(self, detector, on_result, scheduler=None, queue_size=1, camera_id="default"):
+        self.detector = detector
+        self.on_result = on_result
+        self.scheduler = scheduler or FrameScheduler()
+        self.camera_id = camera_id
+        self.metrics = detector.metrics
+        self.running = False
+        self.latency_ms = 0.0
+        
+        self.inference_queue = DropOldestQueue(queue_size, self.record_drop)
+        self.render_queue = DropOldestQueue(queue_size, self.record_drop)
+        # Un hueco por etapa y por cola; si se agotan, la captura descarta en la fuente
+        self.frames = FrameRing(3 + 2 * queue_size + 1)
+        self.stages = [
+            PipelineStage("captura", self.capture, output_queue=self.inference_queue),
+            PipelineStage("inferencia", self.infer, self.inference_queue, self.render_queue),
+            PipelineStage("render", self.render, self.render_queue),
+        ]
+        
+    def is_running(self):
+        """Indicar si el pipeline sigue activo"""
+        return self.running
+        
+    def start(self):
+        """Iniciar todas las etapas"""
+        self.running = True
+        # Las infracciones contadas antes de arrancar no deben disparar clips
+        self.detector.take_violations(self.camera_id)
+        for stage in self.stages:
+            stage.start(self.is_running)
+            
+    def stop(self):
+        """Detener etapas y esperar a que terminen"""
+        self.running = False
+        self.inference_queue.close()
+        self.render_queue.close()
+        for stage in self.stages:
+            if stage.thread is not None and stage.thread is not threading.current_thread():
+                stage.thread.join(timeout=1.0)
                 
-                for lower, upper in helmet_colors:
-                    mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-                    if cv2.countNonZero(mask) > helmet_region.shape[0] * helmet_region.shape[1] * 0.3:
-                        helmet_detected = True
-                        break
-                        
-                # Dibujar rectángulo alrededor de la cara
-                color = (0, 255, 0) if helmet_detected else (0, 0, 255)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+    def record_drop(self, item=None):
+        """Contabilizar frame descartado y devolver su hueco al anillo"""
+        self.metrics.inc("dropped", self.camera_id)
+        if item is not None:
+            self.frames.release(item["captured"])
+            # Las infracciones del frame descartado pasan al siguiente para no perder su clip
+            if item.get("violations"):
+                new_violations = self.detector.new_violations
+                new_violations[self.camera_id] = new_violations.get(self.camera_id, 0) + item["violations"]
+            
+    def capture(self):
+        """Etapa de captura: leer siempre el frame más reciente"""
+        start = time.perf_counter()
+        ret, frame = self.frames.read(self.detector.cap, timeout=0.1)
+        if not ret:
+            time.sleep(0.01)
+            return None
+        captured_at = time.perf_counter()
+        self.metrics.observe("capture", self.camera_id, captured_at - start)
+        self.metrics.inc("captured", self.camera_id)
+        if not self.scheduler.should_process(captured_at):
+            self.frames.release(frame)
+            return None
+        # "captured" conserva el hueco del anillo hasta que el render lo devuelve
+        return {"frame": frame, "captured": frame, "captured_at": captured_at}
+    
+    def infer(self, item):
+        """Etapa de inferencia: detectar casco en el frame"""
+        if self.scheduler.is_stale(item["captured_at"]):
+            self.record_drop(item)
+            return None
+        start = time.perf_counter()
+        processed_frame, helmet_detected = self.detector.process_frame(item["frame"], self.camera_id)
+        self.scheduler.record_inference((time.perf_counter() - start) * 1000.0)
+        item["frame"] = processed_frame
+        item["helmet_detected"] = helmet_detected
+        item["violations"] = self.detector.take_violations(self.camera_id)
+        return item
+    
+    def render(self, item):
+        """Etapa de render: entregar resultado a la interfaz"""
+        start = time.perf_counter()
+        try:
+            self.on_result(item["frame"], item["helmet_detected"], item["violations"])
+        finally:
+            # Quien necesite el frame después de on_result debe copiarlo
+            self.frames.release(item["captured"])
+        self.metrics.observe("ui_push", self.camera_id, time.perf_counter() - start)
+        latency_ms = (time.perf_counter() - item["captured_at"]) * 1000.0
+        self.latency_ms = 0.9 * self.latency_ms + 0.1 * latency_ms if self.latency_ms else latency_ms
+        return item
+    
+    def stats(self):
+        """Estadísticas por etapa y latencia extremo a extremo"""
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats["scheduler"] = self.scheduler.snapshot()
+        stats["latency_ms"] = round(self.latency_ms, 2)
+        return stats
+
+class CameraSource:
+    """Cámara individual que mantiene siempre su frame más reciente"""
+    
+    def __init__(self, camera_id, source, metrics=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.metrics = metrics or METRICS
+        self.cap = None
+        self.latest = DropOldestQueue(1, self.record_drop)
+        self.frames = FrameRing(4)  # Captura, cola, lote en inferencia y resultado entregado
+        self.thread = None
+        self.running = False
+        self.helmet_detected = None
+        self.last_change_time = None
+        self.processed = 0
+        
+    def open(self):
+        """Abrir la fuente de video (índice de cámara, archivo o URL)"""
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"No se pudo abrir la cámara {self.camera_id} ({self.source})")
+        return self
+        
+    def start(self):
+        """Iniciar hilo de captura"""
+        self.running = True
+        self.thread = threading.Thread(target=self.capture_loop, name=f"captura-{self.camera_id}")
+        self.thread.daemon = True
+        self.thread.start()
+        
+    def stop(self):
+        """Detener captura y liberar cámara"""
+        self.running = False
+        self.latest.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self.cap:
+            self.cap.release()
+            
+    def record_drop(self, item):
+        """Contabilizar frame reemplazado por uno más reciente y devolver su hueco"""
+        self.metrics.inc("dropped", self.camera_id)
+        self.release(item)
+        
+    def release(self, item):
+        """Devolver al anillo el hueco de un frame entregado por latest"""
+        self.frames.release(item["frame"])
+        
+    def capture_loop(self):
+        """Leer frames continuamente conservando solo el último"""
+        while self.running:
+            try:
+                start = time.perf_counter()
+                ret, frame = self.frames.read(self.cap, timeout=0.1)
+                if not ret:
+                    time.sleep(0.01)
+                    continue
+                captured_at = time.perf_counter()
+                self.metrics.observe("capture", self.camera_id, captured_at - start)
+                self.metrics.inc("captured", self.camera_id)
+                self.latest.put({"frame": frame, "captured_at": captured_at})
+            except Exception as e:
+                print(f"[{self.camera_id}] Error en captura: {e}")
+                time.sleep(0.1)
                 
-        return frame, helmet_detected
+    def stats(self):
+        """Estadísticas de la cámara"""
+        queue = self.latest.stats()
+        return {
+            "source": str(self.source),
+            "captured": queue["put"],
+            "dropped": queue["dropped"],
+            "processed": self.processed,
+            "helmet_detected": self.helmet_detected,
+        }
+
+class MultiCameraDetectorService:
+    """Servicio que comparte un único modelo entre varias cámaras con inferencia por lotes"""
     
-    def detect_helmet_yolo(self, frame):
-        """Detección usando YOLO"""
-        height, width, channels = frame.shape
+    def __init__(self, detector=None, sources=None, batch_size=8, on_result=None):
+        self.detector = detector or HelmetDetector()
+        self.batch_size = batch_size
+        self.on_result = on_result
+        self.cameras = {}
+        self.running = False
+        self.thread = None
+        self.batches = 0
+        for camera_id, source in (sources or {}).items():
+            self.add_camera(camera_id, source)
+            
+    def add_camera(self, camera_id, source, roi=None, exclusions=None):
+        """Registrar una fuente de video identificada por camera_id (con ROI y exclusiones opcionales)"""
+        if camera_id in self.cameras:
+            raise ValueError(f"La cámara {camera_id} ya está registrada")
+        if roi is not None or exclusions:
+            self.detector.set_regions(camera_id, roi, exclusions)
+        camera = CameraSource(camera_id, source, self.detector.metrics)
+        self.cameras[camera_id] = camera
+        if self.running:
+            camera.open().start()
+        return camera
+    
+    def start(self):
+        """Abrir cámaras e iniciar hilo de inferencia compartido"""
+        for camera in self.cameras.values():
+            camera.open().start()
+        self.running = True
+        self.thread = threading.Thread(target=self.inference_loop, name="inferencia-multicamara")
+        self.thread.daemon = True
+        self.thread.start()
         
-        # Preparar imagen para YOLO
-        blob = cv2.dnn.blobFromImage(frame, 0.00392, (416, 416), (0, 0, 0), True, crop=False)
-        self.net.setInput(blob)
-        outs = self.net.forward(self.output_layers)
+    def stop(self):
+        """Detener inferencia y cámaras"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        for camera in self.cameras.values():
+            camera.stop()
+            
+    def collect_frames(self):
+        """Tomar el frame más reciente de cada cámara que tenga uno nuevo"""
+        pending = []
+        for camera in list(self.cameras.values()):
+            item = camera.latest.get(timeout=0)
+            if item is not None:
+                pending.append((camera, item))
+        return pending
+    
+    def inference_loop(self):
+        """Bucle de inferencia: agrupar frames de varias cámaras en lotes"""
+        while self.running:
+            try:
+                pending = self.collect_frames()
+                if not pending:
+                    time.sleep(0.005)
+                    continue
+                for start in range(0, len(pending), self.batch_size):
+                    self.process_batch(pending[start:start + self.batch_size])
+            except Exception as e:
+                print(f"Error en inferencia multicámara: {e}")
+                time.sleep(0.1)
+                
+    def process_batch(self, batch):
+        """Ejecutar una inferencia por lote y repartir resultados por cámara"""
+        frames = [item["frame"] for _, item in batch]
+        camera_ids = [camera.camera_id for camera, _ in batch]
+        try:
+            results = self.detector.process_frames(frames, camera_ids)
+            self.batches += 1
+            self.deliver(batch, results)
+        finally:
+            for camera, item in batch:
+                camera.release(item)
+                
+    def deliver(self, batch, results):
+        """Repartir resultados por cámara (los frames solo son válidos durante on_result)"""
+        for (camera, item), (processed_frame, helmet_detected) in zip(batch, results):
+            camera.processed += 1
+            if helmet_detected != camera.helmet_detected:
+                camera.helmet_detected = helmet_detected
+                camera.last_change_time = time.time()
+                self.log_detection(camera.camera_id, helmet_detected)
+            if self.on_result:
+                start = time.perf_counter()
+                self.on_result(camera.camera_id, processed_frame, helmet_detected)
+                self.detector.metrics.observe("ui_push", camera.camera_id, time.perf_counter() - start)
+                
+    def log_detection(self, camera_id, helmet_detected):
+        """Registrar cambio de estado etiquetado por cámara"""
+        status = "CASCO_DETECTADO" if helmet_detected else "SIN_CASCO"
+        EVENT_LOG.record("detection", status, camera_id)
         
-        # Información de detecciones
-        class_ids = []
-        confidences = []
-        boxes = []
-        helmet_detected = False
+    def stats(self):
+        """Estadísticas por cámara y número de lotes ejecutados"""
+        return {
+            "batches": self.batches,
+            "cameras": {camera_id: camera.stats() for camera_id, camera in self.cameras.items()},
+        }
+
+def shared_memory_worker(shm_name, slots, shape, task_queue, result_queue, model_name, input_size, stateless):
+    """Proceso trabajador: modelo propio, frames leídos de memoria compartida y resultados compactos"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray((slots,) + tuple(shape), dtype=np.uint8, buffer=shm.buf)
+    detector = HelmetDetector(model_name=model_name, input_size=input_size)
+    if stateless:
+        # Los frames de una cámara se reparten entre trabajadores: sin seguimiento ni compuerta
+        detector.use_tracking = False
+        detector.use_motion_gate = False
+    result_queue.put(("ready", os.getpid()))
+    view = None
+    try:
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            slot, camera_id = task
+            start = time.perf_counter()
+            view = frames[slot]
+            processed, helmet_detected = detector.process_frame(view, camera_id)
+            if processed is not view:
+                np.copyto(view, processed)  # Resultado reutilizado por la compuerta: dejarlo en el hueco
+            result_queue.put(("result", slot, bool(helmet_detected), (time.perf_counter() - start) * 1000.0,
+                              os.getpid()))
+    finally:
+        del view, frames
+        shm.close()
+
+class SharedMemoryDetectorService:
+    """Captura en el proceso principal e inferencia en procesos trabajadores vía huecos de memoria compartida"""
+    
+    def __init__(self, sources=None, workers=2, frame_shape=(480, 640, 3), slots=None, model_name="yolov3",
+                 input_size=416, sticky=True, on_result=None, metrics=None):
+        self.workers = workers
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots or 2 * workers + 2  # Un hueco en cada trabajador, otro en cola y margen
+        self.model_name = model_name
+        self.input_size = input_size
+        # sticky: cada cámara va siempre al mismo trabajador (conserva seguimiento y compuerta)
+        self.sticky = sticky
+        self.on_result = on_result  # on_result(camera_id, frame, casco): el frame solo vale durante la llamada
+        self.metrics = metrics or METRICS
+        self.cameras = {}
+        self.shm = None
+        self.frames = None
+        self.free_slots = queue.Queue()
+        self.in_flight = {}  # hueco -> (cámara, id de frame, instante de envío, trabajador)
+        self.lock = threading.Lock()
+        self.processes = []
+        self.task_queues = []
+        self.result_queue = None
+        self.threads = []
+        self.running = False
+        self.frame_ids = {}
+        self.delivered = {}  # cámara -> último id de frame entregado
+        self.next_worker = 0
+        self.latencies = deque(maxlen=2000)
+        self.worker_stats = {}
+        self.completed = 0
+        self.dropped = 0
+        self.started_at = None
+        for camera_id, source in (sources or {}).items():
+            self.add_camera(camera_id, source)
+            
+    def add_camera(self, camera_id, source):
+        """Registrar una fuente de video"""
+        if camera_id in self.cameras:
+            raise ValueError(f"La cámara {camera_id} ya está registrada")
+        camera = CameraSource(camera_id, source, self.metrics)
+        self.cameras[camera_id] = camera
+        if self.running:
+            camera.open().start()
+        return camera
+    
+    def start(self, timeout=120.0):
+        """Crear la memoria compartida, lanzar trabajadores y esperar a que carguen el modelo"""
+        frame_bytes = int(np.prod(self.frame_shape))
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * frame_bytes)
+        self.frames = np.ndarray((self.slots,) + self.frame_shape, dtype=np.uint8, buffer=self.shm.buf)
+        for slot in range(self.slots):
+            self.free_slots.put(slot)
+            
+        # spawn: el proceso principal tiene hilos (Flet, cámaras) y fork no es seguro
+        context = multiprocessing.get_context("spawn")
+        self.result_queue = context.Queue()
+        for _ in range(self.workers):
+            task_queue = context.Queue()
+            process = context.Process(
+                target=shared_memory_worker,
+                args=(self.shm.name, self.slots, self.frame_shape, task_queue, self.result_queue,
+                      self.model_name, self.input_size, not self.sticky),
+                daemon=True,
+            )
+            process.start()
+            self.task_queues.append(task_queue)
+            self.processes.append(process)
         
-        # Procesar detecciones
-        for out in outs:
-            for detection in out:
-                scores = detection[5:]
-                class_id = np.argmax(scores)
-                confidence = scores[class_id]
+        ready = 0
+        deadline = time.monotonic() + timeout
+        while ready < self.workers:
+            message = self.result_queue.get(timeout=max(0.1, deadline - time.monotonic()))
+            if message[0] == "ready":
+                ready += 1
+                self.worker_stats[message[1]] = {"frames": 0, "total_ms": 0.0}
+                
+        self.running = True
+        self.started_at = time.perf_counter()
+        for camera in self.cameras.values():
+            camera.open().start()
+        for target, name in ((self.dispatch_loop, "despacho-shm"), (self.result_loop, "resultados-shm")):
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+        return self
+    
+    def choose_worker(self, camera_id):
+        """Trabajador fijo por cámara (sticky) o rotación entre todos"""
+        if self.sticky:
+            return sum(camera_id.encode()) % self.workers
+        worker = self.next_worker
+        self.next_worker = (self.next_worker + 1) % self.workers
+        return worker
+    
+    def submit(self, camera_id, frame, block=False):
+        """Copiar un frame a un hueco libre y encolar solo su índice; sin hueco libre se descarta"""
+        try:
+            slot = self.free_slots.get(block=block, timeout=5.0 if block else None)
+        except queue.Empty:
+            self.dropped += 1
+            self.metrics.inc("dropped", camera_id)
+            return False
+        view = self.frames[slot]
+        if frame.shape == view.shape:
+            np.copyto(view, frame)
+        else:
+            cv2.resize(frame, (view.shape[1], view.shape[0]), dst=view)
+        
+        frame_id = self.frame_ids.get(camera_id, 0) + 1
+        self.frame_ids[camera_id] = frame_id
+        worker = self.choose_worker(camera_id)
+        with self.lock:
+            self.in_flight[slot] = (camera_id, frame_id, time.perf_counter(), worker)
+        self.task_queues[worker].put((slot, camera_id))
+        return True
+    
+    def dispatch_loop(self):
+        """Enviar el frame más reciente de cada cámara a los trabajadores"""
+        while self.running:
+            sent = False
+            for camera in list(self.cameras.values()):
+                item = camera.latest.get(timeout=0)
+                if item is not None:
+                    try:
+                        sent = self.submit(camera.camera_id, item["frame"]) or sent
+                    finally:
+                        camera.release(item)  # submit ya copió el frame a memoria compartida
+            if not sent:
+                time.sleep(0.002)
                 
-                if confidence > self.confidence_threshold:
-                    # Coordenadas del objeto
-                    center_x = int(detection[0] * width)
-                    center_y = int(detection[1] * height)
-                    w = int(detection[2] * width)
-                    h = int(detection[3] * height)
+    def result_loop(self):
+        """Recibir resultados compactos, entregar el frame anotado y liberar su hueco"""
+        while self.running or self.in_flight:
+            try:
+                message = self.result_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if message[0] != "result":
+                continue
+            _, slot, helmet_detected, processing_ms, pid = message
+            with self.lock:
+                camera_id, frame_id, submitted_at, _ = self.in_flight.pop(slot)
+            latency = time.perf_counter() - submitted_at
+            self.latencies.append(latency * 1000.0)
+            self.completed += 1
+            stats = self.worker_stats.setdefault(pid, {"frames": 0, "total_ms": 0.0})
+            stats["frames"] += 1
+            stats["total_ms"] += processing_ms
+            self.metrics.observe("inference", camera_id, processing_ms / 1000.0)
+            self.metrics.inc("processed", camera_id)
+            
+            # Con varios trabajadores los resultados pueden llegar desordenados: solo se entrega el más nuevo
+            camera = self.cameras.get(camera_id)
+            if frame_id > self.delivered.get(camera_id, 0):
+                self.delivered[camera_id] = frame_id
+                if camera is not None:
+                    camera.processed += 1
+                    if helmet_detected != camera.helmet_detected:
+                        camera.helmet_detected = helmet_detected
+                        camera.last_change_time = time.time()
+                        EVENT_LOG.record("detection", "CASCO_DETECTADO" if helmet_detected else "SIN_CASCO",
+                                         camera_id)
+                if self.on_result:
+                    try:
+                        self.on_result(camera_id, self.frames[slot], helmet_detected)
+                    except Exception as e:
+                        print(f"[{camera_id}] Error entregando resultado: {e}")
+            self.free_slots.put(slot)
+            
+    def stop(self):
+        """Detener cámaras y trabajadores y liberar la memoria compartida"""
+        for camera in self.cameras.values():
+            camera.stop()
+        self.running = False
+        for task_queue in self.task_queues:
+            task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        self.in_flight.clear()
+        self.frames = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+            
+    def stats(self):
+        """Rendimiento total, latencia p50/p99 y tiempo medio por trabajador"""
+        latencies = sorted(self.latencies)
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 2) if latencies else 0.0
+        
+        return {
+            "workers": self.workers,
+            "completed": self.completed,
+            "dropped": self.dropped,
+            "throughput_fps": round(self.completed / elapsed, 2) if elapsed else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p99_ms": percentile(0.99),
+            "per_worker_ms": {pid: round(s["total_ms"] / s["frames"], 2) if s["frames"] else 0.0
+                              for pid, s in self.worker_stats.items()},
+        }
+
+class PreviewStreamer:
+    """Vista previa JPEG con tasa propia, servida como MJPEG o imagen binaria por HTTP"""
+    
+    def __init__(self, size=(400, 300), max_fps=10.0, quality=80, host="127.0.0.1", port=9109):
+        self.size = size
+        self.max_fps = max_fps
+        self.encode_params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        self.host = host
+        self.port = port
+        self.condition = threading.Condition()
+        self.viewers = set()
+        self.jpeg = None
+        self.sequence = 0
+        self.last_publish = 0.0
+        self.resized = None  # Buffer reutilizado para el redimensionado
+        self.encoded = 0
+        self.skipped = 0
+        self.httpd = None
+        self.thread = None
+        
+    def add_viewer(self, viewer_id):
+        """Registrar un espectador (ventana de la app o cliente MJPEG)"""
+        with self.condition:
+            self.viewers.add(viewer_id)
+            
+    def remove_viewer(self, viewer_id):
+        """Quitar un espectador"""
+        with self.condition:
+            self.viewers.discard(viewer_id)
+            
+    def has_viewers(self):
+        """Indicar si alguien está mirando la vista previa"""
+        with self.condition:
+            return bool(self.viewers)
+        
+    def publish(self, frame):
+        """Codificar el frame si hay espectadores y toca según la tasa; devuelve la secuencia o None"""
+        now = time.perf_counter()
+        if not self.has_viewers() or now - self.last_publish < 1.0 / self.max_fps:
+            self.skipped += 1
+            return None
+        self.last_publish = now
+        
+        if self.resized is None:
+            self.resized = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        cv2.resize(frame, self.size, dst=self.resized, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(".jpg", self.resized, self.encode_params)
+        if not ok:
+            return None
+        
+        with self.condition:
+            self.jpeg = encoded.tobytes()
+            self.sequence += 1
+            self.encoded += 1
+            self.condition.notify_all()
+            return self.sequence
+        
+    def wait_frame(self, last_sequence, timeout=1.0):
+        """Esperar un frame más nuevo que last_sequence"""
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != last_sequence, timeout)
+            return self.sequence, self.jpeg
+        
+    def url(self, sequence=None):
+        """URL de la última imagen (la secuencia evita la caché del cliente)"""
+        suffix = f"?seq={sequence}" if sequence is not None else ""
+        return f"http://{self.host}:{self.port}/preview.jpg{suffix}"
+    
+    def start(self):
+        """Iniciar servidor HTTP de vista previa en segundo plano"""
+        streamer = self
+        
+        class PreviewHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/preview.jpg":
+                    self.send_snapshot()
+                elif path == "/stream.mjpg":
+                    self.send_stream()
+                else:
+                    self.send_error(404)
                     
-                    # Coordenadas del rectángulo
-                    x = int(center_x - w / 2)
-                    y = int(center_y - h / 2)
+            def send_snapshot(self):
+                with streamer.condition:
+                    jpeg = streamer.jpeg
+                if jpeg is None:
+                    self.send_error(503)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(jpeg)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(jpeg)
+                
+            def send_stream(self):
+                viewer_id = f"mjpeg-{id(self)}"
+                streamer.add_viewer(viewer_id)
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+                    self.send_header("Cache-Control", "no-store")
+                    self.end_headers()
+                    sequence = None
+                    while True:
+                        new_sequence, jpeg = streamer.wait_frame(sequence)
+                        if jpeg is None or new_sequence == sequence:
+                            continue
+                        sequence = new_sequence
+                        self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\n")
+                        self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # El cliente cerró la conexión
+                finally:
+                    streamer.remove_viewer(viewer_id)
                     
-                    boxes.append([x, y, w, h])
-                    confidences.append(float(confidence))
-                    class_ids.append(class_id)
-        
-        # Aplicar Non-Maximum Suppression
-        indexes = cv2.dnn.NMSBoxes(boxes, confidences, self.confidence_threshold, self.nms_threshold)
-        
-        # Dibujar detecciones
-        if len(indexes) > 0:
-            for i in indexes.flatten():
-                x, y, w, h = boxes[i]
-                label = str(self.classes[class_ids[i]]) if class_ids[i] < len(self.classes) else "unknown"
-                confidence = confidences[i]
+            def log_message(self, format, *args):
+                pass  # Evitar escribir cada petición en stdout
                 
-                # Verificar si es una persona y buscar casco
-                if label == "person" or "helmet" in label.lower():
-                    # Analizar región superior para casco
-                    helmet_region = frame[max(0, y-20):y+h//3, x:x+w]
-                    if self.analyze_helmet_region(helmet_region):
-                        helmet_detected = True
-                        color = (0, 255, 0)  # Verde
-                    else:
-                        color = (0, 0, 255)  # Rojo
-                        
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
-                    cv2.putText(frame, f"{label}: {confidence:.2f}", (x, y - 10), 
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-        
-        return frame, helmet_detected
+        self.httpd = ThreadingHTTPServer((self.host, self.port), PreviewHandler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="vista-previa")
+        self.thread.daemon = True
+        self.thread.start()
+        print(f"Vista previa disponible en http://{self.host}:{self.port}/stream.mjpg")
+        return self
     
-    def analyze_helmet_region(self, region):
-        """Analizar región específica para detectar casco"""
-        if region.size == 0:
-            return False
+    def stop(self):
+        """Detener servidor"""
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
             
-        # Análisis de color y textura
-        hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+    def stats(self):
+        """Frames codificados y omitidos"""
+        return {"encoded": self.encoded, "skipped": self.skipped, "viewers": len(self.viewers)}
+
+class ViolationRecorder:
+    """Clips de infracción: anillo de frames reducidos previos + segundos posteriores, escritos en segundo plano"""
+    
+    def __init__(self, output_dir="capturas", pre_seconds=5.0, post_seconds=5.0, fps=10.0, scale=0.5,
+                 max_pending=4, camera_id="default"):
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fps = fps  # Frames guardados por segundo (acota memoria y tamaño del clip)
+        self.scale = scale
+        self.camera_id = camera_id
+        self.slots = [None] * max(1, int(round(pre_seconds * fps)))
+        self.times = [0.0] * len(self.slots)
+        self.index = 0
+        self.filled = 0
+        self.last_push = 0.0
+        self.active = None  # Infracción que sigue recogiendo frames posteriores
+        self.snapshot_requested = False
+        self.jobs = queue.Queue(max_pending)
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.clips = 0
+        self.snapshots = 0
+        self.dropped = 0
         
-        # Detectar colores típicos de cascos
-        helmet_masks = []
-        
-        # Amarillo
-        lower_yellow = np.array([20, 100, 100])
-        upper_yellow = np.array([30, 255, 255])
-        helmet_masks.append(cv2.inRange(hsv, lower_yellow, upper_yellow))
-        
-        # Blanco
-        lower_white = np.array([0, 0, 200])
-        upper_white = np.array([180, 30, 255])
-        helmet_masks.append(cv2.inRange(hsv, lower_white, upper_white))
-        
-        # Naranja
-        lower_orange = np.array([10, 100, 100])
-        upper_orange = np.array([25, 255, 255])
-        helmet_masks.append(cv2.inRange(hsv, lower_orange, upper_orange))
-        
-        # Verificar si algún color de casco está presente
-        total_pixels = region.shape[0] * region.shape[1]
-        for mask in helmet_masks:
-            helmet_pixels = cv2.countNonZero(mask)
-            if helmet_pixels > total_pixels * 0.25:  # 25% de la región
-                return True
+    def push(self, frame):
+        """Añadir el frame procesado al anillo (reducido y a tasa limitada); nunca bloquea"""
+        if self.snapshot_requested:
+            # Captura manual: exactamente el frame que se está mostrando
+            self.snapshot_requested = False
+            self.submit({"kind": "snapshot", "frame": frame.copy(), "wall_time": time.time()})
+            
+        now = time.monotonic()
+        if now - self.last_push < 1.0 / self.fps:
+            return
+        self.last_push = now
+        
+        size = (max(1, int(frame.shape[1] * self.scale)), max(1, int(frame.shape[0] * self.scale)))
+        slot = self.slots[self.index]
+        if slot is None or slot.shape[:2] != (size[1], size[0]):
+            slot = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            self.slots[self.index] = slot
+        cv2.resize(frame, size, dst=slot, interpolation=cv2.INTER_AREA)
+        self.times[self.index] = now
+        self.index = (self.index + 1) % len(self.slots)
+        self.filled = min(self.filled + 1, len(self.slots))
+        
+        if self.active is not None:
+            self.active["frames"].append((now, slot.copy()))
+            if now - self.active["started"] >= self.post_seconds:
+                job, self.active = self.active, None
+                self.submit(job)
                 
-        return False
+    def trigger(self, frame):
+        """Iniciar un clip de infracción con los frames previos y el frame clave anotado"""
+        if self.active is not None:
+            return False  # Ya se está grabando una infracción
+        now = time.monotonic()
+        frames = []
+        for offset in range(self.filled, 0, -1):
+            i = (self.index - offset) % len(self.slots)
+            if now - self.times[i] <= self.pre_seconds:
+                frames.append((self.times[i], self.slots[i].copy()))
+        self.active = {
+            "kind": "clip",
+            "frames": frames,
+            "keyframe": frame.copy(),
+            "started": now,
+            "wall_time": time.time(),
+        }
+        return True
     
-    def process_frame(self, frame):
-        """Procesar frame para detección de casco"""
+    def request_snapshot(self):
+        """Guardar el próximo frame procesado como imagen"""
+        self.snapshot_requested = True
+        
+    def flush(self):
+        """Entregar al escritor el clip en curso aunque no haya terminado"""
+        if self.active is not None:
+            job, self.active = self.active, None
+            self.submit(job)
+            
+    def submit(self, job):
+        """Encolar un trabajo para el escritor; si va atrasado se descarta"""
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name=f"clips-{self.camera_id}")
+                    self.thread.daemon = True
+                    self.thread.start()
+                    atexit.register(self.close)
         try:
-            if self.net is not None:
-                return self.detect_helmet_yolo(frame)
-            else:
-                return self.detect_helmet_basic(frame)
+            self.jobs.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+            print(f"[{self.camera_id}] Escritor de clips saturado, se descarta un {job['kind']}")
+            
+    def run(self):
+        """Hilo escritor: codificar y guardar clips e imágenes"""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                if job["kind"] == "clip":
+                    self.write_clip(job)
+                else:
+                    self.write_snapshot(job)
+            except Exception as e:
+                print(f"Error guardando {job['kind']}: {e}")
+                
+    def file_prefix(self, name, wall_time):
+        """Ruta base con cámara y fecha"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.fromtimestamp(wall_time).strftime('%Y%m%d_%H%M%S')
+        camera = "" if self.camera_id == "default" else f"{self.camera_id}_"
+        return os.path.join(self.output_dir, f"{name}_{camera}{stamp}")
+    
+    def write_clip(self, job):
+        """Escribir el clip MP4 y el frame clave anotado"""
+        prefix = self.file_prefix("infraccion", job["wall_time"])
+        keyframe_path = prefix + "_clave.jpg"
+        cv2.imwrite(keyframe_path, job["keyframe"], [int(cv2.IMWRITE_JPEG_QUALITY), 95])
+        
+        clip_path = None
+        frames = job["frames"]
+        if frames:
+            # FPS real del clip según las marcas de tiempo guardadas
+            duration = frames[-1][0] - frames[0][0]
+            fps = (len(frames) - 1) / duration if duration > 0 else self.fps
+            height, width = frames[0][1].shape[:2]
+            clip_path = prefix + ".mp4"
+            writer = cv2.VideoWriter(clip_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            for _, frame in frames:
+                writer.write(frame)
+            writer.release()
+            
+        self.clips += 1
+        print(f"Clip de infracción guardado: {clip_path or keyframe_path}")
+        EVENT_LOG.record("violation_clip", "SIN_CASCO", self.camera_id, path=clip_path, keyframe=keyframe_path)
+        
+    def write_snapshot(self, job):
+        """Guardar una captura manual"""
+        filename = self.file_prefix("captura", job["wall_time"]) + ".jpg"
+        cv2.imwrite(filename, job["frame"])
+        self.snapshots += 1
+        print(f"Imagen guardada: {filename}")
+        EVENT_LOG.record("capture", camera_id=self.camera_id, path=filename)
+        
+    def close(self, timeout=10.0):
+        """Terminar el clip en curso, escribir lo pendiente y detener el hilo"""
+        self.flush()
+        if self.thread is None:
+            return
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+        
+    def stats(self):
+        """Clips, capturas y trabajos descartados"""
+        return {"clips": self.clips, "snapshots": self.snapshots, "dropped": self.dropped,
+                "recording": self.active is not None}
+
+class StatusHysteresis:
+    """Estado estable: solo cambia tras N frames consecutivos con el mismo valor"""
+    
+    def __init__(self, frames=3):
+        self.frames = frames
+        self.value = None
+        self.candidate = None
+        self.count = 0
+        self.suppressed = 0
+        
+    def update(self, value):
+        """Registrar un frame y devolver el estado estable"""
+        if value == self.value:
+            self.candidate = None
+            self.count = 0
+            return self.value
+        if value != self.candidate:
+            self.candidate = value
+            self.count = 0
+        self.count += 1
+        if self.value is None or self.count >= self.frames:
+            self.value = value
+            self.candidate = None
+            self.count = 0
+        else:
+            self.suppressed += 1
+        return self.value
+    
+    def reset(self):
+        """Olvidar el estado (p. ej. al reiniciar la detección)"""
+        self.value = None
+        self.candidate = None
+        self.count = 0
+
+class UIUpdateScheduler:
+    """Agrupa los cambios de controles Flet en como máximo un envío por tick de pantalla"""
+    
+    def __init__(self, page, fps=15.0, lag_factor=1.0):
+        self.page = page
+        self.interval = 1.0 / fps
+        self.lag_factor = lag_factor  # Envío más lento que interval * factor = cliente atrasado
+        self.lock = threading.Lock()
+        self.pending = {}  # id(control) -> (control, descartable)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_push_s = 0.0
+        self.requested = 0
+        self.pushes = 0
+        self.coalesced = 0
+        self.dropped = 0
+        
+    def request(self, control, droppable=False):
+        """Marcar un control como modificado; se enviará en el próximo tick"""
+        with self.lock:
+            self.requested += 1
+            key = id(control)
+            if key in self.pending or self.pending:
+                self.coalesced += 1
+            previous = self.pending.get(key)
+            # Un control es descartable solo si todas sus peticiones lo son
+            self.pending[key] = (control, droppable and (previous is None or previous[1]))
+            
+    def start(self):
+        """Iniciar hilo de envíos periódicos"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="ui-updates")
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        """Detener el hilo y enviar lo pendiente"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        self.flush()
+        
+    def run(self):
+        """Bucle de ticks de pantalla"""
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+            
+    def flush(self):
+        """Enviar en una sola actualización todos los controles pendientes"""
+        with self.lock:
+            if not self.pending:
+                return
+            lagging = self.last_push_s > self.interval * self.lag_factor
+            controls = []
+            for control, droppable in self.pending.values():
+                if lagging and droppable:
+                    self.dropped += 1  # El siguiente frame traerá un valor más nuevo
+                else:
+                    controls.append(control)
+            self.pending.clear()
+            
+        if not controls:
+            # Sin nada que enviar, el próximo tick vuelve a medir al cliente
+            self.last_push_s = 0.0
+            return
+        start = time.perf_counter()
+        try:
+            self.page.update(*controls)
         except Exception as e:
-            print(f"Error procesando frame: {e}")
-            return frame, False
+            print(f"Error actualizando interfaz: {e}")
+        self.last_push_s = time.perf_counter() - start
+        self.pushes += 1
+        
+    def stats(self):
+        """Peticiones, envíos reales, peticiones agrupadas y descartadas"""
+        with self.lock:
+            return {
+                "requested": self.requested,
+                "pushes": self.pushes,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+                "last_push_ms": round(self.last_push_s * 1000.0, 2),
+            }
 
 class HelmetDetectorApp:
-    def __init__(self):
-        self.detector = HelmetDetector()
+    def __init__(self, metrics_port=9108, model_name="yolov3", input_size=416, auto_start=True,
+                 preview_port=9109, preview_fps=10.0, ui_fps=15.0, status_hysteresis=3,
+                 clip_pre_seconds=5.0, clip_post_seconds=5.0):
+        # El detector (modelo y OpenCV) se carga en segundo plano tras pintar la ventana
+        self.detector = None
+        self.model_name = model_name
+        self.input_size = input_size
+        self.auto_start = auto_start
+        self.loader_thread = None
+        self.startup_times = {}
+        self.preview_port = preview_port
+        self.preview_fps = preview_fps
+        self.preview = None
+        self.ui_fps = ui_fps
+        self.ui = None
+        self.status = StatusHysteresis(status_hysteresis)
+        self.recorder = ViolationRecorder(pre_seconds=clip_pre_seconds, post_seconds=clip_post_seconds)
+        self.metrics_server = None
+        if metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(METRICS, port=metrics_port).start()
+            except OSError as e:
+                print(f"No se pudo iniciar el servidor de métricas: {e}")
         self.page = None
         self.camera_view = None
         self.status_text = None
         self.status_icon = None
         self.start_stop_btn = None
-        self.detection_thread = None
+        self.pipeline = None
+        self.scheduler = FrameScheduler()
+        self.fps_start_time = time.time()
         self.last_detection_result = False
         self.last_detection_time = time.time()
         
     def create_placeholder_image(self):
         """Crear imagen placeholder cuando no hay cámara activa"""
-        try:
-            # Crear imagen simple de 400x300 con texto
-            img = Image.new('RGB', (400, 300), color='#2d2d2d')
-            
-            # Convertir a base64
-            img_buffer = io.BytesIO()
-            img.save(img_buffer, format='JPEG')
-            img_str = base64.b64encode(img_buffer.getvalue()).decode()
-            
-            return img_str
-        except Exception as e:
-            print(f"Error creando placeholder: {e}")
-            # Imagen base64 mínima de 1x1 pixel como fallback
-            return "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+        # Imagen del color de fondo; se escala dentro del contenedor
+        return PLACEHOLDER_IMAGE_BASE64
     
     def main(self, page: ft.Page):
         self.page = page
+        self.ui = UIUpdateScheduler(page, self.ui_fps).start()
         page.title = "Detector de Casco de Seguridad"
         page.theme_mode = ft.ThemeMode.DARK
         page.bgcolor = "#1a1a1a"
         page.vertical_alignment = ft.MainAxisAlignment.START
         page.horizontal_alignment = ft.CrossAxisAlignment.CENTER
         page.padding = 20
+        page.on_disconnect = self.on_page_disconnect
         
         # Barra superior
         header = ft.Container(
@@ -318,7 +3478,7 @@ class HelmetDetectorApp:
         )
         
         self.status_text = ft.Text(
-            "Presiona Iniciar para comenzar",
+            "⏳ Cargando modelo...",
             size=18,
             color="#888888",
             text_align=ft.TextAlign.CENTER
@@ -341,7 +3501,8 @@ class HelmetDetectorApp:
             bgcolor="#4CAF50",
             color="#ffffff",
             width=200,
-            height=50
+            height=50,
+            disabled=True
         )
         
         capture_btn = ft.ElevatedButton(
@@ -354,6 +3515,19 @@ class HelmetDetectorApp:
             height=50
         )
         
+        # Modo de planificación de frames
+        mode_dropdown = ft.Dropdown(
+            label="Modo de procesamiento",
+            value=self.scheduler.mode,
+            options=[
+                ft.dropdown.Option("lowest_latency", "Menor latencia"),
+                ft.dropdown.Option("fixed_fps", f"FPS fijo ({self.scheduler.target_fps:.0f})"),
+                ft.dropdown.Option("max_throughput", "Máximo rendimiento")
+            ],
+            on_change=self.change_scheduler_mode,
+            width=420
+        )
+        
         buttons_row = ft.Row([
             self.start_stop_btn,
             capture_btn
@@ -364,19 +3538,60 @@ class HelmetDetectorApp:
             header,
             camera_container,
             status_container,
-            buttons_row
+            buttons_row,
+            mode_dropdown
         ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=20)
         
         page.add(main_column)
         page.update()
+        self.record_startup("window")
+        
+        # Cargar modelo sin bloquear la interfaz
+        self.loader_thread = threading.Thread(target=self.load_detector, name="carga-modelo")
+        self.loader_thread.daemon = True
+        self.loader_thread.start()
+        
+    def on_page_disconnect(self, e):
+        """Dejar de codificar la vista previa si la ventana se desconecta"""
+        if self.preview:
+            self.preview.remove_viewer("app")
+        
+    def record_startup(self, milestone):
+        """Registrar tiempo desde el arranque del proceso hasta un hito"""
+        if milestone not in self.startup_times:
+            self.startup_times[milestone] = time.perf_counter() - APP_START_TIME
+            print(f"Arranque: {milestone} en {self.startup_times[milestone]:.2f} s")
+        
+    def load_detector(self):
+        """Cargar detector en segundo plano y arrancar la detección al terminar"""
+        try:
+            self.detector = HelmetDetector(model_name=self.model_name, input_size=self.input_size)
+        except Exception as e:
+            self.show_error(f"Error cargando modelo: {e}")
+            return
+        self.record_startup("model_ready")
+        
+        self.start_stop_btn.disabled = False
+        self.status_text.value = "Presiona Iniciar para comenzar"
+        self.page.update()
+        
+        if self.auto_start:
+            self.start_detection()
         
     def toggle_detection(self, e):
         """Iniciar/detener detección"""
+        if self.detector is None:
+            return
         if not self.detector.is_detecting:
             self.start_detection()
         else:
             self.stop_detection()
     
+    def change_scheduler_mode(self, e):
+        """Cambiar modo de planificación de frames"""
+        self.scheduler.set_mode(e.control.value)
+        print(f"Modo de procesamiento: {e.control.value}")
+    
     def start_detection(self):
         """Iniciar detección"""
         try:
@@ -398,10 +3613,19 @@ class HelmetDetectorApp:
             self.start_stop_btn.bgcolor = "#F44336"
             self.page.update()
             
-            # Iniciar hilo de detección
-            self.detection_thread = threading.Thread(target=self.detection_loop)
-            self.detection_thread.daemon = True
-            self.detection_thread.start()
+            # La ventana cuenta como espectador mientras la detección esté activa
+            if self.preview is None:
+                self.start_preview()
+            self.preview.add_viewer("app")
+            
+            # Iniciar pipeline captura -> inferencia -> render
+            self.status.reset()
+            self.last_detection_result = None
+            self.fps_start_time = time.time()
+            self.scheduler.snapshot()
+            self.pipeline = DetectionPipeline(self.detector, self.handle_detection_result,
+                                              self.scheduler)
+            self.pipeline.start()
             
             print("Detección iniciada")
             
@@ -412,8 +3636,18 @@ class HelmetDetectorApp:
         """Detener detección"""
         self.detector.is_detecting = False
         
+        if self.pipeline:
+            self.pipeline.stop()
+            self.pipeline = None
+        
         if self.detector.cap:
             self.detector.cap.release()
+        
+        if self.preview:
+            self.preview.remove_viewer("app")
+        
+        # Entregar al escritor el clip que estuviera grabándose
+        self.recorder.flush()
             
         # Actualizar UI
         self.start_stop_btn.text = "Iniciar Detección"
@@ -426,81 +3660,85 @@ class HelmetDetectorApp:
         self.status_icon.color = "#888888"
         
         # Restaurar imagen placeholder
+        self.camera_view.src = None
         self.camera_view.src_base64 = self.create_placeholder_image()
         
         self.page.update()
         print("Detección detenida")
     
-    def detection_loop(self):
-        """Bucle principal de detección"""
-        frame_count = 0
-        fps_start_time = time.time()
+    def handle_detection_result(self, processed_frame, helmet_detected, violations=0):
+        """Publicar resultado de detección en la interfaz (etapa de render)"""
+        self.record_startup("first_detection")
         
-        while self.detector.is_detecting:
-            try:
-                ret, frame = self.detector.cap.read()
-                if not ret:
-                    continue
-                
-                # Procesar cada 2 frames para mejor rendimiento
-                if frame_count % 2 == 0:
-                    # Procesar detección
-                    processed_frame, helmet_detected = self.detector.process_frame(frame)
-                    
-                    # Actualizar estado si cambió
-                    if helmet_detected != self.last_detection_result:
-                        self.last_detection_result = helmet_detected
-                        self.last_detection_time = time.time()
-                        self.update_detection_status(helmet_detected)
-                        self.log_detection(helmet_detected)
-                    
-                    # Convertir frame a base64 para mostrar
-                    self.update_camera_view(processed_frame)
-                
-                frame_count += 1
-                
-                # Calcular FPS cada segundo
-                if time.time() - fps_start_time >= 1.0:
-                    fps = frame_count / (time.time() - fps_start_time)
-                    print(f"FPS: {fps:.1f}")
-                    frame_count = 0
-                    fps_start_time = time.time()
-                
-                # Pequeña pausa para no sobrecargar el sistema
-                time.sleep(0.033)  # ~30 FPS
-                
-            except Exception as e:
-                print(f"Error en bucle de detección: {e}")
-                time.sleep(0.1)
+        # Anillo de frames previos para los clips de infracción (copia reducida, no bloquea)
+        self.recorder.push(processed_frame)
+        
+        # Actualizar estado solo cuando se mantiene varios frames (histéresis)
+        helmet_detected = self.status.update(helmet_detected)
+        if helmet_detected != self.last_detection_result:
+            self.last_detection_result = helmet_detected
+            self.last_detection_time = time.time()
+            self.update_detection_status(helmet_detected)
+            self.log_detection(helmet_detected)
+        if violations:
+            # Solo una persona recién contada como infracción abre un clip (no la escena vacía)
+            # El clip se codifica y escribe en el hilo del grabador
+            self.recorder.trigger(processed_frame)
+        
+        # Publicar vista previa (limitada a sus propios FPS)
+        self.update_camera_view(processed_frame)
+        
+        # Calcular FPS y estado del pipeline cada segundo
+        elapsed = time.time() - self.fps_start_time
+        if elapsed >= 1.0 and self.pipeline:
+            stats = self.pipeline.stats()
+            scheduler = stats["scheduler"]
+            ui = self.ui.stats()
+            print(f"FPS procesados: {scheduler['processed_fps']:.1f} | "
+                  f"FPS capturados: {scheduler['captured_fps']:.1f} | "
+                  f"Salto: {scheduler['skip_ratio']:.0%} | "
+                  f"Latencia: {stats['latency_ms']:.1f} ms | "
+                  f"Descartes inferencia/render: "
+                  f"{stats['inferencia']['queue']['dropped']}/{stats['render']['queue']['dropped']} | "
+                  f"UI agrupadas/descartadas: {ui['coalesced']}/{ui['dropped']}")
+            self.fps_start_time = time.time()
+    
+    def start_preview(self):
+        """Iniciar servidor de vista previa (si falla se usa base64 como respaldo)"""
+        self.preview = PreviewStreamer(max_fps=self.preview_fps, port=self.preview_port)
+        if self.preview_port is None:
+            return
+        try:
+            self.preview.start()
+        except OSError as e:
+            print(f"No se pudo iniciar la vista previa HTTP, se usará base64: {e}")
     
     def update_camera_view(self, frame):
         """Actualizar vista de cámara"""
         try:
-            # Redimensionar frame para mejor rendimiento
-            frame_resized = cv2.resize(frame, (400, 300))
-            
-            # Convertir a formato RGB
-            frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
-            
-            # Convertir a PIL Image
-            pil_image = Image.fromarray(frame_rgb)
-            
-            # Convertir a base64
-            img_buffer = io.BytesIO()
-            pil_image.save(img_buffer, format='JPEG', quality=85)
-            img_str = base64.b64encode(img_buffer.getvalue()).decode()
+            # Codificar solo si hay espectadores y respetando los FPS de vista previa
+            sequence = self.preview.publish(frame)
+            if sequence is None or not self.camera_view:
+                return
             
-            # Actualizar imagen en UI
-            if self.camera_view:
-                self.camera_view.src_base64 = img_str
-                self.camera_view.update()
+            if self.preview.httpd:
+                # El cliente descarga el JPEG binario; solo viaja la URL
+                self.camera_view.src = self.preview.url(sequence)
+                self.camera_view.src_base64 = None
+            else:
+                with self.preview.condition:
+                    jpeg = self.preview.jpeg
+                self.camera_view.src_base64 = base64.b64encode(jpeg).decode()
+            # Se envía en el próximo tick; si el cliente va atrasado se descarta
+            self.ui.request(self.camera_view, droppable=True)
             
         except Exception as e:
             print(f"Error actualizando vista de cámara: {e}")
             # Usar imagen placeholder en caso de error
             if self.camera_view:
+                self.camera_view.src = None
                 self.camera_view.src_base64 = self.create_placeholder_image()
-                self.camera_view.update()
+                self.ui.request(self.camera_view)
     
     def update_detection_status(self, helmet_detected):
         """Actualizar estado de detección en UI"""
@@ -516,7 +3754,8 @@ class HelmetDetectorApp:
                 self.status_icon.name = ft.icons.WARNING
                 self.status_icon.color = "#F44336"
                 
-            self.page.update()
+            self.ui.request(self.status_text)
+            self.ui.request(self.status_icon)
             
         except Exception as e:
             print(f"Error actualizando estado: {e}")
@@ -524,28 +3763,13 @@ class HelmetDetectorApp:
     def log_detection(self, helmet_detected):
         """Registrar detección en logs"""
         status = "CASCO_DETECTADO" if helmet_detected else "SIN_CASCO"
-        logging.info(f"Detección: {status}")
+        EVENT_LOG.record("detection", status)
         
     def capture_image(self, e):
         """Capturar imagen actual"""
-        if self.detector.cap and self.detector.is_detecting:
-            try:
-                ret, frame = self.detector.cap.read()
-                if ret:
-                    # Crear directorio de capturas
-                    if not os.path.exists('capturas'):
-                        os.makedirs('capturas')
-                    
-                    # Guardar imagen
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                    filename = f"capturas/captura_{timestamp}.jpg"
-                    cv2.imwrite(filename, frame)
-                    
-                    print(f"Imagen guardada: {filename}")
-                    logging.info(f"Captura guardada: {filename}")
-                    
-            except Exception as e:
-                print(f"Error capturando imagen: {e}")
+        if self.detector and self.detector.is_detecting:
+            # Se guarda el próximo frame procesado en el hilo de render, sin volver a leer la cámara
+            self.recorder.request_snapshot()
     
     def show_error(self, message):
         """Mostrar mensaje de error"""
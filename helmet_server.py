@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Servicio HTTP de detección de casco para otros sistemas (torniquetes, control de acceso)
+Agrupa las peticiones concurrentes en micro-lotes para que una sola pasada de la red atienda a varias
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from helmet_detector import HelmetDetector, ResultCache, MODEL_REGISTRY
+
+IMAGE_TYPES = ("image/jpeg", "image/jpg", "image/png")
+RAW_TYPE = "application/octet-stream"
+
+
+class HTTPError(Exception):
+    """Error con código HTTP que se devuelve al cliente como JSON"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def decode_frame(body, content_type, headers):
+    """Convertir el cuerpo de la petición (JPEG/PNG o frame BGR crudo) en un frame"""
+    if content_type in IMAGE_TYPES:
+        frame = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise HTTPError(400, "No se pudo decodificar la imagen")
+        return frame
+    if content_type == RAW_TYPE:
+        try:
+            width, height = int(headers["x-frame-width"]), int(headers["x-frame-height"])
+        except (KeyError, ValueError):
+            raise HTTPError(400, "Los frames crudos requieren X-Frame-Width y X-Frame-Height")
+        if width <= 0 or height <= 0 or len(body) != width * height * 3:
+            raise HTTPError(400, f"Se esperaban {width}x{height}x3 bytes BGR, llegaron {len(body)}")
+        # Copia escribible: las cajas se dibujan sobre el frame
+        return np.frombuffer(body, dtype=np.uint8).reshape(height, width, 3).copy()
+    raise HTTPError(415, f"Tipo de contenido no admitido: {content_type or 'ninguno'}")
+
+
+def percentile(values, p):
+    """Percentil de una lista ya ordenada"""
+    return round(values[min(len(values) - 1, int(p * len(values)))], 2) if values else 0.0
+
+
+class DetectionServer:
+    """Servidor asyncio: /detect encola frames y un lotificador los procesa en micro-lotes"""
+
+    def __init__(self, detector=None, host="127.0.0.1", port=9110, max_batch=8, max_wait_ms=10.0,
+                 max_queue=64, max_body=20 * 1024 * 1024, camera_id="api", cache=None):
+        self.detector = detector or HelmetDetector()
+        # Cada petición es independiente: sin seguimiento ni compuerta de movimiento entre ellas
+        self.detector.use_tracking = False
+        self.detector.use_motion_gate = False
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.camera_id = camera_id
+        self.cache = cache  # ResultCache opcional: envíos repetidos no vuelven a pasar por la red
+        # La red se usa desde un único hilo; la decodificación de imágenes va en paralelo
+        self.inference = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inferencia-api")
+        self.decoders = ThreadPoolExecutor(max_workers=2, thread_name_prefix="decodificacion-api")
+        self.loop = None
+        self.queue = None
+        self.stop_event = None
+        self.ready = threading.Event()
+        self.thread = None
+        self.latencies = deque(maxlen=10000)
+        self.batch_sizes = deque(maxlen=1000)
+        self.requests = 0
+        self.in_flight = 0  # Peticiones admitidas aún sin responder (decodificando, en cola o en la red)
+        self.rejected = 0
+        self.errors = 0
+        self.started_at = None
+
+    async def serve(self):
+        """Atender peticiones hasta que se llame a stop()"""
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.stop_event = asyncio.Event()
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.started_at = time.perf_counter()
+        batcher = asyncio.ensure_future(self.batch_loop())
+        print(f"Servicio de detección en http://{self.host}:{self.port}/detect")
+        self.ready.set()
+        try:
+            await self.stop_event.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            batcher.cancel()
+            self.inference.shutdown(wait=True)
+            self.decoders.shutdown(wait=True)
+
+    def start(self):
+        """Iniciar el servidor en un hilo en segundo plano (útil para pruebas de carga locales)"""
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.serve()), name="servicio-api")
+        self.thread.daemon = True
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        """Detener el servidor"""
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+
+    async def handle_connection(self, reader, writer):
+        """Atender una conexión HTTP/1.1 (con keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    await self.send(writer, 400, {"error": "Petición mal formada"}, keep_alive=False)
+                    break
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                length = headers.get("content-length", "") or "0"
+                if not (length.isascii() and length.isdigit()):
+                    # Longitud no numérica o negativa: no se sabe dónde acaba el cuerpo
+                    await self.send(writer, 400, {"error": "Content-Length no válido"}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > self.max_body:
+                    await self.send(writer, 413, {"error": "Cuerpo demasiado grande"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload, extra = 200, await self.route(method, target, headers, body), {}
+                except HTTPError as e:
+                    status, payload, extra = e.status, {"error": str(e)}, e.headers
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error atendiendo petición: {e}")
+                    status, payload, extra = 500, {"error": "Error interno"}, {}
+                await self.send(writer, status, payload, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Cliente desconectado o servidor deteniéndose con conexiones keep-alive abiertas
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, payload, headers=None, keep_alive=True):
+        """Escribir una respuesta JSON"""
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   415: "Unsupported Media Type", 429: "Too Many Requests", 500: "Internal Server Error"}
+        lines = [f"HTTP/1.1 {status} {reasons.get(status, 'Error')}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(body)}",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def route(self, method, target, headers, body):
+        """Despachar la petición según ruta y método"""
+        path = target.split("?")[0]
+        if path == "/detect" and method == "POST":
+            return await self.detect(headers, body)
+        if path == "/stats" and method == "GET":
+            return self.stats()
+        if path == "/health" and method == "GET":
+            return {"status": "ok", "queue": self.queue.qsize(), "in_flight": self.in_flight}
+        raise HTTPError(404, f"Ruta no encontrada: {method} {path}")
+
+    async def detect(self, headers, body):
+        """Decodificar, encolar y esperar el resultado del micro-lote"""
+        received = time.perf_counter()
+        self.requests += 1
+        # Contrapresión: se cuentan las peticiones admitidas, no la cola, porque la decodificación
+        # previa es asíncrona y muchas podrían pasar la comprobación antes de encolarse
+        if self.in_flight >= self.max_queue:
+            self.rejected += 1
+            raise HTTPError(429, "Servicio saturado, reintenta más tarde", {"Retry-After": "1"})
+        self.in_flight += 1
+        try:
+            content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            frame = await self.loop.run_in_executor(self.decoders, decode_frame, body, content_type, headers)
+
+            future = self.loop.create_future()
+            await self.queue.put((frame, future))
+            helmet_detected, detections, batch_size = await future
+        finally:
+            self.in_flight -= 1
+        latency_ms = (time.perf_counter() - received) * 1000.0
+        self.latencies.append(latency_ms)
+        return {
+            "helmet_detected": helmet_detected,
+            "people": len(detections),
+            "violations": sum(1 for detection in detections if not detection["helmet"]),
+            "detections": detections,
+            "batch_size": batch_size,
+            "latency_ms": round(latency_ms, 2),
+        }
+
+    async def batch_loop(self):
+        """Reunir peticiones hasta max_batch o hasta agotar la ventana de espera y procesarlas juntas"""
+        while True:
+            batch = [await self.queue.get()]
+            deadline = self.loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await self.loop.run_in_executor(self.inference, self.detect_batch,
+                                                          [frame for frame, _ in batch])
+            except Exception as e:
+                print(f"Error procesando lote: {e}")
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue  # El cliente se desconectó
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result + (len(batch),))
+
+    def detect_batch(self, frames):
+        """Una pasada de la red para todo el lote; devuelve (casco, detecciones) por frame"""
+        detector = self.detector
+        results = [None] * len(frames)
+        hashes = [None] * len(frames)
+        if self.cache is not None:
+            for i, frame in enumerate(frames):
+                hashes[i] = self.cache.frame_hash(frame)
+                results[i] = self.cache.get(self.camera_id, hashes[i])
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        start = time.perf_counter()
+        if detector.net is None:
+            # Sin modelo YOLO: detección básica frame a frame, sin cajas de personas
+            for i in pending:
+                results[i] = (bool(detector.process_frame(frames[i], self.camera_id)[1]), [])
+        else:
+            outs = detector.forward_yolo([frames[i] for i in pending])
+            detector.metrics.observe("inference", self.camera_id, time.perf_counter() - start)
+            jobs = [detector.prepare_yolo(frames[i], frame_outs, self.camera_id)
+                    for i, frame_outs in zip(pending, outs)]
+            detector.classify_jobs(jobs)
+            for i, job in zip(pending, jobs):
+                _, helmet_detected = detector.complete_job(job)
+                detector.metrics.inc("processed", self.camera_id)
+                results[i] = (bool(helmet_detected), detector.job_detections(job))
+
+        if self.cache is not None:
+            cost = (time.perf_counter() - start) / len(pending)
+            for i in pending:
+                # Tamaño aproximado de un resultado JSON: base más unos 200 bytes por detección
+                self.cache.put(self.camera_id, hashes[i], results[i], cost, 256 + 200 * len(results[i][1]))
+        return results
+
+    def stats(self):
+        """Peticiones, rechazos, tamaño medio de lote, latencia p50/p99 y aciertos de caché"""
+        latencies = sorted(self.latencies)
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "queue": self.queue.qsize() if self.queue is not None else 0,
+            "in_flight": self.in_flight,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+            "mean_batch": round(sum(self.batch_sizes) / len(self.batch_sizes), 2) if self.batch_sizes else 0.0,
+            "latency_p50_ms": percentile(latencies, 0.5),
+            "latency_p99_ms": percentile(latencies, 0.99),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def main():
+    """Función principal del servicio HTTP"""
+    parser = argparse.ArgumentParser(description="Servicio HTTP de detección de casco con micro-lotes")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección de escucha")
+    parser.add_argument("--port", type=int, default=9110, help="Puerto de escucha")
+    parser.add_argument("--max-batch", type=int, default=8, help="Peticiones máximas por pasada de la red")
+    parser.add_argument("--max-wait-ms", type=float, default=10.0,
+                        help="Espera máxima para completar un lote")
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="Peticiones pendientes antes de responder 429")
+    parser.add_argument("--model", default="yolov3", choices=sorted(MODEL_REGISTRY),
+                        help="Modelo de detección")
+    parser.add_argument("--input-size", type=int, default=416, choices=[320, 416, 608, 640],
+                        help="Tamaño de entrada de la red")
+    parser.add_argument("--head-classifier", metavar="MODELO",
+                        help="Clasificador CNN de cabezas (ONNX) en lugar de la heurística de color")
+    parser.add_argument("--model-mirror", metavar="URL",
+                        help="Espejo local de los archivos de modelo (se prueba antes que el origen)")
+    parser.add_argument("--model-cache", metavar="CARPETA",
+                        help="Caché compartida de modelos (p. ej. una carpeta de red)")
+    parser.add_argument("--offline", action="store_true",
+                        help="No usar la red: solo yolo_model/ y la caché compartida")
+    parser.add_argument("--cache-tolerance", type=int, metavar="BITS",
+                        help="Reutilizar resultados de imágenes casi idénticas (distancia de Hamming del hash)")
+    parser.add_argument("--cache-ttl", type=float, default=5.0,
+                        help="Segundos que un resultado en caché sigue siendo válido")
+    args = parser.parse_args()
+    if args.input_size not in MODEL_REGISTRY[args.model]["input_sizes"]:
+        parser.error(f"{args.model} admite tamaños de entrada {MODEL_REGISTRY[args.model]['input_sizes']}")
+
+    download_options = {"mirror_url": args.model_mirror, "shared_cache_dir": args.model_cache,
+                        "offline": args.offline}
+    download_options = {name: value for name, value in download_options.items() if value}
+    detector = HelmetDetector(model_name=args.model, input_size=args.input_size,
+                              head_classifier_path=args.head_classifier, download_options=download_options)
+    cache = None
+    if args.cache_tolerance is not None:
+        cache = ResultCache(ttl_s=args.cache_ttl, tolerance=args.cache_tolerance)
+    server = DetectionServer(detector, args.host, args.port, args.max_batch, args.max_wait_ms, args.max_queue,
+                             cache=cache)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print(f"\n📊 {json.dumps(server.stats(), ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,13 @@
+"""Fixtures compartidas por las pruebas"""
+
+import pytest
+
+from helmet_detector import HelmetDetector, MetricsRegistry
+
+
+@pytest.fixture
+def detector():
+    """HelmetDetector sin modelo ni logs (detección básica) y con métricas propias"""
+    detector = HelmetDetector(load_model=False)
+    detector.metrics = MetricsRegistry()
+    return detector
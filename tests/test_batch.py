@@ -0,0 +1,68 @@
+"""Pruebas de la reanudación del procesamiento por lotes"""
+
+from helmet_batch import ResultWriter, load_progress
+
+ROW = {"source": "video.mp4", "frame": 0, "timestamp_ms": 0.0, "helmet_detected": True, "processing_ms": 1.0}
+
+
+def read_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def test_resume_discards_rows_of_unconfirmed_unit(tmp_path):
+    output = str(tmp_path / "resultados.csv")
+    progress_path = output + ".progress"
+
+    writer = ResultWriter(output, "csv")
+    writer.write([ROW])
+    with open(progress_path, "w", encoding="utf-8") as progress:
+        progress.write(f"video.mp4#0-1\t{writer.size()}\n")
+        # Caída tras escribir las filas de la segunda unidad y a mitad de su línea de progreso
+        writer.write([dict(ROW, frame=1)])
+        progress.write("video.mp4#1-2\t")
+    writer.close()
+
+    done, committed = load_progress(progress_path)
+    assert done == {"video.mp4#0-1"}
+    ResultWriter(output, "csv", committed).close()
+
+    assert len(read_lines(output)) == 2  # Cabecera y la fila de la unidad confirmada
+
+
+def test_resume_without_progress_restarts_output(tmp_path):
+    output = str(tmp_path / "resultados.jsonl")
+    writer = ResultWriter(output, "jsonl")
+    writer.write([ROW])
+    writer.close()
+
+    done, committed = load_progress(output + ".progress")
+    assert done == set()
+    ResultWriter(output, "jsonl", committed).close()
+
+    assert read_lines(output) == []
+
+
+def test_legacy_progress_keeps_output(tmp_path):
+    output = str(tmp_path / "resultados.jsonl")
+    writer = ResultWriter(output, "jsonl")
+    writer.write([ROW])
+    writer.close()
+    with open(output + ".progress", "w", encoding="utf-8") as progress:
+        progress.write("video.mp4#0-1\n")
+
+    done, committed = load_progress(output + ".progress")
+    assert done == {"video.mp4#0-1"}
+    ResultWriter(output, "jsonl", committed).close()
+
+    assert len(read_lines(output)) == 1
+
+
+def test_worker_results_do_not_depend_on_speed(detector, monkeypatch):
+    import helmet_batch
+
+    monkeypatch.setattr(helmet_batch, "HelmetDetector", lambda **options: detector)
+    monkeypatch.setattr(helmet_batch, "_worker_detector", None)
+    helmet_batch.init_worker()
+
+    assert helmet_batch._worker_detector.use_motion_gate is False
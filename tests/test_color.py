@@ -0,0 +1,39 @@
+"""Pruebas del motor de colores de casco"""
+
+import numpy as np
+import cv2
+
+from helmet_detector import HelmetColorEngine, DEFAULT_HELMET_PALETTE
+
+
+def count_inrange(region, lower, upper):
+    hsv = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)
+    return cv2.countNonZero(cv2.inRange(hsv, np.array(lower), np.array(upper)))
+
+
+def test_counts_match_inrange():
+    engine = HelmetColorEngine()
+    region = np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)
+
+    counts = engine.count_colors(region)
+
+    assert counts == {name: count_inrange(region, *bounds) for name, bounds in DEFAULT_HELMET_PALETTE.items()}
+
+
+def test_yellow_helmet_detected():
+    engine = HelmetColorEngine()
+    region = np.zeros((40, 60, 3), dtype=np.uint8)
+    region[:20] = (0, 220, 240)  # Amarillo en BGR sobre la mitad de la región
+
+    assert engine.has_helmet_color(region, 0.25)
+    assert not engine.has_helmet_color(region, 0.6)
+    assert not engine.has_helmet_color(region[:0], 0.25)
+
+
+def test_hue_range_wrapping_around_red():
+    engine = HelmetColorEngine({"rojo": ([170, 100, 100], [10, 255, 255])})
+    region = np.zeros((10, 10, 3), dtype=np.uint8)
+    region[:5] = (0, 0, 255)  # Rojo puro: tono 0
+    region[5:] = (40, 0, 255)  # Rojo con algo de azul: tono cercano a 179
+
+    assert engine.count_colors(region)["rojo"] == 100
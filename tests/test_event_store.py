@@ -0,0 +1,50 @@
+"""Pruebas de la importación de logs de texto anteriores al almacén de eventos"""
+
+import os
+import json
+import shutil
+
+from helmet_detector import EventStore
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+SHIPPED_LOG = "helmet_detection_20250814.log"
+
+
+def copy_shipped_log(tmp_path):
+    """Copiar el log incluido en el repositorio (escrito en cp1252) a un directorio temporal"""
+    log_dir = tmp_path / "logs"
+    log_dir.mkdir()
+    shutil.copy(os.path.join(LOG_DIR, SHIPPED_LOG), log_dir / SHIPPED_LOG)
+    return str(log_dir)
+
+
+def test_import_shipped_cp1252_log(tmp_path):
+    log_dir = copy_shipped_log(tmp_path)
+    store = EventStore(str(tmp_path / "events"), retention_days=0)
+    try:
+        assert store.import_legacy_logs(log_dir) == 48
+        assert store.count(kind="detection") == 46
+        assert store.count(kind="detection", status="SIN_CASCO") == 23
+        assert store.count(kind="capture") == 2
+        # Una segunda importación no vuelve a leer lo ya importado
+        assert store.import_legacy_logs(log_dir) == 0
+    finally:
+        store.close()
+
+
+def test_reimport_after_unversioned_index(tmp_path):
+    log_dir = copy_shipped_log(tmp_path)
+    store = EventStore(str(tmp_path / "events"), retention_days=0)
+    try:
+        store.import_legacy_logs(log_dir)
+        # Estado de la importación anterior: solo las capturas y un índice de desplazamientos sin versión
+        for path in store.partitions():
+            with store.writer(path) as conn:
+                conn.execute("DELETE FROM events WHERE kind = 'detection'")
+        with open(tmp_path / "events" / "imported.json", "w", encoding="utf-8") as f:
+            json.dump({SHIPPED_LOG: os.path.getsize(os.path.join(log_dir, SHIPPED_LOG))}, f)
+        store.import_legacy_logs(log_dir)
+        assert store.count(kind="detection") == 46
+        assert store.count(kind="capture") == 2
+    finally:
+        store.close()
@@ -0,0 +1,35 @@
+"""Pruebas de la histéresis del estado mostrado"""
+
+from helmet_detector import StatusHysteresis
+
+
+def test_first_value_is_shown_immediately():
+    status = StatusHysteresis(frames=3)
+
+    assert status.update(True) is True
+
+
+def test_flip_needs_consecutive_frames():
+    status = StatusHysteresis(frames=3)
+    status.update(True)
+
+    assert [status.update(False) for _ in range(3)] == [True, True, False]
+    assert status.suppressed == 2
+
+
+def test_interrupted_run_restarts_count():
+    status = StatusHysteresis(frames=3)
+    status.update(True)
+
+    # Un frame con el valor estable reinicia la cuenta del candidato
+    values = [False, False, True, False, False, False]
+    assert [status.update(value) for value in values] == [True, True, True, True, True, False]
+
+
+def test_reset_forgets_state():
+    status = StatusHysteresis(frames=3)
+    status.update(True)
+    status.update(False)
+    status.reset()
+
+    assert status.update(False) is False
@@ -0,0 +1,252 @@
+"""Pruebas del descargador de modelos contra un servidor HTTP local"""
+
+import os
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from helmet_detector import ModelDownloader, ModelCache, DownloadError
+
+CONTENT = bytes(range(256)) * 400  # 100 KB de datos de modelo
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class ModelServer:
+    """Servidor local con soporte de Range; las rutas /broken/ responden 500"""
+
+    def __init__(self):
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.respond(head=True)
+
+            def do_GET(self):
+                self.respond(head=False)
+
+            def respond(self, head):
+                server.requests.append((self.command, self.path, self.headers.get("Range")))
+                if self.path.startswith("/broken/"):
+                    self.send_error(500)
+                    return
+                start = 0
+                range_header = self.headers.get("Range")
+                if range_header:
+                    start = int(range_header.split("=")[1].split("-")[0])
+                    if start >= len(CONTENT):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(CONTENT)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(len(CONTENT) - start))
+                self.end_headers()
+                if not head:
+                    self.wfile.write(CONTENT[start:])
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    model_server = ModelServer()
+    yield model_server
+    model_server.close()
+
+
+def make_downloader(tmp_path, **options):
+    options.setdefault("retries", 1)
+    options.setdefault("timeout", (2, 5))
+    return ModelDownloader(model_dir=str(tmp_path / "models"), model_cache=ModelCache(str(tmp_path / "cache")),
+                           **options)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_resume_with_range(tmp_path, server):
+    downloader = make_downloader(tmp_path, checksums={"model.bin": SHA256})
+    os.makedirs(downloader.model_dir)
+    target = os.path.join(downloader.model_dir, "model.bin")
+    with open(target + ".part", "wb") as f:
+        f.write(CONTENT[:30000])
+
+    downloader.ensure_file("model.bin", f"{server.url}/model.bin")
+
+    assert read(target) == CONTENT
+    assert ("GET", "/model.bin", "bytes=30000-") in server.requests
+    assert not os.path.exists(target + ".part")
+
+
+@pytest.mark.parametrize("extra", [0, 5000])
+def test_416_without_checksum_restarts(tmp_path, server, extra):
+    downloader = make_downloader(tmp_path)
+    os.makedirs(downloader.model_dir)
+    target = os.path.join(downloader.model_dir, "model.bin")
+    # Temporal completo o sobredimensionado (p. ej. de otra versión del archivo)
+    with open(target + ".part", "wb") as f:
+        f.write(b"x" * (len(CONTENT) + extra))
+
+    downloader.ensure_file("model.bin", f"{server.url}/model.bin")
+
+    assert read(target) == CONTENT
+    assert ("GET", "/model.bin", None) in server.requests
+
+
+def test_checksum_mismatch_is_rejected(tmp_path, server):
+    downloader = make_downloader(tmp_path, checksums={"model.bin": "0" * 64})
+
+    with pytest.raises(DownloadError):
+        downloader.ensure_file("model.bin", f"{server.url}/model.bin")
+
+    target = os.path.join(downloader.model_dir, "model.bin")
+    assert not os.path.exists(target)
+    assert not os.path.exists(target + ".part")
+
+
+def test_mirror_is_preferred_over_origin(tmp_path, server):
+    downloader = make_downloader(tmp_path, mirror_url=f"{server.url}/mirror", checksums={"model.bin": SHA256})
+
+    downloader.ensure_file("model.bin", "http://127.0.0.1:9/unreachable/model.bin")
+
+    assert read(os.path.join(downloader.model_dir, "model.bin")) == CONTENT
+    assert server.requests[0][1] == "/mirror/model.bin"
+
+
+def test_origin_used_when_mirror_fails(tmp_path, server):
+    downloader = make_downloader(tmp_path, mirror_url=f"{server.url}/broken", checksums={"model.bin": SHA256})
+
+    downloader.ensure_file("model.bin", f"{server.url}/model.bin")
+
+    assert read(os.path.join(downloader.model_dir, "model.bin")) == CONTENT
+    assert [path for _, path, _ in server.requests] == ["/broken/model.bin", "/model.bin"]
+
+
+def test_shared_cache_before_unverified_legacy_file(tmp_path, server):
+    shared = tmp_path / "shared"
+    seeder = make_downloader(tmp_path / "seed", shared_cache_dir=str(shared))
+    seeder.ensure_file("model.bin", f"{server.url}/model.bin")
+    server.requests.clear()
+
+    # Copia local truncada sin checksum y sin red: debe ganar la caché compartida verificada
+    downloader = make_downloader(tmp_path, shared_cache_dir=str(shared))
+    os.makedirs(downloader.model_dir)
+    target = os.path.join(downloader.model_dir, "model.bin")
+    with open(target, "wb") as f:
+        f.write(CONTENT[:1000])
+
+    downloader.ensure_file("model.bin", "http://127.0.0.1:9/unreachable/model.bin")
+
+    assert read(target) == CONTENT
+    assert server.requests == []
+
+
+# Red darknet mínima: una convolución 1x1 de 2 filtros con batch norm -> 2 * 4 + 2 * 3 = 14 parámetros
+TINY_CFG = "[net]\nchannels=3\n\n[convolutional]\nbatch_normalize=1\nfilters=2\nsize=1\n"
+TINY_WEIGHTS = (0).to_bytes(4, "little") + (2).to_bytes(4, "little") + bytes(12) + bytes(14 * 4)
+
+
+def make_darknet_downloader(tmp_path, **options):
+    downloader = make_downloader(tmp_path, weight_configs={"tiny.weights": "tiny.cfg"}, **options)
+    os.makedirs(downloader.model_dir)
+    with open(os.path.join(downloader.model_dir, "tiny.cfg"), "w", encoding="utf-8") as f:
+        f.write(TINY_CFG)
+    return downloader
+
+
+def test_darknet_weights_size_from_shipped_cfg():
+    from helmet_detector import darknet_weight_count
+
+    # Tamaño publicado de yolov3.weights: cabecera de 20 bytes + 62001757 float32
+    assert 20 + 4 * darknet_weight_count("yolo_model/yolov3.cfg") == 248007048
+
+
+def test_truncated_weights_rejected_offline(tmp_path):
+    downloader = make_darknet_downloader(tmp_path)
+    target = os.path.join(downloader.model_dir, "tiny.weights")
+    with open(target, "wb") as f:
+        f.write(b"<!DOCTYPE html>" + bytes(100))
+
+    with pytest.raises(DownloadError):
+        downloader.ensure_file("tiny.weights", "http://127.0.0.1:9/unreachable/tiny.weights")
+
+
+def test_plain_shared_cache_copy_validated_by_cfg(tmp_path):
+    shared = tmp_path / "shared"
+    os.makedirs(shared)
+    # Copiada a mano: sin archivo .sha256 junto a los pesos
+    with open(shared / "tiny.weights", "wb") as f:
+        f.write(TINY_WEIGHTS)
+    downloader = make_darknet_downloader(tmp_path, shared_cache_dir=str(shared))
+
+    downloader.ensure_file("tiny.weights", "http://127.0.0.1:9/unreachable/tiny.weights")
+
+    assert read(os.path.join(downloader.model_dir, "tiny.weights")) == TINY_WEIGHTS
+
+
+def test_caller_checksums_merged_over_registry(tmp_path):
+    from helmet_detector import HelmetDetector, COCO_NAMES_SHA256, MODEL_REGISTRY
+
+    detector = HelmetDetector(model_cache_dir=str(tmp_path), load_model=False,
+                              download_options={"checksums": {"yolov3.weights": SHA256}})
+
+    checksums = detector.downloader.checksums
+    assert checksums["yolov3.weights"] == SHA256
+    assert checksums["yolov3.cfg"] == MODEL_REGISTRY["yolov3"]["sha256"]["yolov3.cfg"]
+    assert checksums["coco.names"] == COCO_NAMES_SHA256
+
+
+def test_unreachable_host_is_not_retried(tmp_path, monkeypatch):
+    import helmet_detector
+
+    sleeps = []
+    monkeypatch.setattr(helmet_detector.time, "sleep", sleeps.append)
+    downloader = make_downloader(tmp_path, retries=3)
+
+    with pytest.raises(DownloadError):
+        downloader.ensure_file("model.bin", "http://127.0.0.1:9/unreachable/model.bin")
+
+    assert sleeps == []
+
+
+def test_offline_mode_skips_network(tmp_path, server):
+    downloader = make_downloader(tmp_path, offline=True, checksums={"model.bin": SHA256})
+
+    with pytest.raises(DownloadError):
+        downloader.ensure_file("model.bin", f"{server.url}/model.bin")
+
+    assert server.requests == []
+
+
+def test_manifest_invalidated_when_class_names_change(tmp_path):
+    cache = ModelCache(str(tmp_path / "cache"))
+    paths = [str(tmp_path / name) for name in ("model.weights", "model.cfg", "coco.names")]
+    for path, data in zip(paths, (CONTENT, b"[net]\n", b"person\n")):
+        with open(path, "wb") as f:
+            f.write(data)
+    cache.store("modelo", paths, {"output_layers": ["yolo"], "classes": ["person"]})
+    assert cache.lookup("modelo", paths)["classes"] == ["person"]
+
+    with open(paths[2], "wb") as f:
+        f.write(b"persona\n")
+
+    assert cache.lookup("modelo", paths) is None
@@ -0,0 +1,47 @@
+"""Pruebas de la compuerta de movimiento"""
+
+import numpy as np
+
+from helmet_detector import MotionGate
+
+
+def scene():
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    frame[60:180, 80:240] = (30, 160, 220)
+    return frame
+
+
+def run_once(gate, frame):
+    """Evaluar un frame y, si se infiere, guardar un resultado como el detector"""
+    run = gate.should_run(frame)
+    if run:
+        gate.last_result = ((), False)
+    return run
+
+
+def test_static_scene_is_skipped():
+    gate = MotionGate(heartbeat_s=60.0)
+    frame = scene()
+
+    assert [run_once(gate, frame) for _ in range(5)] == [True, False, False, False, False]
+    assert gate.stats()["skipped"] == 4
+
+
+def test_moving_object_runs_inference():
+    gate = MotionGate(heartbeat_s=60.0)
+    frame = scene()
+    assert run_once(gate, frame)
+    assert not run_once(gate, frame)
+
+    moved = frame.copy()
+    moved[100:200, 200:300] = (255, 255, 255)  # Un objeto entra en escena
+    assert run_once(gate, moved)
+    # La referencia pasa a ser el último frame inferido
+    assert not run_once(gate, moved.copy())
+
+
+def test_heartbeat_forces_inference():
+    gate = MotionGate(heartbeat_s=0.0)
+    frame = scene()
+
+    assert all(run_once(gate, frame) for _ in range(3))
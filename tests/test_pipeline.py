@@ -0,0 +1,36 @@
+"""Pruebas de las colas y la planificación del pipeline"""
+
+import threading
+
+from helmet_detector import DropOldestQueue
+
+
+def test_drop_oldest_keeps_newest_items():
+    dropped = []
+    queue = DropOldestQueue(2, dropped.append)
+
+    for item in range(5):
+        queue.put(item)
+
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == [3, 4]
+    assert dropped == [0, 1, 2]
+    assert queue.stats() == {"depth": 0, "maxsize": 2, "put": 5, "dropped": 3}
+
+
+def test_get_times_out_when_empty():
+    queue = DropOldestQueue(1)
+
+    assert queue.get(timeout=0.01) is None
+
+
+def test_close_wakes_blocked_consumer():
+    queue = DropOldestQueue(1)
+    results = []
+    consumer = threading.Thread(target=lambda: results.append(queue.get()))
+    consumer.start()
+
+    queue.close()
+    consumer.join(timeout=1.0)
+
+    assert not consumer.is_alive()
+    assert results == [None]
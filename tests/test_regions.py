@@ -0,0 +1,35 @@
+"""Pruebas del ROI y las zonas excluidas por cámara"""
+
+from helmet_detector import CameraRegions
+
+WIDTH, HEIGHT = 200, 100
+
+
+def test_without_roi_everything_counts():
+    regions = CameraRegions()
+
+    assert regions.contains([[0, 0, 10, 10], [180, 80, 20, 20]], WIDTH, HEIGHT).tolist() == [True, True]
+
+
+def test_roi_and_exclusion_filter_by_box_center():
+    # ROI en la mitad izquierda con una zona excluida en su esquina superior
+    regions = CameraRegions(roi=[[0, 0], [0.5, 0], [0.5, 1], [0, 1]],
+                            exclusions=[[[0, 0], [0.25, 0], [0.25, 0.5], [0, 0.5]]])
+    boxes = [
+        [60, 60, 20, 20],   # Centro (70, 70): dentro del ROI
+        [10, 10, 20, 20],   # Centro (20, 20): en la zona excluida
+        [140, 40, 20, 20],  # Centro (150, 50): fuera del ROI
+        [90, -20, 20, 240],  # Caja que sale del frame con centro (100, 100): se recorta al borde
+    ]
+
+    assert regions.contains(boxes, WIDTH, HEIGHT).tolist() == [True, False, False, True]
+
+
+def test_layout_crop_has_margin_and_is_cached():
+    regions = CameraRegions(roi=[[0.25, 0.25], [0.75, 0.25], [0.75, 0.75], [0.25, 0.75]], margin=0.1)
+
+    crop, mask, _ = regions.layout(WIDTH, HEIGHT)
+
+    assert crop == (30, 15, 171, 86)
+    assert mask.shape == (HEIGHT, WIDTH)
+    assert regions.layout(WIDTH, HEIGHT)[1] is mask
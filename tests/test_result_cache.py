@@ -0,0 +1,55 @@
+"""Pruebas de la caché de resultados por hash perceptual"""
+
+import numpy as np
+
+from helmet_detector import ResultCache, MetricsRegistry
+
+
+def make_cache(**options):
+    return ResultCache(metrics=MetricsRegistry(), **options)
+
+
+def test_hamming_tolerance():
+    cache = make_cache(tolerance=2)
+    cache.put("cam", 0b1111, "resultado")
+
+    assert cache.get("cam", 0b1111) == "resultado"
+    assert cache.get("cam", 0b1100) == "resultado"  # Distancia 2
+    assert cache.get("cam", 0b1000) is None  # Distancia 3
+    assert cache.get("otra", 0b1111) is None  # Cada cámara tiene sus propias entradas
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_similar_frames_share_hash():
+    cache = make_cache()
+    frame = np.tile(np.arange(0, 256, 4, dtype=np.uint8), (48, 1))
+    noisy = np.clip(frame.astype(np.int16) + np.random.default_rng(0).integers(-2, 3, frame.shape), 0, 255)
+
+    distance = bin(cache.frame_hash(frame) ^ cache.frame_hash(noisy.astype(np.uint8))).count("1")
+
+    assert distance <= cache.tolerance
+    assert cache.frame_hash(frame) != cache.frame_hash(frame[:, ::-1].copy())
+
+
+def test_expired_entry_is_removed():
+    cache = make_cache(ttl_s=5.0)
+    cache.put("cam", 1, "resultado", nbytes=10)
+    cache.entries[("cam", 1)][1] -= 6.0  # Creada hace 6 s
+
+    assert cache.get("cam", 1) is None
+    assert not cache.entries and cache.bytes == 0 and not cache.hashes
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = make_cache(max_entries=2, max_bytes=100, tolerance=0)
+    cache.put("cam", 1, "a", nbytes=10)
+    cache.put("cam", 2, "b", nbytes=10)
+    cache.get("cam", 1)  # 1 pasa a ser la más reciente
+    cache.put("cam", 3, "c", nbytes=10)
+
+    assert [cache.get("cam", h) for h in (1, 2, 3)] == ["a", None, "c"]
+
+    cache.put("cam", 4, "d", nbytes=95)
+    assert list(cache.entries) == [("cam", 4)] and cache.bytes == 95
+    cache.put("cam", 5, "e", nbytes=101)  # Más grande que la caché: no se guarda
+    assert cache.get("cam", 5) is None
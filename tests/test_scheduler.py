@@ -0,0 +1,42 @@
+"""Pruebas del planificador de frames"""
+
+import pytest
+
+from helmet_detector import FrameScheduler
+
+CAPTURE_INTERVAL = 1.0 / 30.0
+
+
+def schedule(scheduler, frames=12):
+    """Capturar frames a 30 FPS y devolver cuáles se envían a inferencia"""
+    start = scheduler.last_capture_time or 0.0
+    return [scheduler.should_process(start + (index + 1) * CAPTURE_INTERVAL) for index in range(frames)]
+
+
+def test_max_throughput_never_skips():
+    scheduler = FrameScheduler("max_throughput")
+    scheduler.record_inference(200.0)
+
+    assert all(schedule(scheduler))
+
+
+def test_fixed_fps_halves_30_fps_capture():
+    scheduler = FrameScheduler("fixed_fps", target_fps=15.0)
+
+    assert schedule(scheduler, 6) == [False, True] * 3
+    assert scheduler.skip_interval == 1
+
+
+def test_lowest_latency_follows_inference_time():
+    scheduler = FrameScheduler("lowest_latency")
+    assert all(schedule(scheduler, 4))
+
+    # 90 ms de inferencia con capturas cada 33 ms: uno de cada tres frames
+    scheduler.record_inference(90.0)
+    assert schedule(scheduler, 9) == [False, False, True] * 3
+    assert scheduler.skip_interval == 2
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        FrameScheduler("turbo")
@@ -0,0 +1,59 @@
+"""Pruebas del servicio HTTP de detección"""
+
+import time
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from helmet_server import DetectionServer
+
+
+@pytest.fixture
+def server(detector):
+    detection_server = DetectionServer(detector=detector, port=0).start()
+    yield detection_server
+    detection_server.stop()
+
+
+def request(server, raw):
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        sock.sendall(raw)
+        response = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return response
+            response += chunk
+
+
+@pytest.mark.parametrize("length", ["abc", "-5", "1e3", "²"])
+def test_invalid_content_length_is_rejected(server, length):
+    response = request(server, f"POST /detect HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("utf-8"))
+
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+
+
+def test_health_without_body(server):
+    response = request(server, b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+
+    assert response.startswith(b"HTTP/1.1 200 ")
+
+
+def test_backpressure_counts_requests_being_decoded(detector):
+    detect = detector.process_frame
+    # Red lenta: todas las peticiones llegan antes de que termine el primer lote
+    detector.process_frame = lambda frame, camera_id="default": time.sleep(0.3) or detect(frame, camera_id)
+    detection_server = DetectionServer(detector=detector, port=0, max_batch=1, max_queue=2).start()
+    body = bytes(32 * 32 * 3)
+    raw = (b"POST /detect HTTP/1.1\r\nConnection: close\r\nContent-Type: application/octet-stream\r\n"
+           b"X-Frame-Width: 32\r\nX-Frame-Height: 32\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+    try:
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            responses = list(executor.map(lambda _: request(detection_server, raw), range(6)))
+    finally:
+        detection_server.stop()
+
+    statuses = sorted(response.split(b" ")[1] for response in responses)
+    assert statuses == [b"200", b"200", b"429", b"429", b"429", b"429"]
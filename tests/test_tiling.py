@@ -0,0 +1,60 @@
+"""Pruebas del modo alta resolución por mosaicos"""
+
+import numpy as np
+
+SQUARE = (700, 300, 60, 60)  # Objeto blanco (x, y, w, h) en el frame completo
+
+
+def fake_forward(frames, size=None):
+    """Red falsa: devuelve la caja de los píxeles blancos de cada mosaico, relativa a la entrada"""
+    outs = []
+    for image in frames:
+        row = np.zeros((1, 85), dtype=np.float32)
+        ys, xs = np.nonzero(image.min(axis=2) > 200)
+        if len(xs):
+            side = image.shape[0]
+            x0, x1, y0, y1 = xs.min(), xs.max() + 1, ys.min(), ys.max() + 1
+            row[0, :4] = ((x0 + x1) / 2 / side, (y0 + y1) / 2 / side, (x1 - x0) / side, (y1 - y0) / side)
+            row[0, 4:6] = 1.0
+        outs.append([row])
+    return outs
+
+
+def test_tiles_cover_frame_with_overlap(detector):
+    width, height = 2000, 1000
+    size = detector.tile_size
+
+    tiles = detector.tile_grid(width, height)
+
+    # El primer mosaico es el frame completo; el resto son cuadrados de tile_size dentro del frame
+    assert tiles[0] == (0, 0, width, height)
+    covered = np.zeros((height, width), dtype=np.uint8)
+    for x, y, w, h in tiles[1:]:
+        assert (w, h) == (size, size)
+        assert 0 <= x and x + w <= width and 0 <= y and y + h <= height
+        covered[y:y + h, x:x + w] += 1
+    assert covered.min() >= 1
+    # Mosaicos vecinos se solapan para no partir a una persona en el borde
+    assert covered.max() > 1
+    assert detector.tile_grid(width, height) is tiles
+
+
+def test_small_frame_uses_single_tile(detector):
+    assert detector.tile_grid(640, 480) == [(0, 0, 640, 480), (0, 0, 640, 480)]
+
+
+def test_tile_detections_map_back_to_frame(detector):
+    detector.target_class_ids = np.array([0], dtype=np.int64)
+    detector.forward_yolo = fake_forward
+    frame = np.zeros((1000, 2000, 3), dtype=np.uint8)
+    x, y, w, h = SQUARE
+    frame[y:y + h, x:x + w] = 255
+
+    boxes, confidences, class_ids, tiles = detector.tiled_detections(frame)
+
+    # El objeto cae por completo en el mosaico global y en cuatro de la rejilla
+    assert tiles == len(detector.tile_grid(2000, 1000))
+    assert len(boxes) == 5
+    # Todas las cajas vuelven a la posición del objeto (con el error del escalado del mosaico global)
+    assert np.abs(boxes - np.array(SQUARE)).max() <= 6
+    assert class_ids.tolist() == [0] * 5
@@ -0,0 +1,75 @@
+"""Pruebas del conteo de infracciones por persona seguida"""
+
+import time
+
+import numpy as np
+
+from helmet_detector import HelmetTracker
+
+
+class FixedClassifier:
+    """Clasificador de cabezas que devuelve el veredicto indicado"""
+
+    def __init__(self, helmet):
+        self.helmet = helmet
+
+    def classify(self, regions):
+        return [self.helmet] * len(regions)
+
+
+def configure(detector, helmet=False):
+    detector.use_motion_gate = False
+    detector.head_classifier = FixedClassifier(helmet)
+    # Reclasificar en cada frame para que cada frame sea un voto
+    detector.trackers["default"] = HelmetTracker(refresh_interval=1)
+    return detector
+
+
+def run_frame(detector, boxes):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    boxes = np.array(boxes, dtype=np.int32).reshape(-1, 4)
+    job = detector.prepare_classification(frame, boxes, camera_id="default", tracking=True,
+                                          start=time.perf_counter())
+    detector.classify_jobs([job])
+    detector.complete_job(job)
+    return detector.take_violations("default")
+
+
+def test_empty_scene_counts_no_violation(detector):
+    configure(detector)
+
+    assert run_frame(detector, []) == 0
+
+
+def test_person_without_helmet_counts_once(detector):
+    configure(detector)
+    box = [100, 40, 60, 150]
+
+    # Hacen falta min_votes votos antes de contar
+    assert [run_frame(detector, [box]) for _ in range(5)] == [0, 0, 1, 0, 0]
+    second = [220, 40, 60, 150]
+    assert [run_frame(detector, [box, second]) for _ in range(3)] == [0, 0, 1]
+
+
+def test_single_misclassification_is_not_counted(detector):
+    configure(detector)
+    box = [100, 40, 60, 150]
+
+    assert run_frame(detector, [box]) == 0
+    detector.head_classifier.helmet = True
+    assert sum(run_frame(detector, [box]) for _ in range(10)) == 0
+
+
+def test_violation_counts_again_after_helmet_vote(detector):
+    configure(detector)
+    box = [100, 40, 60, 150]
+    track_helmet = lambda: detector.trackers["default"].tracks[0].helmet
+
+    assert sum(run_frame(detector, [box]) for _ in range(3)) == 1
+    # La votación vuelve a casco y después a sin casco: es una infracción nueva
+    detector.head_classifier.helmet = True
+    while not track_helmet():
+        assert run_frame(detector, [box]) == 0
+    detector.head_classifier.helmet = False
+    counts = [run_frame(detector, [box]) for _ in range(10)]
+    assert sum(counts) == 1